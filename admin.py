@@ -2,12 +2,76 @@
 Configuración del administrador de Django para la aplicación de formularios.
 Define cómo se muestran y gestionan los formularios en el panel de administración.
 """
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q, Sum
+from django.utils.functional import cached_property
 from .models import (
     Accidente, VehiculoInvolucrado, Fallecido, Agente, ZAT, Barrio, 
     CentroPobladoVereda, HipotesisConductor, HipotesisVehiculo, 
-    HipotesisVia, HipotesisPeaton
+    HipotesisVia, HipotesisPeaton, HipotesisPasajero, ResumenDiarioAccidentes, InconsistenciaAccidente
 )
+from . import reportes, servicios
+
+# Por debajo de este número de filas se usa el COUNT(*) exacto
+MIN_FILAS_ESTIMADAS = 10000
+
+
+def conteo_estimado(modelo):
+    """
+    Retorna el número aproximado de filas de la tabla del modelo sin recorrerla,
+    o None si no hay una estimación disponible. Para accidentes se usa el
+    resumen diario; en PostgreSQL las estadísticas de pg_class y en SQLite las
+    de sqlite_stat1 (generadas por ANALYZE).
+    """
+    if modelo is Accidente:
+        return ResumenDiarioAccidentes.objects.aggregate(total=Sum('total_accidentes'))['total'] or 0
+
+    tabla = modelo._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [tabla])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [tabla])
+        else:
+            return None
+        fila = cursor.fetchone()
+    if not fila or fila[0] is None:
+        return None
+    try:
+        return int(str(fila[0]).split()[0])
+    except ValueError:
+        return None
+
+
+class PaginadorEstimado(Paginator):
+    """
+    Paginador que, para la lista sin filtros, usa un conteo estimado en lugar
+    de un COUNT(*) sobre toda la tabla. Con filtros el conteo es exacto.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimado = conteo_estimado(queryset.model)
+            if estimado is not None and estimado >= MIN_FILAS_ESTIMADAS:
+                return estimado
+        return super().count
+
+
+class ReasignarAgenteForm(ActionForm):
+    """
+    Formulario de acciones del listado de accidentes, con el agente que se
+    asigna en la acción de reasignación.
+    """
+    agente = forms.ModelChoiceField(queryset=Agente.objects.all(), required=False, label='Agente')
+
 
 class VehiculoInvolucradoInline(admin.TabularInline):
     """
@@ -31,8 +95,20 @@ class AccidenteAdmin(admin.ModelAdmin):
     list_display = ('numero_ipat', 'fecha_accidente', 'hora_accidente', 'agente_responsable', 
                     'area', 'clase_accidente', 'total_vehiculos_involucrados')
     list_filter = ('fecha_accidente', 'area', 'clase_accidente', 'con_heridos', 'con_muertos')
+    list_select_related = ('agente_responsable',)
     search_fields = ('numero_ipat', 'agente_responsable__nombre')
     date_hierarchy = 'fecha_accidente'
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    action_form = ReasignarAgenteForm
+    actions = ['reasignar_agente', 'exportar_seleccion']
+    autocomplete_fields = (
+        'agente_responsable', 'zat', 'barrio', 'centro_poblado_vereda',
+        'hipotesis_conductor1', 'hipotesis_conductor2', 'hipotesis_conductor3', 'hipotesis_conductor4',
+        'hipotesis_vehiculo1', 'hipotesis_vehiculo2', 'hipotesis_via1', 'hipotesis_via2',
+        'hipotesis_peaton1', 'hipotesis_peaton2', 'hipotesis_pasajero1', 'hipotesis_pasajero2',
+    )
+    raw_id_fields = ('usuario',)
     inlines = [VehiculoInvolucradoInline]
     fieldsets = (
         ('Información Básica', {
@@ -53,13 +129,33 @@ class AccidenteAdmin(admin.ModelAdmin):
         ('Hipótesis', {
             'fields': ('hipotesis_conductor1', 'hipotesis_conductor2', 'hipotesis_conductor3', 'hipotesis_conductor4',
                       'hipotesis_vehiculo1', 'hipotesis_vehiculo2', 'hipotesis_via1', 'hipotesis_via2',
-                      'hipotesis_peaton1', 'hipotesis_peaton2')
+                      'hipotesis_peaton1', 'hipotesis_peaton2', 'hipotesis_pasajero1', 'hipotesis_pasajero2')
         }),
         ('Información Adicional', {
             'fields': ('remitido_a', 'croquis_pdf')
         }),
     )
 
+    @admin.action(description='Reasignar agente responsable')
+    def reasignar_agente(self, request, queryset):
+        """Asigna el agente elegido a los accidentes seleccionados con un solo UPDATE."""
+        agente = None
+        formulario = self.action_form(request.POST)
+        if formulario.is_valid():
+            agente = formulario.cleaned_data['agente']
+        if agente is None:
+            self.message_user(request, 'Seleccione el agente que desea asignar.', messages.WARNING)
+            return
+        actualizados = servicios.reasignar_agente(queryset, agente)
+        self.message_user(request, f'{actualizados} accidentes reasignados a {agente}.', messages.SUCCESS)
+
+    @admin.action(description='Exportar selección a Excel')
+    def exportar_seleccion(self, request, queryset):
+        """Descarga los accidentes seleccionados con el mismo formato del reporte."""
+        return reportes.respuesta_excel_streaming(
+            reportes.obtener_accidentes(Q(pk__in=queryset.order_by().values('pk')))
+        )
+
 @admin.register(VehiculoInvolucrado)
 class VehiculoInvolucradoAdmin(admin.ModelAdmin):
     """
@@ -67,15 +163,56 @@ class VehiculoInvolucradoAdmin(admin.ModelAdmin):
     """
     list_display = ('accidente', 'clase_vehiculo', 'tipo_servicio', 'numero_heridos', 'numero_fallecidos')
     list_filter = ('clase_vehiculo', 'tipo_servicio', 'embriaguez_conductor')
+    list_select_related = ('accidente',)
     search_fields = ('accidente__numero_ipat',)
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    autocomplete_fields = ('accidente',)
     inlines = [FallecidoInline]
 
-# Registrar los modelos adicionales
-admin.site.register(Agente)
-admin.site.register(ZAT)
-admin.site.register(Barrio)
-admin.site.register(CentroPobladoVereda)
-admin.site.register(HipotesisConductor)
-admin.site.register(HipotesisVehiculo)
-admin.site.register(HipotesisVia)
-admin.site.register(HipotesisPeaton)
\ No newline at end of file
+@admin.register(InconsistenciaAccidente)
+class InconsistenciaAccidenteAdmin(admin.ModelAdmin):
+    """
+    Configuración del administrador para las inconsistencias de la auditoría.
+    Son de solo lectura: se corrigen editando el accidente y se actualizan
+    con el comando auditar_accidentes.
+    """
+    list_display = ('accidente', 'regla', 'detalle', 'fecha_deteccion')
+    list_filter = ('regla',)
+    list_select_related = ('accidente',)
+    search_fields = ('accidente__numero_ipat',)
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+# Registrar los modelos adicionales, con búsqueda para los campos de autocompletado
+@admin.register(Agente, ZAT, CentroPobladoVereda)
+class CatalogoNombreAdmin(admin.ModelAdmin):
+    """
+    Configuración del administrador para los catálogos con nombre.
+    """
+    search_fields = ('nombre',)
+    ordering = ('nombre',)
+
+@admin.register(Barrio)
+class BarrioAdmin(admin.ModelAdmin):
+    """
+    Configuración del administrador para el modelo Barrio.
+    """
+    list_display = ('nombre', 'zat')
+    list_select_related = ('zat',)
+    search_fields = ('nombre', 'zat__nombre')
+    ordering = ('nombre',)
+
+@admin.register(HipotesisConductor, HipotesisVehiculo, HipotesisVia, HipotesisPeaton, HipotesisPasajero)
+class HipotesisAdmin(admin.ModelAdmin):
+    """
+    Configuración del administrador para los catálogos de hipótesis.
+    """
+    search_fields = ('descripcion',)
+    ordering = ('descripcion',)
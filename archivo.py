@@ -0,0 +1,139 @@
+"""
+Archivo de los accidentes históricos.
+Mueve los accidentes cerrados con más de ARCHIVO_ANTIGUEDAD_DIAS días, con
+sus vehículos, fallecidos y enlaces de hipótesis, a las tablas de archivo,
+que conservan los mismos ids. Las vistas, el admin y el dashboard consultan
+solo las tablas activas; los reportes y la búsqueda agregan el archivo
+cuando el rango de fechas llega hasta él.
+El traslado se hace por lotes con INSERT ... SELECT y DELETE, cada lote en
+su transacción, sin emitir señales: el resumen diario y el índice de
+búsqueda ya incluyen a los accidentes archivados y no cambian. Las
+inconsistencias de la auditoría de los accidentes archivados se descartan.
+El número de accidentes archivados se guarda en la caché y cada traslado lo
+descarta, para que la lista pueda restarlo del resumen sin un COUNT(*).
+"""
+import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import (
+    Accidente, VehiculoInvolucrado, Fallecido, AccidenteHipotesis, AccidenteArchivado, VehiculoArchivado,
+    FallecidoArchivado, AccidenteHipotesisArchivada, InconsistenciaAccidente
+)
+from . import detalle
+
+# Días desde el accidente y desde la entrega del informe para archivarlo
+ANTIGUEDAD_DIAS = getattr(settings, 'ARCHIVO_ANTIGUEDAD_DIAS', 730)
+
+# Accidentes trasladados en cada transacción
+TAMANO_LOTE = 500
+
+# Clave de caché con el número de accidentes archivados
+CLAVE_TOTAL = 'formularios:archivo:total'
+
+# (modelo activo, modelo de archivo), de la raíz a las hojas
+MODELOS = (
+    (Accidente, AccidenteArchivado),
+    (VehiculoInvolucrado, VehiculoArchivado),
+    (Fallecido, FallecidoArchivado),
+    (AccidenteHipotesis, AccidenteHipotesisArchivada),
+)
+
+
+def fecha_corte(hoy=None):
+    """Retorna la fecha antes de la cual los accidentes cerrados se archivan."""
+    hoy = hoy or timezone.localdate()
+    return hoy - datetime.timedelta(days=ANTIGUEDAD_DIAS)
+
+
+def archivables(corte):
+    """Accidentes ocurridos y con el informe entregado antes de la fecha de corte."""
+    return Accidente.objects.filter(fecha_accidente__lt=corte, fecha_real_entrega__lt=corte)
+
+
+def fecha_limite():
+    """Retorna la fecha del accidente archivado más reciente, o None si el archivo está vacío."""
+    return AccidenteArchivado.objects.aggregate(limite=Max('fecha_accidente'))['limite']
+
+
+def alcanza_archivo(desde):
+    """
+    Indica si un rango de fechas que empieza en `desde` (None si no está
+    acotado) incluye accidentes archivados.
+    """
+    limite = fecha_limite()
+    return limite is not None and (desde is None or desde <= limite)
+
+
+def total_archivados():
+    """
+    Retorna el número de accidentes archivados. El COUNT(*) sobre el archivo
+    se guarda en la caché hasta el siguiente traslado.
+    """
+    total = cache.get(CLAVE_TOTAL)
+    if total is None:
+        total = AccidenteArchivado.objects.count()
+        cache.set(CLAVE_TOTAL, total, timeout=None)
+    return total
+
+
+def _trasladar(pks, pares):
+    """
+    Copia los accidentes indicados con sus registros relacionados de la tabla
+    de origen a la de destino de cada par y luego los borra del origen.
+    """
+    nombre = connection.ops.quote_name
+    marcadores = ', '.join(['%s'] * len(pks))
+    tabla_vehiculos = nombre(pares[1][0]._meta.db_table)
+    condiciones = (
+        f'id IN ({marcadores})',
+        f'accidente_id IN ({marcadores})',
+        f'vehiculo_id IN (SELECT id FROM {tabla_vehiculos} WHERE accidente_id IN ({marcadores}))',
+        f'accidente_id IN ({marcadores})',
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        for (origen, destino), condicion in zip(pares, condiciones):
+            columnas = ', '.join(nombre(campo.column) for campo in destino._meta.concrete_fields)
+            cursor.execute(
+                f'INSERT INTO {nombre(destino._meta.db_table)} ({columnas}) '
+                f'SELECT {columnas} FROM {nombre(origen._meta.db_table)} WHERE {condicion}',
+                pks,
+            )
+        InconsistenciaAccidente.objects.filter(accidente_id__in=pks).delete()
+        # Se borra de las hojas a la raíz por las llaves foráneas
+        for (origen, _), condicion in reversed(list(zip(pares, condiciones))):
+            cursor.execute(f'DELETE FROM {nombre(origen._meta.db_table)} WHERE {condicion}', pks)
+    cache.delete(CLAVE_TOTAL)
+    detalle.invalidar_detalle(*pks)
+
+
+def archivar(corte=None, tamano_lote=TAMANO_LOTE, limite=None):
+    """
+    Traslada al archivo los accidentes archivables en lotes de tamano_lote,
+    cada uno en su transacción, hasta agotarlos o trasladar `limite`.
+    Retorna el número de accidentes archivados.
+    """
+    corte = corte or fecha_corte()
+    total = 0
+    while limite is None or total < limite:
+        cantidad = tamano_lote if limite is None else min(tamano_lote, limite - total)
+        pks = list(archivables(corte).order_by('pk').values_list('pk', flat=True)[:cantidad])
+        if not pks:
+            break
+        _trasladar(pks, MODELOS)
+        total += len(pks)
+    return total
+
+
+def restaurar(pks, tamano_lote=TAMANO_LOTE):
+    """
+    Devuelve a las tablas activas los accidentes archivados indicados, por
+    ejemplo para corregirlos. Retorna el número de accidentes restaurados.
+    """
+    pks = list(AccidenteArchivado.objects.filter(pk__in=list(pks)).order_by('pk').values_list('pk', flat=True))
+    pares = tuple((destino, origen) for origen, destino in MODELOS)
+    for inicio in range(0, len(pks), tamano_lote):
+        _trasladar(pks[inicio:inicio + tamano_lote], pares)
+    return len(pks)
@@ -0,0 +1,198 @@
+"""
+Auditoría de consistencia entre los registros de los accidentes.
+Cada regla es una condición declarativa sobre los accidentes anotados con
+agregados de sus vehículos y fallecidos (subconsultas por accidente), de
+modo que la base de datos evalúa una regla sobre toda la tabla en una sola
+consulta y solo viajan los accidentes que la incumplen. Las inconsistencias
+se guardan en InconsistenciaAccidente.
+La auditoría completa reemplaza todas las inconsistencias; la incremental
+vuelve a evaluar solo los accidentes modificados desde la anterior (ellos,
+sus vehículos o sus fallecidos) y los que ya tenían inconsistencias. Las
+eliminaciones de vehículos que no tocan el accidente solo se detectan en la
+auditoría completa. Los accidentes archivados no se auditan.
+"""
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Accidente, VehiculoInvolucrado, Fallecido, InconsistenciaAccidente
+from .exportacion import MARGEN_CAMBIOS, codificar_token
+
+# Accidentes evaluados por consulta en la auditoría incremental (filtros IN)
+TAMANO_BLOQUE = 500
+
+# Inconsistencias insertadas por sentencia
+TAMANO_INSERCION = 1000
+
+
+def _por_accidente(queryset, campo_accidente, agregado):
+    """Subconsulta con el agregado de las filas de cada accidente; 0 si no tiene filas."""
+    subconsulta = queryset.filter(**{campo_accidente: OuterRef('pk')}).order_by().values(
+        campo_accidente).annotate(valor=agregado).values('valor')
+    return Coalesce(Subquery(subconsulta, output_field=IntegerField()), Value(0))
+
+
+def _fallecidos_registrados_vehiculo():
+    """Subconsulta con el número de fallecidos registrados de cada vehículo."""
+    subconsulta = Fallecido.objects.filter(vehiculo=OuterRef('pk')).order_by().values(
+        'vehiculo').annotate(valor=Count('pk')).values('valor')
+    return Coalesce(Subquery(subconsulta, output_field=IntegerField()), Value(0))
+
+
+SI = VehiculoInvolucrado.SiNo.SI
+NO = VehiculoInvolucrado.SiNo.NO
+
+# Agregados por accidente que pueden usar las reglas
+AGREGADOS = {
+    'vehiculos_registrados': lambda: _por_accidente(
+        VehiculoInvolucrado.objects.all(), 'accidente', Count('pk')),
+    'heridos_vehiculos': lambda: _por_accidente(
+        VehiculoInvolucrado.objects.all(), 'accidente', Sum('numero_heridos')),
+    'fallecidos_vehiculos': lambda: _por_accidente(
+        VehiculoInvolucrado.objects.all(), 'accidente', Sum('numero_fallecidos')),
+    'vehiculos_grado_sin_embriaguez': lambda: _por_accidente(
+        VehiculoInvolucrado.objects.filter(embriaguez_conductor=NO, grado_embriaguez__isnull=False),
+        'accidente', Count('pk')),
+    'vehiculos_embriaguez_sin_grado': lambda: _por_accidente(
+        VehiculoInvolucrado.objects.filter(embriaguez_conductor=SI, grado_embriaguez__isnull=True),
+        'accidente', Count('pk')),
+    'vehiculos_exceso_fallecidos': lambda: _por_accidente(
+        VehiculoInvolucrado.objects.filter(numero_fallecidos__lt=_fallecidos_registrados_vehiculo()),
+        'accidente', Count('pk')),
+}
+
+
+class Regla:
+    """
+    Regla de consistencia: código, descripción, agregados que necesita,
+    condición (Q) que cumplen los accidentes inconsistentes y plantilla del
+    detalle, que puede usar los campos del accidente y los agregados.
+    """
+    def __init__(self, codigo, descripcion, agregados, condicion, detalle, campos=()):
+        self.codigo = codigo
+        self.descripcion = descripcion
+        self.agregados = agregados
+        self.condicion = condicion
+        self.detalle = detalle
+        self.campos = tuple(campos) + tuple(agregados)
+
+    def evaluar(self, accidentes):
+        """Retorna [(id del accidente, detalle)] de los accidentes del queryset que incumplen la regla."""
+        queryset = accidentes.annotate(
+            **{nombre: AGREGADOS[nombre]() for nombre in self.agregados}
+        ).filter(self.condicion).order_by().values_list('pk', *self.campos)
+        return [
+            (pk, self.detalle.format(**dict(zip(self.campos, valores)))[:255])
+            for pk, *valores in queryset.iterator()
+        ]
+
+
+REGLAS = (
+    Regla('TOTAL_VEHICULOS', 'El total de vehículos involucrados no coincide con los vehículos registrados',
+          ('vehiculos_registrados',), ~Q(total_vehiculos_involucrados=F('vehiculos_registrados')),
+          '{total_vehiculos_involucrados} declarados, {vehiculos_registrados} registrados',
+          campos=('total_vehiculos_involucrados',)),
+    Regla('MUERTOS_SIN_FALLECIDOS', 'Marcado con muertos, pero ningún vehículo reporta fallecidos',
+          ('fallecidos_vehiculos',), Q(con_muertos=True, fallecidos_vehiculos=0),
+          'Con muertos y {fallecidos_vehiculos} fallecidos en los vehículos'),
+    Regla('FALLECIDOS_SIN_MUERTOS', 'Los vehículos reportan fallecidos, pero no está marcado con muertos',
+          ('fallecidos_vehiculos',), Q(con_muertos=False, fallecidos_vehiculos__gt=0),
+          'Sin muertos y {fallecidos_vehiculos} fallecidos en los vehículos'),
+    Regla('HERIDOS_SIN_VICTIMAS', 'Marcado con heridos, pero ningún vehículo reporta heridos',
+          ('heridos_vehiculos',), Q(con_heridos=True, heridos_vehiculos=0),
+          'Con heridos y {heridos_vehiculos} heridos en los vehículos'),
+    Regla('VICTIMAS_SIN_HERIDOS', 'Los vehículos reportan heridos, pero no está marcado con heridos',
+          ('heridos_vehiculos',), Q(con_heridos=False, heridos_vehiculos__gt=0),
+          'Sin heridos y {heridos_vehiculos} heridos en los vehículos'),
+    Regla('GRADO_SIN_EMBRIAGUEZ', 'Un vehículo tiene grado de embriaguez sin embriaguez del conductor',
+          ('vehiculos_grado_sin_embriaguez',), Q(vehiculos_grado_sin_embriaguez__gt=0),
+          '{vehiculos_grado_sin_embriaguez} vehículos con grado y embriaguez NO'),
+    Regla('EMBRIAGUEZ_SIN_GRADO', 'Un vehículo tiene embriaguez del conductor sin grado de embriaguez',
+          ('vehiculos_embriaguez_sin_grado',), Q(vehiculos_embriaguez_sin_grado__gt=0),
+          '{vehiculos_embriaguez_sin_grado} vehículos con embriaguez SI y sin grado'),
+    Regla('FALLECIDOS_EXCEDEN', 'Un vehículo tiene más fallecidos registrados que su número de fallecidos',
+          ('vehiculos_exceso_fallecidos',), Q(vehiculos_exceso_fallecidos__gt=0),
+          '{vehiculos_exceso_fallecidos} vehículos con más fallecidos registrados que declarados'),
+)
+
+REGLAS_POR_CODIGO = {regla.codigo: regla for regla in REGLAS}
+
+
+def _reemplazar(accidentes, existentes, ahora, reglas):
+    """
+    Evalúa las reglas sobre el queryset de accidentes y reemplaza sus
+    inconsistencias en una transacción. Conserva la fecha de detección de las
+    que siguen y descarta las de accidentes eliminados o archivados mientras
+    se evaluaban. Retorna el número de inconsistencias guardadas.
+    """
+    with transaction.atomic():
+        fechas = dict(((accidente_id, regla), fecha) for accidente_id, regla, fecha in existentes.values_list(
+            'accidente_id', 'regla', 'fecha_deteccion'))
+        encontradas = [(pk, regla.codigo, detalle) for regla in reglas for pk, detalle in regla.evaluar(accidentes)]
+
+        # Se bloquean los accidentes que siguen existiendo para que no se borren antes del commit
+        pks = sorted({pk for pk, _, _ in encontradas})
+        vigentes = set()
+        for inicio in range(0, len(pks), TAMANO_INSERCION):
+            vigentes.update(Accidente.objects.select_for_update().filter(
+                pk__in=pks[inicio:inicio + TAMANO_INSERCION]
+            ).values_list('pk', flat=True))
+
+        nuevas = [
+            InconsistenciaAccidente(
+                accidente_id=pk, regla=codigo, detalle=detalle,
+                fecha_deteccion=fechas.get((pk, codigo), ahora),
+            )
+            for pk, codigo, detalle in encontradas
+            if pk in vigentes
+        ]
+        existentes.delete()
+        InconsistenciaAccidente.objects.bulk_create(nuevas, batch_size=TAMANO_INSERCION)
+    return len(nuevas)
+
+
+def accidentes_modificados(desde):
+    """
+    Retorna los ids de los accidentes activos modificados desde el instante
+    indicado, o con vehículos o fallecidos modificados, junto con los que ya
+    tienen inconsistencias (por si se corrigieron eliminando registros).
+    """
+    pks = set(Accidente.objects.filter(fecha_modificacion__gte=desde).values_list('pk', flat=True))
+    pks.update(VehiculoInvolucrado.objects.filter(fecha_modificacion__gte=desde).values_list(
+        'accidente_id', flat=True))
+    pks.update(Fallecido.objects.filter(fecha_modificacion__gte=desde).values_list(
+        'vehiculo__accidente_id', flat=True))
+    pks.update(InconsistenciaAccidente.objects.values_list('accidente_id', flat=True))
+    return sorted(pks)
+
+
+def auditar(desde=None, reglas=REGLAS, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Audita todos los accidentes activos, o con `desde` solo los cambiados
+    desde ese instante. Retorna (accidentes evaluados o None si fue
+    completa, inconsistencias encontradas, token de la siguiente auditoría).
+    """
+    ahora = timezone.now()
+    codigos = [regla.codigo for regla in reglas]
+    if desde is None:
+        encontradas = _reemplazar(
+            Accidente.objects.all(), InconsistenciaAccidente.objects.filter(regla__in=codigos), ahora, reglas
+        )
+        return None, encontradas, codificar_token(ahora - MARGEN_CAMBIOS)
+
+    pks = accidentes_modificados(desde)
+    encontradas = 0
+    for inicio in range(0, len(pks), tamano_bloque):
+        bloque = pks[inicio:inicio + tamano_bloque]
+        encontradas += _reemplazar(
+            Accidente.objects.filter(pk__in=bloque),
+            InconsistenciaAccidente.objects.filter(accidente_id__in=bloque, regla__in=codigos),
+            ahora, reglas,
+        )
+    return len(pks), encontradas, codificar_token(ahora - MARGEN_CAMBIOS)
+
+
+def resumen():
+    """Retorna {código de regla: número de accidentes con la inconsistencia}."""
+    conteos = dict(InconsistenciaAccidente.objects.order_by().values_list('regla').annotate(total=Count('pk')))
+    return {regla.codigo: conteos.get(regla.codigo, 0) for regla in REGLAS}
@@ -0,0 +1,221 @@
+"""
+Índice de búsqueda de texto completo para los accidentes.
+Mantiene un documento por accidente en una tabla virtual FTS5 de SQLite,
+sincronizada desde las señales de Accidente. Los accidentes archivados
+conservan su id y su documento, de modo que el mismo índice los encuentra.
+El índice encuentra las palabras que empiezan por el texto buscado, no las
+que lo contienen en medio: "234" no encuentra el IPAT "A001234". Por eso las
+búsquedas cortas (menos de MIN_CARACTERES_INDICE caracteres, típicamente el
+final de un número IPAT) conservan la búsqueda por subcadena del listado.
+"""
+import re
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+from .models import Accidente, AccidenteArchivado
+
+TABLA_BUSQUEDA = 'formularios_accidente_busqueda'
+
+# Número máximo de resultados ordenados por relevancia
+MAX_RESULTADOS = getattr(settings, 'BUSQUEDA_MAX_RESULTADOS', 500)
+
+# Las búsquedas más cortas que esto se hacen por subcadena, sin el índice
+MIN_CARACTERES_INDICE = getattr(settings, 'BUSQUEDA_MIN_CARACTERES_INDICE', 6)
+
+# Relaciones que aportan texto al documento de búsqueda
+RELACIONES_DOCUMENTO = (
+    'agente_responsable', 'zat', 'barrio', 'centro_poblado_vereda',
+    'hipotesis_conductor1', 'hipotesis_conductor2', 'hipotesis_conductor3', 'hipotesis_conductor4',
+    'hipotesis_vehiculo1', 'hipotesis_vehiculo2', 'hipotesis_via1', 'hipotesis_via2',
+    'hipotesis_peaton1', 'hipotesis_peaton2', 'hipotesis_pasajero1', 'hipotesis_pasajero2',
+)
+
+_indice_creado = False
+
+
+class ResultadosBusqueda(list):
+    """
+    Lista de los accidentes encontrados, con `truncados` en True si había más
+    de MAX_RESULTADOS y solo se retornan los primeros.
+    """
+    def __init__(self, accidentes, limite=MAX_RESULTADOS):
+        accidentes = list(accidentes)
+        super().__init__(accidentes[:limite])
+        self.truncados = len(accidentes) > limite
+
+
+def indice_disponible():
+    """El índice FTS5 solo existe cuando la base de datos es SQLite."""
+    return connection.vendor == 'sqlite'
+
+
+def asegurar_indice():
+    """Crea la tabla virtual del índice si aún no existe."""
+    global _indice_creado
+    if _indice_creado:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_BUSQUEDA} "
+            f"USING fts5(documento, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    _indice_creado = True
+
+
+def documento_accidente(accidente):
+    """
+    Retorna el texto indexado de un accidente: IPAT, agente, ubicación,
+    dirección completa y descripciones de las hipótesis.
+    """
+    partes = [accidente.numero_ipat, accidente.get_direccion_completa()]
+    for relacion in RELACIONES_DOCUMENTO:
+        objeto = getattr(accidente, relacion)
+        if objeto is not None:
+            partes.append(str(objeto))
+    return ' '.join(partes)
+
+
+def indexar_accidente(pk):
+    """Actualiza el documento de búsqueda de un accidente."""
+    if not indice_disponible():
+        return
+    asegurar_indice()
+    accidente = Accidente.objects.select_related(*RELACIONES_DOCUMENTO).filter(pk=pk).first()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA_BUSQUEDA} WHERE rowid = %s", [pk])
+        if accidente is not None:
+            cursor.execute(
+                f"INSERT INTO {TABLA_BUSQUEDA} (rowid, documento) VALUES (%s, %s)",
+                [pk, documento_accidente(accidente)],
+            )
+
+
+def indexar_accidentes(pks, tamano_bloque=500):
+    """
+    Actualiza los documentos de búsqueda de varios accidentes, leyéndolos por
+    bloques. Se usa tras las actualizaciones masivas que no emiten señales.
+    """
+    if not indice_disponible():
+        return
+    asegurar_indice()
+    pks = list(pks)
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(pks), tamano_bloque):
+            bloque = pks[inicio:inicio + tamano_bloque]
+            accidentes = Accidente.objects.select_related(*RELACIONES_DOCUMENTO).filter(pk__in=bloque)
+            cursor.executemany(f"DELETE FROM {TABLA_BUSQUEDA} WHERE rowid = %s", [(pk,) for pk in bloque])
+            cursor.executemany(
+                f"INSERT INTO {TABLA_BUSQUEDA} (rowid, documento) VALUES (%s, %s)",
+                [(accidente.pk, documento_accidente(accidente)) for accidente in accidentes],
+            )
+
+
+def eliminar_accidente(pk):
+    """Elimina el documento de búsqueda de un accidente."""
+    if not indice_disponible():
+        return
+    asegurar_indice()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA_BUSQUEDA} WHERE rowid = %s", [pk])
+
+
+def reconstruir_indice(tamano_bloque=2000):
+    """
+    Vuelve a generar el índice completo a partir de las tablas de accidentes
+    activos y archivados. Retorna el número de documentos indexados.
+    """
+    asegurar_indice()
+    total = 0
+    lote = []
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA_BUSQUEDA}")
+        for modelo in (Accidente, AccidenteArchivado):
+            accidentes = modelo.objects.select_related(*RELACIONES_DOCUMENTO).order_by()
+            for accidente in accidentes.iterator(chunk_size=tamano_bloque):
+                lote.append((accidente.pk, documento_accidente(accidente)))
+                if len(lote) >= tamano_bloque:
+                    cursor.executemany(f"INSERT INTO {TABLA_BUSQUEDA} (rowid, documento) VALUES (%s, %s)", lote)
+                    total += len(lote)
+                    lote = []
+        if lote:
+            cursor.executemany(f"INSERT INTO {TABLA_BUSQUEDA} (rowid, documento) VALUES (%s, %s)", lote)
+            total += len(lote)
+        cursor.execute(f"INSERT INTO {TABLA_BUSQUEDA} ({TABLA_BUSQUEDA}) VALUES ('optimize')")
+    return total
+
+
+def consulta_fts(texto):
+    """
+    Convierte el texto escrito por el usuario en una consulta FTS5 segura:
+    cada palabra se busca como prefijo y todas deben aparecer.
+    """
+    palabras = re.findall(r'\w+', texto)
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+def buscar_ids(texto, limite=MAX_RESULTADOS):
+    """Retorna los ids de los accidentes que coinciden, del más al menos relevante."""
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return []
+    asegurar_indice()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {TABLA_BUSQUEDA} WHERE {TABLA_BUSQUEDA} MATCH %s ORDER BY rank LIMIT %s",
+            [consulta, limite],
+        )
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def filtro_subcadena(texto):
+    """Condición de la búsqueda por subcadena en el IPAT, el agente y la ubicación."""
+    return (
+        Q(numero_ipat__icontains=texto) |
+        Q(agente_responsable__nombre__icontains=texto) |
+        Q(barrio__nombre__icontains=texto) |
+        Q(centro_poblado_vereda__nombre__icontains=texto)
+    )
+
+
+def usa_subcadena(texto):
+    """Indica si el texto se busca por subcadena en lugar de con el índice."""
+    return not indice_disponible() or len(texto.strip()) < MIN_CARACTERES_INDICE
+
+
+def buscar_accidentes(queryset, texto):
+    """
+    Filtra el queryset con el índice de búsqueda y lo ordena por relevancia.
+    Las búsquedas cortas, y todas en bases de datos distintas de SQLite, usan
+    las búsquedas icontains.
+    """
+    if usa_subcadena(texto):
+        return queryset.filter(filtro_subcadena(texto))
+
+    ids = buscar_ids(texto)
+    if not ids:
+        return queryset.none()
+    relevancia = Case(*[When(pk=pk, then=posicion) for posicion, pk in enumerate(ids)],
+                      output_field=IntegerField())
+    return queryset.filter(pk__in=ids).order_by(relevancia)
+
+
+def buscar_con_archivo(queryset, texto):
+    """
+    Retorna los ResultadosBusqueda de los accidentes que coinciden, activos
+    (del queryset) y archivados, del más al menos relevante, o del más
+    reciente al más antiguo en las búsquedas por subcadena. Los ids que no
+    están en la tabla activa se buscan en el archivo por clave primaria.
+    """
+    if usa_subcadena(texto):
+        orden = ('-fecha_accidente', '-hora_accidente', '-id')
+        activos = list(buscar_accidentes(queryset, texto).order_by(*orden)[:MAX_RESULTADOS + 1])
+        archivados = buscar_accidentes(AccidenteArchivado.objects.all(), texto).order_by(*orden)
+        return ResultadosBusqueda(activos + list(archivados[:MAX_RESULTADOS + 1 - len(activos)]))
+
+    # Se pide un id de más para saber si los resultados se truncaron
+    ids = buscar_ids(texto, MAX_RESULTADOS + 1)
+    encontrados = {accidente.pk: accidente for accidente in queryset.filter(pk__in=ids)}
+    faltantes = [pk for pk in ids if pk not in encontrados]
+    if faltantes:
+        encontrados.update((accidente.pk, accidente) for accidente in AccidenteArchivado.objects.filter(pk__in=faltantes))
+    return ResultadosBusqueda(encontrados[pk] for pk in ids if pk in encontrados)
@@ -0,0 +1,416 @@
+"""
+Matriz de características de los accidentes para el análisis y el
+entrenamiento de modelos.
+Materializa una fila por accidente, activo o archivado, en columnas tipadas
+de NumPy, un archivo .npy por columna: calendario y hora, indicadores one-hot
+de área, clase de accidente y tipo de vía, conteos de vehículos por clase y
+de conductores en embriaguez, y una marca por cada hipótesis citada.
+Un manifiesto JSON guarda el esquema, el número de filas y la marca de agua
+de la última actualización. Las actualizaciones siguientes recalculan solo
+los accidentes modificados desde entonces (ellos o sus vehículos) y marcan
+como inactivos los eliminados; si el esquema cambió (por ejemplo, una
+hipótesis nueva en los catálogos) la matriz se reconstruye.
+La matriz se abre sin copiar con cargar(), que retorna arreglos memmap de
+solo lectura:
+    columnas = cargar('/datos/caracteristicas')
+    df = pandas.DataFrame(columnas, copy=False)
+"""
+import json
+import os
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from django.utils import timezone
+from .models import (
+    Accidente, VehiculoInvolucrado, AccidenteArchivado, VehiculoArchivado, AccidenteHipotesis, RegistroEliminacion
+)
+from .exportacion import MARGEN_CAMBIOS, codificar_token, decodificar_token
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+VERSION = 1
+
+# Directorio por defecto de la matriz
+DIRECTORIO = getattr(settings, 'CARACTERISTICAS_DIRECTORIO', None)
+
+MANIFIESTO = 'manifiesto.json'
+
+# Pares (id del vehículo, id del accidente), para saber qué accidente
+# recalcular cuando se elimina un vehículo
+MAPA_VEHICULOS = 'mapa_vehiculos.npy'
+
+# Accidentes calculados por consulta en la construcción completa
+TAMANO_BLOQUE = 5000
+
+# Accidentes por consulta en la actualización incremental (filtros IN)
+TAMANO_BLOQUE_CAMBIOS = 500
+
+# Filas reservadas como mínimo en cada columna; al llenarse, la capacidad se duplica
+CAPACIDAD_MINIMA = 1024
+
+# (modelo de accidente, modelo de vehículo) de las tablas activas y de archivo
+TABLAS = ((Accidente, VehiculoInvolucrado), (AccidenteArchivado, VehiculoArchivado))
+
+# Opciones del accidente codificadas como one-hot
+OPCIONES_ACCIDENTE = {
+    'area': Accidente.Area,
+    'clase_accidente': Accidente.ClaseAccidente,
+    'tipo_via': Accidente.TipoVia,
+}
+
+INDICADORES_ACCIDENTE = ('con_heridos', 'con_muertos', 'con_danos_materiales')
+
+
+def _requerir_numpy():
+    if np is None:
+        raise ImproperlyConfigured('La matriz de características requiere el paquete numpy.')
+
+
+class Esquema:
+    """
+    Columnas de la matriz, con la columna de cada opción e hipótesis.
+    Las columnas de hipótesis salen de los catálogos vigentes.
+    """
+    def __init__(self):
+        columnas = [
+            ('id', 'int64'),
+            ('activo', 'bool'),
+            ('fecha', 'datetime64[D]'),
+            ('mes', 'int8'),
+            ('dia_semana', 'int8'),
+            ('hora', 'int8'),
+            ('total_vehiculos', 'int16'),
+        ]
+        columnas += [(campo, 'bool') for campo in INDICADORES_ACCIDENTE]
+
+        # campo -> {valor: columna}
+        self.opciones = {
+            campo: {miembro.value: f'{campo}__{miembro.name}' for miembro in opciones}
+            for campo, opciones in OPCIONES_ACCIDENTE.items()
+        }
+        for columnas_campo in self.opciones.values():
+            columnas += [(columna, 'bool') for columna in columnas_campo.values()]
+
+        columnas += [
+            ('vehiculos', 'int16'),
+            ('conductores_embriagados', 'int16'),
+            ('numero_heridos', 'int16'),
+            ('numero_fallecidos', 'int16'),
+        ]
+        self.clases_vehiculo = {
+            miembro.value: f'clase_vehiculo__{miembro.name}' for miembro in VehiculoInvolucrado.ClaseVehiculo
+        }
+        columnas += [(columna, 'int16') for columna in self.clases_vehiculo.values()]
+
+        # (categoría, id de la hipótesis) -> columna
+        self.hipotesis = {}
+        for categoria, modelo in AccidenteHipotesis.MODELOS.items():
+            for pk in modelo.objects.order_by('pk').values_list('pk', flat=True):
+                self.hipotesis[(categoria, pk)] = f'hipotesis_{categoria.lower()}__{pk}'
+        columnas += [(columna, 'bool') for columna in self.hipotesis.values()]
+
+        self.columnas = columnas
+
+    def como_json(self):
+        return [[nombre, tipo] for nombre, tipo in self.columnas]
+
+    def calcular(self, modelo_accidente, modelo_vehiculo, filtro_accidentes, filtro_vehiculos):
+        """
+        Calcula las filas de los accidentes que cumplen el filtro.
+        Retorna ({columna: arreglo}, arreglo (n, 2) de pares (vehículo, accidente)).
+        """
+        campos_hipotesis = [
+            (f'{campo}_id', categoria) for campo, (categoria, _) in AccidenteHipotesis.CAMPOS_ACCIDENTE.items()
+        ]
+        nombres = [
+            'id', 'fecha_accidente', 'hora_accidente', 'total_vehiculos_involucrados',
+            *INDICADORES_ACCIDENTE, *OPCIONES_ACCIDENTE, *(campo for campo, _ in campos_hipotesis),
+        ]
+        filas = list(modelo_accidente.objects.filter(filtro_accidentes).order_by('pk').values_list(*nombres))
+
+        valores = {nombre: np.zeros(len(filas), dtype=tipo) for nombre, tipo in self.columnas}
+        posiciones = {}
+        for i, fila in enumerate(filas):
+            datos = dict(zip(nombres, fila))
+            posiciones[datos['id']] = i
+            fecha = datos['fecha_accidente']
+            valores['id'][i] = datos['id']
+            valores['activo'][i] = True
+            valores['fecha'][i] = fecha
+            valores['mes'][i] = fecha.month
+            valores['dia_semana'][i] = fecha.weekday()
+            valores['hora'][i] = datos['hora_accidente'].hour
+            valores['total_vehiculos'][i] = datos['total_vehiculos_involucrados']
+            for campo in INDICADORES_ACCIDENTE:
+                valores[campo][i] = datos[campo]
+            for campo, columnas in self.opciones.items():
+                columna = columnas.get(datos[campo])
+                if columna:
+                    valores[columna][i] = True
+            for campo, categoria in campos_hipotesis:
+                columna = self.hipotesis.get((categoria, datos[campo]))
+                if columna:
+                    valores[columna][i] = True
+
+        vehiculos = modelo_vehiculo.objects.filter(filtro_vehiculos).order_by().values_list(
+            'id', 'accidente_id', 'clase_vehiculo', 'embriaguez_conductor', 'numero_heridos', 'numero_fallecidos'
+        )
+        pares = []
+        for pk, accidente_id, clase, embriaguez, heridos, fallecidos in vehiculos.iterator():
+            i = posiciones.get(accidente_id)
+            if i is None:
+                continue
+            pares.append((pk, accidente_id))
+            valores['vehiculos'][i] += 1
+            valores['conductores_embriagados'][i] += embriaguez == VehiculoInvolucrado.SiNo.SI
+            valores['numero_heridos'][i] += heridos
+            valores['numero_fallecidos'][i] += fallecidos
+            columna = self.clases_vehiculo.get(clase)
+            if columna:
+                valores[columna][i] += 1
+        return valores, np.array(pares, dtype=np.int64).reshape(-1, 2)
+
+
+class Matriz:
+    """
+    Columnas de la matriz abiertas como memmap para escritura, con su número
+    de filas usadas y su capacidad.
+    """
+    def __init__(self, directorio, columnas, filas, capacidad, sufijo=''):
+        self.directorio = directorio
+        self.tipos = dict(columnas)
+        self.filas = filas
+        self.capacidad = capacidad
+        self.sufijo = sufijo
+        self.columnas = {}
+
+    def ruta(self, nombre):
+        return os.path.join(self.directorio, f'{nombre}.npy{self.sufijo}')
+
+    def crear(self):
+        for nombre, tipo in self.tipos.items():
+            self.columnas[nombre] = np.lib.format.open_memmap(
+                self.ruta(nombre), mode='w+', dtype=np.dtype(tipo), shape=(self.capacidad,)
+            )
+
+    def abrir(self):
+        for nombre in self.tipos:
+            self.columnas[nombre] = np.load(self.ruta(nombre), mmap_mode='r+')
+
+    def ampliar(self, filas_nuevas):
+        """Duplica la capacidad de todas las columnas hasta que quepan las filas nuevas."""
+        capacidad = self.capacidad
+        while self.filas + filas_nuevas > capacidad:
+            capacidad *= 2
+        if capacidad == self.capacidad:
+            return
+        for nombre, tipo in self.tipos.items():
+            ruta = self.ruta(nombre)
+            ampliada = np.lib.format.open_memmap(f'{ruta}.tmp', mode='w+', dtype=np.dtype(tipo), shape=(capacidad,))
+            ampliada[:self.filas] = self.columnas[nombre][:self.filas]
+            ampliada.flush()
+            del ampliada
+            self.columnas[nombre] = None
+            os.replace(f'{ruta}.tmp', ruta)
+            self.columnas[nombre] = np.load(ruta, mmap_mode='r+')
+        self.capacidad = capacidad
+
+    def agregar(self, valores):
+        """Escribe las filas calculadas al final de la matriz."""
+        cantidad = len(valores['id'])
+        self.ampliar(cantidad)
+        for nombre, columna in self.columnas.items():
+            columna[self.filas:self.filas + cantidad] = valores[nombre]
+        self.filas += cantidad
+
+    def reemplazar(self, posiciones, valores, seleccion):
+        """Escribe en las filas `posiciones` las filas calculadas indicadas por `seleccion`."""
+        for nombre, columna in self.columnas.items():
+            columna[posiciones] = valores[nombre][seleccion]
+
+    def guardar(self):
+        for columna in self.columnas.values():
+            columna.flush()
+
+
+def _leer_manifiesto(directorio):
+    try:
+        with open(os.path.join(directorio, MANIFIESTO), encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return None
+
+
+def _escribir_manifiesto(directorio, esquema, matriz, hasta):
+    """Escribe el manifiesto de forma atómica; las lecturas ven el anterior o el nuevo."""
+    manifiesto = {
+        'version': VERSION,
+        'columnas': esquema.como_json(),
+        'filas': matriz.filas,
+        'capacidad': matriz.capacidad,
+        'token': codificar_token(hasta - MARGEN_CAMBIOS),
+        'fecha_actualizacion': hasta.isoformat(),
+    }
+    ruta = os.path.join(directorio, MANIFIESTO)
+    with open(f'{ruta}.tmp', 'w', encoding='utf-8') as archivo:
+        json.dump(manifiesto, archivo, ensure_ascii=False, indent=1)
+    os.replace(f'{ruta}.tmp', ruta)
+    return manifiesto
+
+
+def _guardar_mapa(directorio, pares):
+    """Guarda los pares (vehículo, accidente) ordenados por vehículo."""
+    pares = pares[np.argsort(pares[:, 0], kind='stable')] if len(pares) else pares
+    ruta = os.path.join(directorio, MAPA_VEHICULOS)
+    with open(f'{ruta}.tmp', 'wb') as archivo:
+        np.save(archivo, pares)
+    os.replace(f'{ruta}.tmp', ruta)
+
+
+def construir(directorio, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Construye la matriz completa desde las tablas activas y de archivo,
+    leyendo los accidentes por rangos de id. Las columnas se escriben en
+    archivos temporales que reemplazan a los anteriores al terminar.
+    Retorna el manifiesto escrito.
+    """
+    _requerir_numpy()
+    os.makedirs(directorio, exist_ok=True)
+    hasta = timezone.now()
+    esquema = Esquema()
+    total = sum(modelo.objects.count() for modelo, _ in TABLAS)
+    matriz = Matriz(directorio, esquema.columnas, 0, max(CAPACIDAD_MINIMA, total + total // 4), sufijo='.nuevo')
+    matriz.crear()
+
+    pares = []
+    for modelo_accidente, modelo_vehiculo in TABLAS:
+        ultimo = 0
+        while True:
+            pks = list(modelo_accidente.objects.filter(pk__gt=ultimo).order_by('pk').values_list(
+                'pk', flat=True)[:tamano_bloque])
+            if not pks:
+                break
+            primero, ultimo = pks[0], pks[-1]
+            valores, vehiculos = esquema.calcular(
+                modelo_accidente, modelo_vehiculo,
+                Q(pk__gte=primero, pk__lte=ultimo), Q(accidente_id__gte=primero, accidente_id__lte=ultimo),
+            )
+            matriz.agregar(valores)
+            pares.append(vehiculos)
+    matriz.guardar()
+
+    # Reemplazar las columnas anteriores y quitar las que ya no están en el esquema
+    anteriores = _leer_manifiesto(directorio)
+    for nombre in matriz.tipos:
+        os.replace(matriz.ruta(nombre), os.path.join(directorio, f'{nombre}.npy'))
+    if anteriores:
+        for nombre, _ in anteriores['columnas']:
+            if nombre not in matriz.tipos:
+                os.remove(os.path.join(directorio, f'{nombre}.npy'))
+    matriz.sufijo = ''
+    _guardar_mapa(directorio, np.concatenate(pares) if pares else np.empty((0, 2), dtype=np.int64))
+    return _escribir_manifiesto(directorio, esquema, matriz, hasta)
+
+
+def accidentes_cambiados(desde, mapa):
+    """
+    Retorna los ids de los accidentes que cambiaron desde el instante
+    indicado: modificados, con vehículos modificados o eliminados, o
+    eliminados. `mapa` resuelve el accidente de los vehículos eliminados.
+    """
+    cambiados = set()
+    for modelo_accidente, modelo_vehiculo in TABLAS:
+        cambiados.update(modelo_accidente.objects.filter(fecha_modificacion__gte=desde).values_list('pk', flat=True))
+        cambiados.update(modelo_vehiculo.objects.filter(fecha_modificacion__gte=desde).values_list(
+            'accidente_id', flat=True))
+
+    eliminados = RegistroEliminacion.objects.filter(fecha_eliminacion__gte=desde)
+    cambiados.update(eliminados.filter(tabla='accidentes').values_list('registro_id', flat=True))
+    vehiculos = np.array(list(eliminados.filter(tabla='vehiculos').values_list('registro_id', flat=True)),
+                         dtype=np.int64)
+    if len(vehiculos) and len(mapa):
+        posiciones = np.minimum(np.searchsorted(mapa[:, 0], vehiculos), len(mapa) - 1)
+        encontrados = mapa[posiciones, 0] == vehiculos
+        cambiados.update(mapa[posiciones[encontrados], 1].tolist())
+    return sorted(cambiados)
+
+
+def actualizar(directorio, tamano_bloque=TAMANO_BLOQUE_CAMBIOS):
+    """
+    Actualiza la matriz con los accidentes cambiados desde la última
+    actualización: recalcula sus filas en el lugar, agrega las de los
+    accidentes nuevos y marca como inactivas las de los eliminados. Si no
+    existe la matriz o su esquema cambió, la construye completa.
+    Retorna el manifiesto escrito.
+    """
+    _requerir_numpy()
+    manifiesto = _leer_manifiesto(directorio)
+    esquema = Esquema()
+    if manifiesto is None or manifiesto['version'] != VERSION or manifiesto['columnas'] != esquema.como_json():
+        return construir(directorio)
+
+    hasta = timezone.now()
+    matriz = Matriz(directorio, esquema.columnas, manifiesto['filas'], manifiesto['capacidad'])
+    matriz.abrir()
+    mapa = np.load(os.path.join(directorio, MAPA_VEHICULOS))
+    pendientes = accidentes_cambiados(decodificar_token(manifiesto['token']), mapa)
+
+    # Posición de cada id en la matriz, buscada sobre los ids ordenados
+    ids = np.asarray(matriz.columnas['id'][:matriz.filas])
+    orden = np.argsort(ids, kind='stable')
+    ids_ordenados = ids[orden]
+
+    def posiciones_de(buscados):
+        if not len(ids_ordenados):
+            return np.empty(0, dtype=np.int64), np.zeros(len(buscados), dtype=bool)
+        indices = np.minimum(np.searchsorted(ids_ordenados, buscados), len(ids_ordenados) - 1)
+        existen = ids_ordenados[indices] == buscados
+        return orden[indices[existen]], existen
+
+    calculados = set()
+    pares = [mapa[~np.isin(mapa[:, 1], np.array(pendientes, dtype=np.int64))]]
+    for inicio in range(0, len(pendientes), tamano_bloque):
+        bloque = pendientes[inicio:inicio + tamano_bloque]
+        for modelo_accidente, modelo_vehiculo in TABLAS:
+            faltantes = [pk for pk in bloque if pk not in calculados]
+            if not faltantes:
+                break
+            valores, vehiculos = esquema.calcular(
+                modelo_accidente, modelo_vehiculo, Q(pk__in=faltantes), Q(accidente_id__in=faltantes)
+            )
+            if not len(valores['id']):
+                continue
+            posiciones, existen = posiciones_de(valores['id'])
+            matriz.reemplazar(posiciones, valores, existen)
+            matriz.agregar({nombre: valores[nombre][~existen] for nombre in matriz.tipos})
+            calculados.update(valores['id'].tolist())
+            pares.append(vehiculos)
+
+    # Los accidentes que no están en ninguna tabla fueron eliminados
+    eliminados = np.array([pk for pk in pendientes if pk not in calculados], dtype=np.int64)
+    posiciones, _ = posiciones_de(eliminados)
+    matriz.columnas['activo'][posiciones] = False
+    matriz.guardar()
+
+    _guardar_mapa(directorio, np.concatenate(pares))
+    return _escribir_manifiesto(directorio, esquema, matriz, hasta)
+
+
+def cargar(directorio, columnas=None):
+    """
+    Retorna {columna: arreglo} con las filas de la matriz, como memmap de
+    solo lectura sobre los archivos, sin copiarlas a memoria. Las filas con
+    activo=False corresponden a accidentes eliminados.
+    """
+    _requerir_numpy()
+    manifiesto = _leer_manifiesto(directorio)
+    if manifiesto is None:
+        raise FileNotFoundError(f'No hay una matriz de características en {directorio}.')
+    nombres = columnas or [nombre for nombre, _ in manifiesto['columnas']]
+    return {
+        nombre: np.load(os.path.join(directorio, f'{nombre}.npy'), mmap_mode='r')[:manifiesto['filas']]
+        for nombre in nombres
+    }
@@ -0,0 +1,141 @@
+"""
+Caché en memoria de los catálogos de referencia del formulario de accidentes.
+Cada proceso carga un catálogo una sola vez y lo vuelve a leer solo cuando la
+versión global, guardada en el backend de caché, cambia tras una edición.
+"""
+import hashlib
+import json
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.forms import ModelChoiceField
+from .models import (
+    Agente, ZAT, Barrio, CentroPobladoVereda, HipotesisConductor, HipotesisVehiculo,
+    HipotesisVia, HipotesisPeaton, HipotesisPasajero
+)
+
+CLAVE_VERSION = 'formularios:catalogos:version'
+
+CATALOGOS = {
+    'agentes': Agente,
+    'zats': ZAT,
+    'barrios': Barrio,
+    'centros_poblados': CentroPobladoVereda,
+    'hipotesis_conductor': HipotesisConductor,
+    'hipotesis_vehiculo': HipotesisVehiculo,
+    'hipotesis_via': HipotesisVia,
+    'hipotesis_peaton': HipotesisPeaton,
+    'hipotesis_pasajero': HipotesisPasajero,
+}
+
+CATALOGO_POR_MODELO = {modelo: nombre for nombre, modelo in CATALOGOS.items()}
+
+# nombre del catálogo -> (versión, objetos)
+_catalogos = {}
+# (versión, contenido JSON, etag) del catálogo completo del formulario
+_catalogo_formulario = None
+_bloqueo = threading.Lock()
+
+
+def version_actual():
+    """
+    Retorna la versión vigente de los catálogos.
+    Si la clave no existe (caché vacía o reiniciada) se inicializa con la hora
+    actual, para no coincidir con una versión anterior ya cargada en memoria.
+    """
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, int(time.time() * 1000), timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def incrementar_version():
+    """Invalida los catálogos cargados en todos los procesos."""
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.set(CLAVE_VERSION, int(time.time() * 1000), timeout=None)
+
+
+def obtener(nombre):
+    """
+    Retorna la tupla de objetos de un catálogo, leída de memoria mientras la
+    versión no cambie.
+    """
+    version = version_actual()
+    entrada = _catalogos.get(nombre)
+    if entrada is not None and entrada[0] == version:
+        return entrada[1]
+
+    with _bloqueo:
+        entrada = _catalogos.get(nombre)
+        if entrada is None or entrada[0] != version:
+            entrada = (version, tuple(CATALOGOS[nombre].objects.all()))
+            _catalogos[nombre] = entrada
+    return entrada[1]
+
+
+def aplicar_a_formulario(form):
+    """
+    Reemplaza las opciones de los campos de catálogo del formulario por las
+    que están en memoria, para que renderizarlo no consulte la base de datos.
+    """
+    for campo in form.fields.values():
+        if not isinstance(campo, ModelChoiceField):
+            continue
+        nombre = CATALOGO_POR_MODELO.get(campo.queryset.model)
+        if nombre is None:
+            continue
+        opciones = [(obj.pk, campo.label_from_instance(obj)) for obj in obtener(nombre)]
+        if campo.empty_label is not None:
+            opciones.insert(0, ('', campo.empty_label))
+        campo.choices = opciones
+
+
+def catalogo_formulario():
+    """
+    Retorna (versión, contenido, etag) del catálogo completo del formulario:
+    ZAT con sus barrios, centros poblados e hipótesis, serializado en JSON
+    compacto. Se serializa una sola vez por versión.
+    """
+    global _catalogo_formulario
+    version = version_actual()
+    entrada = _catalogo_formulario
+    if entrada is not None and entrada[0] == version:
+        return entrada
+
+    barrios_por_zat = {}
+    for barrio in obtener('barrios'):
+        barrios_por_zat.setdefault(barrio.zat_id, []).append([barrio.pk, barrio.nombre])
+
+    datos = {
+        'version': version,
+        'zats': [
+            {'id': zat.pk, 'nombre': zat.nombre, 'barrios': barrios_por_zat.get(zat.pk, [])}
+            for zat in obtener('zats')
+        ],
+        'centros_poblados': [[centro.pk, centro.nombre] for centro in obtener('centros_poblados')],
+        'hipotesis': {
+            nombre[len('hipotesis_'):]: [[hipotesis.pk, hipotesis.descripcion] for hipotesis in obtener(nombre)]
+            for nombre in CATALOGOS if nombre.startswith('hipotesis_')
+        },
+    }
+    contenido = json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    etag = hashlib.sha256(contenido).hexdigest()[:32]
+    _catalogo_formulario = (version, contenido, etag)
+    return _catalogo_formulario
+
+
+async def acatalogo_formulario():
+    """
+    Versión asíncrona de catalogo_formulario. Si el catálogo de la versión
+    vigente ya está serializado en memoria lo retorna sin salir del bucle de
+    eventos; si no, lo arma en el hilo síncrono.
+    """
+    version = await cache.aget(CLAVE_VERSION)
+    entrada = _catalogo_formulario
+    if version is not None and entrada is not None and entrada[0] == version:
+        return entrada
+    return await sync_to_async(catalogo_formulario)()
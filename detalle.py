@@ -0,0 +1,38 @@
+"""
+Versión de la caché del detalle de cada accidente.
+La plantilla del detalle guarda el fragmento renderizado con la versión en la
+clave; las señales del accidente, sus vehículos y sus fallecidos borran la
+versión para que la siguiente visita renderice y guarde un fragmento nuevo.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+# Segundos que se conserva un fragmento del detalle en la caché
+SEGUNDOS_CACHE = getattr(settings, 'DETALLE_CACHE_SEGUNDOS', 3600)
+
+
+def clave_version(pk):
+    """Retorna la clave de caché con la versión del detalle de un accidente."""
+    return f'formularios:detalle:{pk}:version'
+
+
+def version_detalle(pk):
+    """
+    Retorna la versión vigente del detalle del accidente.
+    Si no existe se crea con la hora actual, distinta de cualquier versión
+    anterior cuyo fragmento pueda seguir en la caché.
+    """
+    clave = clave_version(pk)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, int(time.time() * 1000), timeout=None)
+        version = cache.get(clave)
+    return version
+
+
+def invalidar_detalle(*pks):
+    """Descarta los fragmentos en caché del detalle de los accidentes indicados."""
+    claves = [clave_version(pk) for pk in pks if pk]
+    if claves:
+        cache.delete_many(claves)
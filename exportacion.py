@@ -0,0 +1,304 @@
+"""
+Exportación analítica de los accidentes en tablas separadas y tipadas.
+Escribe accidentes, vehículos, fallecidos e hipótesis en Parquet (con pyarrow)
+o en CSV, leyendo cada tabla por bloques directamente del cursor de la base
+de datos. Las columnas con *_CHOICES se codifican como diccionario en Parquet.
+La exportación completa incluye las filas de las tablas de archivo. La
+exportación incremental recibe un token con la marca de agua de la
+exportación anterior y escribe solo las filas modificadas o eliminadas desde
+entonces; archivar no modifica las filas, así que no genera cambios.
+"""
+import base64
+import csv
+import datetime
+import os
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.utils import timezone
+from .models import (
+    Accidente, VehiculoInvolucrado, Fallecido, AccidenteHipotesis, RegistroEliminacion, AccidenteArchivado,
+    VehiculoArchivado, FallecidoArchivado, AccidenteHipotesisArchivada, CAMPOS_OPCIONES
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+FORMATOS = ('parquet', 'csv')
+
+# Filas leídas del cursor y escritas en cada grupo de filas o bloque de CSV
+TAMANO_BLOQUE = 50000
+
+# Retroceso de la marca de agua para incluir las transacciones que aún no
+# habían confirmado al exportar; las filas repetidas se resuelven con upsert
+MARGEN_CAMBIOS = datetime.timedelta(seconds=getattr(settings, 'EXPORTACION_MARGEN_SEGUNDOS', 300))
+
+
+def _relacion_accidente(modelo):
+    """Retorna la ruta del ORM desde el modelo hasta el accidente."""
+    if modelo is Accidente:
+        return None
+    if modelo is Fallecido:
+        return 'vehiculo__accidente'
+    return 'accidente'
+
+
+# nombre de la tabla -> (modelo, columnas adicionales {nombre: ruta del ORM})
+TABLAS = {
+    'accidentes': (Accidente, {}),
+    'vehiculos': (VehiculoInvolucrado, {}),
+    'fallecidos': (Fallecido, {'accidente_id': 'vehiculo__accidente_id'}),
+    'hipotesis': (AccidenteHipotesis, {}),
+    'eliminados': (RegistroEliminacion, {}),
+}
+
+# Tablas de datos exportadas por defecto (sin las marcas de eliminación)
+TABLAS_DATOS = ('accidentes', 'vehiculos', 'fallecidos', 'hipotesis')
+
+# Modelo de archivo de cada tabla, con las mismas columnas
+MODELOS_ARCHIVO = {
+    Accidente: AccidenteArchivado,
+    VehiculoInvolucrado: VehiculoArchivado,
+    Fallecido: FallecidoArchivado,
+    AccidenteHipotesis: AccidenteHipotesisArchivada,
+}
+
+
+class Columna:
+    """
+    Columna exportada: nombre, ruta en values_list, tipo de pyarrow y, para
+    las columnas con opciones, el diccionario de códigos. Las opciones
+    guardadas como enteros se exportan con su código de texto.
+    """
+    def __init__(self, nombre, ruta, campo):
+        self.nombre = nombre
+        self.ruta = ruta
+        self.campo = campo
+        opciones_enteras = CAMPOS_OPCIONES.get(campo.model.__name__, {}).get(campo.name)
+        self.codigos = opciones_enteras.codigos if opciones_enteras else None
+        if self.codigos is not None:
+            self.opciones = [self.codigos[valor] for valor, _ in campo.choices]
+            self._indices = {valor: i for i, (valor, _) in enumerate(campo.choices)}
+        else:
+            self.opciones = [codigo for codigo, _ in campo.choices] if campo.choices else None
+            self._indices = {codigo: i for i, codigo in enumerate(self.opciones or [])}
+
+    def tipo_arrow(self):
+        """Retorna el tipo de pyarrow que corresponde al campo del modelo."""
+        campo = self.campo
+        if self.opciones is not None:
+            return pa.dictionary(pa.int16(), pa.string())
+        if isinstance(campo, (models.ForeignKey, models.AutoField, models.BigAutoField)):
+            return pa.int64()
+        if isinstance(campo, models.BooleanField):
+            return pa.bool_()
+        if isinstance(campo, (models.PositiveSmallIntegerField, models.SmallIntegerField)):
+            return pa.int16()
+        if isinstance(campo, models.IntegerField):
+            return pa.int32()
+        if isinstance(campo, models.DateTimeField):
+            return pa.timestamp('us', tz='UTC' if settings.USE_TZ else None)
+        if isinstance(campo, models.DateField):
+            return pa.date32()
+        if isinstance(campo, models.TimeField):
+            return pa.time64('us')
+        return pa.string()
+
+    def arreglo(self, valores):
+        """Convierte los valores de un bloque en un arreglo de pyarrow."""
+        if self.opciones is None:
+            if isinstance(self.campo, models.FileField):
+                valores = [str(valor) if valor else None for valor in valores]
+            return pa.array(valores, type=self.tipo_arrow())
+
+        # Los valores fuera de las opciones (datos históricos) se agregan al final del diccionario
+        indices = []
+        for valor in valores:
+            if valor is None or valor == '':
+                indices.append(None)
+                continue
+            indice = self._indices.get(valor)
+            if indice is None:
+                indice = self._indices[valor] = len(self.opciones)
+                self.opciones.append(str(valor))
+            indices.append(indice)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(indices, type=pa.int16()), pa.array(self.opciones, type=pa.string())
+        )
+
+    def texto(self, valor):
+        """Convierte un valor al texto escrito en el CSV."""
+        if valor is None:
+            return ''
+        if self.codigos is not None:
+            return self.codigos.get(valor, str(valor))
+        if isinstance(valor, bool):
+            return '1' if valor else '0'
+        if isinstance(valor, (datetime.date, datetime.time)):
+            return valor.isoformat()
+        return str(valor)
+
+
+def columnas_de(tabla):
+    """Retorna las columnas exportadas de una tabla, en el orden del modelo."""
+    modelo, adicionales = TABLAS[tabla]
+    columnas = [Columna(campo.attname, campo.attname, campo) for campo in modelo._meta.concrete_fields]
+    for nombre, ruta in adicionales.items():
+        campo = modelo._meta.get_field(ruta.split('__')[0])
+        columnas.append(Columna(nombre, ruta, campo.related_model._meta.get_field(ruta.split('__')[1])))
+    return columnas
+
+
+def queryset_de(tabla, filtros=None, archivo=False):
+    """
+    Retorna el queryset de la tabla restringido a los accidentes que cumplen
+    los filtros (un Q sobre Accidente), ordenado por id. Con archivo=True lee
+    la tabla de archivo correspondiente.
+    """
+    modelo, _ = TABLAS[tabla]
+    relacion = _relacion_accidente(modelo)
+    modelo_accidente = Accidente
+    if archivo:
+        modelo, modelo_accidente = MODELOS_ARCHIVO[modelo], AccidenteArchivado
+    queryset = modelo.objects.order_by('pk')
+    if filtros is None or modelo is RegistroEliminacion:
+        return queryset
+    if relacion is None:
+        return queryset.filter(filtros)
+    accidentes = modelo_accidente.objects.filter(filtros).order_by().values('pk')
+    return queryset.filter(**{f'{relacion}__in': accidentes})
+
+
+def querysets_de(tabla, filtros=None):
+    """Retorna los querysets de la tabla: el activo y, si la tabla tiene archivo, el archivado."""
+    consultas = [queryset_de(tabla, filtros)]
+    if TABLAS[tabla][0] in MODELOS_ARCHIVO:
+        consultas.append(queryset_de(tabla, filtros, archivo=True))
+    return consultas
+
+
+def bloques(queryset, columnas, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Genera listas de tuplas de hasta tamano_bloque filas leídas del cursor.
+    Acepta un queryset o una lista de querysets con las mismas columnas.
+    """
+    consultas = [queryset] if isinstance(queryset, models.QuerySet) else queryset
+    bloque = []
+    for consulta in consultas:
+        filas = consulta.values_list(*[columna.ruta for columna in columnas])
+        for fila in filas.iterator(chunk_size=tamano_bloque):
+            bloque.append(fila)
+            if len(bloque) >= tamano_bloque:
+                yield bloque
+                bloque = []
+    if bloque:
+        yield bloque
+
+
+def escribir_parquet(tabla, ruta, queryset, tamano_bloque=TAMANO_BLOQUE):
+    """Escribe una tabla en Parquet, un grupo de filas por bloque. Retorna las filas escritas."""
+    if pa is None:
+        raise ImproperlyConfigured('La exportación a Parquet requiere el paquete pyarrow.')
+
+    columnas = columnas_de(tabla)
+    esquema = pa.schema([pa.field(columna.nombre, columna.tipo_arrow()) for columna in columnas])
+    total = 0
+    with pq.ParquetWriter(ruta, esquema, compression='zstd') as escritor:
+        for bloque in bloques(queryset, columnas, tamano_bloque):
+            valores = list(zip(*bloque))
+            escritor.write_table(pa.Table.from_arrays(
+                [columna.arreglo(list(valores[i])) for i, columna in enumerate(columnas)], schema=esquema
+            ))
+            total += len(bloque)
+    return total
+
+
+def escribir_csv(tabla, ruta, queryset, tamano_bloque=TAMANO_BLOQUE):
+    """Escribe una tabla en CSV UTF-8 por bloques. Retorna las filas escritas."""
+    columnas = columnas_de(tabla)
+    total = 0
+    with open(ruta, 'w', newline='', encoding='utf-8') as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow([columna.nombre for columna in columnas])
+        for bloque in bloques(queryset, columnas, tamano_bloque):
+            escritor.writerows(
+                [columna.texto(valor) for columna, valor in zip(columnas, fila)] for fila in bloque
+            )
+            total += len(bloque)
+    return total
+
+
+def exportar(destino, formato='parquet', filtros=None, tablas=None, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Exporta las tablas indicadas (las de datos por defecto) al directorio
+    destino, un archivo por tabla. Retorna {tabla: filas escritas}.
+    """
+    querysets = {tabla: querysets_de(tabla, filtros) for tabla in tablas or TABLAS_DATOS}
+    return _escribir_tablas(destino, formato, querysets, tamano_bloque)
+
+
+def _escribir_tablas(destino, formato, querysets, tamano_bloque):
+    """Escribe cada queryset en un archivo del directorio. Retorna {tabla: filas escritas}."""
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato no soportado: {formato}')
+    escribir = escribir_parquet if formato == 'parquet' else escribir_csv
+
+    os.makedirs(destino, exist_ok=True)
+    resultado = {}
+    for tabla, queryset in querysets.items():
+        ruta = os.path.join(destino, f'{tabla}.{formato}')
+        resultado[tabla] = escribir(tabla, ruta, queryset, tamano_bloque)
+    return resultado
+
+
+def codificar_token(momento):
+    """Retorna el token de marca de agua correspondiente a un instante."""
+    return base64.urlsafe_b64encode(momento.isoformat().encode('ascii')).decode('ascii')
+
+
+def decodificar_token(token):
+    """Retorna el instante de un token de marca de agua; ValueError si no es válido."""
+    try:
+        momento = datetime.datetime.fromisoformat(base64.urlsafe_b64decode(token.encode('ascii')).decode('ascii'))
+    except (ValueError, UnicodeError):
+        raise ValueError('Token de exportación inválido.')
+    if settings.USE_TZ and timezone.is_naive(momento):
+        raise ValueError('Token de exportación inválido.')
+    return momento
+
+
+def querysets_cambios(desde):
+    """
+    Retorna {tabla: queryset} con las filas modificadas o eliminadas desde el
+    instante indicado. Los enlaces de hipótesis no tienen fecha propia: se
+    exportan completos los de los accidentes modificados, que el consumidor
+    debe reemplazar.
+    """
+    accidentes = Accidente.objects.filter(fecha_modificacion__gte=desde)
+    return {
+        'accidentes': accidentes.order_by('pk'),
+        'vehiculos': VehiculoInvolucrado.objects.filter(fecha_modificacion__gte=desde).order_by('pk'),
+        'fallecidos': Fallecido.objects.filter(fecha_modificacion__gte=desde).order_by('pk'),
+        'hipotesis': AccidenteHipotesis.objects.filter(
+            accidente__in=accidentes.order_by().values('pk')
+        ).order_by('pk'),
+        'eliminados': RegistroEliminacion.objects.filter(fecha_eliminacion__gte=desde).order_by('pk'),
+    }
+
+
+def exportar_cambios(destino, token=None, formato='parquet', tamano_bloque=TAMANO_BLOQUE):
+    """
+    Exporta las filas cambiadas desde la marca de agua del token, o todas las
+    tablas si no se indica token. Retorna ({tabla: filas escritas}, token) con
+    el token que se debe enviar en la siguiente exportación.
+    """
+    hasta = timezone.now()
+    if token:
+        querysets = querysets_cambios(decodificar_token(token))
+    else:
+        querysets = {tabla: querysets_de(tabla) for tabla in TABLAS_DATOS}
+    resultado = _escribir_tablas(destino, formato, querysets, tamano_bloque)
+    return resultado, codificar_token(hasta - MARGEN_CAMBIOS)
@@ -0,0 +1,41 @@
+"""
+Comando para construir o actualizar la matriz de características.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from formularios import caracteristicas
+
+
+class Command(BaseCommand):
+    """
+    Actualiza la matriz de características de los accidentes con los
+    cambios desde la actualización anterior; la construye completa si no
+    existe, si cambió su esquema o si se pide con --completa.
+    Uso: python manage.py actualizar_caracteristicas [--directorio datos/caracteristicas] [--completa]
+    """
+    help = 'Construye o actualiza la matriz de características de los accidentes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directorio', default=caracteristicas.DIRECTORIO,
+                            help='Directorio de la matriz (por defecto CARACTERISTICAS_DIRECTORIO).')
+        parser.add_argument('--completa', action='store_true', help='Reconstruye la matriz completa.')
+
+    def handle(self, *args, **options):
+        if not options['directorio']:
+            raise CommandError('Indique --directorio o configure CARACTERISTICAS_DIRECTORIO.')
+
+        inicio = timezone.now()
+        try:
+            if options['completa']:
+                manifiesto = caracteristicas.construir(options['directorio'])
+            else:
+                manifiesto = caracteristicas.actualizar(options['directorio'])
+        except ImproperlyConfigured as error:
+            raise CommandError(str(error))
+
+        segundos = (timezone.now() - inicio).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f'Matriz con {manifiesto["filas"]} filas y {len(manifiesto["columnas"])} columnas '
+            f'actualizada en {segundos:.1f} s.'
+        ))
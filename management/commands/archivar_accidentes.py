@@ -0,0 +1,48 @@
+"""
+Comando para trasladar los accidentes históricos a las tablas de archivo.
+"""
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from formularios import archivo
+from formularios.models import AccidenteArchivado
+
+
+class Command(BaseCommand):
+    """
+    Traslada al archivo los accidentes cerrados anteriores a la fecha de corte
+    (por defecto, hoy menos ARCHIVO_ANTIGUEDAD_DIAS), con sus vehículos,
+    fallecidos y enlaces de hipótesis, en lotes de una transacción cada uno.
+    Con --restaurar devuelve a las tablas activas los accidentes archivados
+    con los números IPAT indicados.
+    Uso: python manage.py archivar_accidentes [--corte AAAA-MM-DD] [--simular]
+    """
+    help = 'Traslada los accidentes históricos a las tablas de archivo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corte', type=datetime.date.fromisoformat,
+                            help='Archiva los accidentes cerrados antes de esta fecha (AAAA-MM-DD).')
+        parser.add_argument('--tamano-lote', type=int, default=archivo.TAMANO_LOTE,
+                            help='Accidentes trasladados por transacción.')
+        parser.add_argument('--limite', type=int, help='Máximo de accidentes a archivar en esta ejecución.')
+        parser.add_argument('--simular', action='store_true', help='Solo informa cuántos accidentes se archivarían.')
+        parser.add_argument('--restaurar', nargs='+', metavar='IPAT', help='Números IPAT a restaurar.')
+
+    def handle(self, *args, **options):
+        if options['restaurar']:
+            pks = AccidenteArchivado.objects.filter(
+                numero_ipat__in=options['restaurar']
+            ).values_list('pk', flat=True)
+            restaurados = archivo.restaurar(pks, options['tamano_lote'])
+            if restaurados < len(set(options['restaurar'])):
+                raise CommandError(f'Solo se encontraron {restaurados} de los accidentes indicados en el archivo.')
+            self.stdout.write(self.style.SUCCESS(f'{restaurados} accidentes restaurados.'))
+            return
+
+        corte = options['corte'] or archivo.fecha_corte()
+        if options['simular']:
+            total = archivo.archivables(corte).count()
+            self.stdout.write(f'Se archivarían {total} accidentes anteriores a {corte}.')
+            return
+
+        total = archivo.archivar(corte, options['tamano_lote'], options['limite'])
+        self.stdout.write(self.style.SUCCESS(f'{total} accidentes anteriores a {corte} archivados.'))
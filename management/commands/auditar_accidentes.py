@@ -0,0 +1,54 @@
+"""
+Comando para auditar la consistencia de los accidentes.
+"""
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from formularios import auditoria
+from formularios.exportacion import decodificar_token
+
+
+class Command(BaseCommand):
+    """
+    Evalúa las reglas de consistencia sobre los accidentes activos y guarda
+    las inconsistencias encontradas. Con --estado la auditoría es incremental:
+    lee el token de la anterior, audita solo los accidentes cambiados desde
+    entonces y guarda el nuevo token; sin estado previo, o con --completa, se
+    audita la tabla completa.
+    Uso: python manage.py auditar_accidentes [--estado auditoria.json] [--completa] [--regla CODIGO]
+    """
+    help = 'Audita la consistencia entre los registros de los accidentes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--estado', help='Archivo JSON con el token de la auditoría anterior.')
+        parser.add_argument('--completa', action='store_true', help='Audita todos los accidentes.')
+        parser.add_argument('--regla', choices=list(auditoria.REGLAS_POR_CODIGO), action='append',
+                            help='Regla a evaluar; se puede repetir. Por defecto todas.')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['estado'] and not options['completa'] and os.path.exists(options['estado']):
+            with open(options['estado'], encoding='utf-8') as archivo:
+                token = json.load(archivo).get('token')
+            try:
+                desde = decodificar_token(token) if token else None
+            except ValueError as error:
+                raise CommandError(str(error))
+
+        reglas = [auditoria.REGLAS_POR_CODIGO[codigo] for codigo in options['regla'] or []] or auditoria.REGLAS
+        inicio = timezone.now()
+        evaluados, encontradas, nuevo_token = auditoria.auditar(desde, reglas)
+
+        # Una auditoría de solo algunas reglas no avanza la marca de agua de las demás
+        if options['estado'] and reglas is auditoria.REGLAS:
+            with open(options['estado'], 'w', encoding='utf-8') as archivo:
+                json.dump({'token': nuevo_token, 'fecha': inicio.isoformat()}, archivo)
+
+        for codigo, total in auditoria.resumen().items():
+            self.stdout.write(f'{codigo}: {total} accidentes.')
+        alcance = 'completa' if evaluados is None else f'incremental ({evaluados} accidentes)'
+        segundos = (timezone.now() - inicio).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f'Auditoría {alcance} terminada en {segundos:.1f} s: {encontradas} inconsistencias encontradas.'
+        ))
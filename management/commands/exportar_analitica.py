@@ -0,0 +1,49 @@
+"""
+Comando para exportar los accidentes en tablas para análisis.
+"""
+import datetime
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from formularios import exportacion
+
+
+class Command(BaseCommand):
+    """
+    Exporta accidentes, vehículos, fallecidos e hipótesis como tablas separadas
+    en Parquet o CSV, opcionalmente limitadas a un rango de fechas.
+    Uso: python manage.py exportar_analitica destino/ [--formato csv] [--desde 2020-01-01] [--hasta 2023-12-31]
+    """
+    help = 'Exporta las tablas de accidentes en Parquet o CSV para análisis.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('destino', help='Directorio donde se escriben los archivos.')
+        parser.add_argument('--formato', choices=exportacion.FORMATOS, default='parquet')
+        parser.add_argument('--desde', type=datetime.date.fromisoformat, help='Fecha inicial (AAAA-MM-DD).')
+        parser.add_argument('--hasta', type=datetime.date.fromisoformat, help='Fecha final (AAAA-MM-DD).')
+        parser.add_argument('--tablas', nargs='+', choices=list(exportacion.TABLAS), help='Tablas a exportar.')
+        parser.add_argument('--tamano-bloque', type=int, default=exportacion.TAMANO_BLOQUE,
+                            help='Filas leídas y escritas por bloque.')
+
+    def handle(self, *args, **options):
+        filtros = None
+        if options['desde'] or options['hasta']:
+            filtros = Q()
+            if options['desde']:
+                filtros &= Q(fecha_accidente__gte=options['desde'])
+            if options['hasta']:
+                filtros &= Q(fecha_accidente__lte=options['hasta'])
+
+        inicio = timezone.now()
+        try:
+            resultado = exportacion.exportar(
+                options['destino'], options['formato'], filtros, options['tablas'], options['tamano_bloque']
+            )
+        except ImproperlyConfigured as error:
+            raise CommandError(str(error))
+
+        for tabla, filas in resultado.items():
+            self.stdout.write(f'{tabla}: {filas} filas.')
+        segundos = (timezone.now() - inicio).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f'Exportación terminada en {segundos:.1f} s.'))
@@ -0,0 +1,51 @@
+"""
+Comando para la exportación incremental de accidentes.
+"""
+import json
+import os
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from formularios import exportacion
+
+
+class Command(BaseCommand):
+    """
+    Exporta las filas de accidentes, vehículos, fallecidos e hipótesis
+    modificadas desde la exportación anterior, junto con las eliminaciones.
+    El token de marca de agua se lee y se guarda en el archivo de estado, que
+    solo se actualiza si la exportación termina; sin estado previo se exportan
+    las tablas completas.
+    Uso: python manage.py exportar_cambios destino/ --estado sincronizacion.json [--formato csv]
+    """
+    help = 'Exporta solo los cambios desde la exportación anterior.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('destino', help='Directorio donde se escriben los archivos.')
+        parser.add_argument('--estado', required=True, help='Archivo JSON con el token de la exportación anterior.')
+        parser.add_argument('--formato', choices=exportacion.FORMATOS, default='parquet')
+        parser.add_argument('--tamano-bloque', type=int, default=exportacion.TAMANO_BLOQUE,
+                            help='Filas leídas y escritas por bloque.')
+
+    def handle(self, *args, **options):
+        token = None
+        if os.path.exists(options['estado']):
+            with open(options['estado'], encoding='utf-8') as archivo:
+                token = json.load(archivo).get('token')
+
+        inicio = timezone.now()
+        try:
+            resultado, nuevo_token = exportacion.exportar_cambios(
+                options['destino'], token, options['formato'], options['tamano_bloque']
+            )
+        except (ImproperlyConfigured, ValueError) as error:
+            raise CommandError(str(error))
+
+        with open(options['estado'], 'w', encoding='utf-8') as archivo:
+            json.dump({'token': nuevo_token, 'fecha': inicio.isoformat()}, archivo)
+
+        for tabla, filas in resultado.items():
+            self.stdout.write(f'{tabla}: {filas} filas.')
+        tipo = 'incremental' if token else 'completa'
+        segundos = (timezone.now() - inicio).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f'Exportación {tipo} terminada en {segundos:.1f} s.'))
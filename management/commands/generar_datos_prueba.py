@@ -0,0 +1,241 @@
+"""
+Comando para generar accidentes sintéticos con distribuciones realistas.
+"""
+import datetime
+import random
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from usuarios.models import Usuario
+from formularios import busqueda
+from formularios.models import (
+    Accidente, VehiculoInvolucrado, Fallecido, Agente, ZAT, Barrio, CentroPobladoVereda,
+    HipotesisConductor, HipotesisVehiculo, HipotesisVia, HipotesisPeaton, HipotesisPasajero,
+    ResumenDiarioAccidentes, TrabajoReporte, AccidenteHipotesis
+)
+
+# Pesos relativos de cada código de opción, aproximados a la accidentalidad municipal
+PESOS_AREA = {'URBANA': 82, 'RURAL': 18}
+PESOS_CLASE = {'CHOQUE': 48, 'COLISIÓN': 14, 'CAIDA': 16, 'ATROPELLO': 12, 'VOLCAMIENTO': 6, 'OTRO': 4}
+PESOS_CLASE_VEHICULO = {
+    'MOTOCICLETA': 46, 'AUTOMOVIL': 17, 'CAMIONETA': 8, 'BICICLETA': 5, 'CAMPERO': 4, 'CAMION': 4,
+    'BUS': 2, 'BUSETA': 2, 'MICROBUS': 2, 'TRACTOCAMION': 2, 'VOLQUETA': 2, 'MOTOCARRO': 2,
+    'CUATRIMOTO': 1, 'MOTOTRICICLO': 1, 'VEHICULO TRACCION ANIMAL': 1, 'FUGA DE VEHICULO': 1,
+}
+PESOS_SERVICIO = {'PARTICULAR': 78, 'PUBLICO': 18, 'OFICIAL': 3, 'DIPLOMATICO': 1}
+PESOS_EDAD = {
+    'PRIMERA INFANCIA': 1, 'INFANCIA': 2, 'ADOLESCENCIA': 7, 'JUVENTUD': 38, 'ADULTEZ': 45, 'PERSONA MAYOR': 7,
+}
+PESOS_VIA = {'CALLE': 38, 'CARRERA': 34, 'DIAGONAL': 5, 'TRANSVERSAL': 5, 'AVENIDA': 8, 'VÍA': 6, 'KILOMETRO': 4}
+# Accidentes por hora del día: picos en la mañana, al mediodía y al final de la tarde
+PESOS_HORA = [2, 1, 1, 1, 1, 2, 4, 7, 6, 5, 5, 6, 7, 7, 6, 6, 7, 8, 9, 8, 6, 4, 3, 3]
+# Vehículos por accidente en las clases que involucran más de uno
+PESOS_VEHICULOS = {1: 22, 2: 66, 3: 9, 4: 3}
+# Días entre el accidente y la entrega del informe
+PESOS_ENTREGA = {0: 30, 1: 40, 2: 15, 3: 7, 5: 5, 10: 3}
+
+# Probabilidad de heridos y de muertos según el área
+PROBABILIDAD_HERIDOS = {'URBANA': 0.45, 'RURAL': 0.55}
+PROBABILIDAD_MUERTOS = {'URBANA': 0.015, 'RURAL': 0.05}
+
+NOMBRES = ['Carlos', 'Luisa', 'Andrés', 'María', 'Jorge', 'Diana', 'Felipe', 'Paola', 'Julián', 'Sandra']
+APELLIDOS = ['Gómez', 'Rodríguez', 'Martínez', 'López', 'García', 'Hernández', 'Díaz', 'Moreno', 'Rojas', 'Vargas']
+
+HIPOTESIS = {
+    HipotesisConductor: 40,
+    HipotesisVehiculo: 12,
+    HipotesisVia: 15,
+    HipotesisPeaton: 10,
+    HipotesisPasajero: 6,
+}
+
+
+def elegir(azar, pesos):
+    """Elige una opción de un diccionario {opción: peso}."""
+    return azar.choices(list(pesos), weights=list(pesos.values()))[0]
+
+
+class Command(BaseCommand):
+    """
+    Genera N accidentes sintéticos, con sus vehículos y fallecidos, para medir
+    la aplicación con volúmenes realistas. Crea los catálogos que falten.
+    Los accidentes se insertan por bloques con bulk_create y al final se
+    reconstruyen el resumen diario, las hipótesis y el índice de búsqueda.
+    Uso: python manage.py generar_datos_prueba --accidentes 100000 --usuario admin
+    """
+    help = 'Genera accidentes sintéticos para pruebas de rendimiento.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accidentes', type=int, default=10000, help='Número de accidentes a generar.')
+        parser.add_argument('--usuario', required=True, help='Usuario que figura como registrador.')
+        parser.add_argument('--anos', type=int, default=5, help='Años hacia atrás en que se reparten las fechas.')
+        parser.add_argument('--semilla', type=int, default=2024, help='Semilla del generador aleatorio.')
+        parser.add_argument('--prefijo', default='SINT', help='Prefijo del número IPAT generado.')
+        parser.add_argument('--tamano-bloque', type=int, default=5000, help='Accidentes por transacción.')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = Usuario.objects.get(username=options['usuario'])
+        except Usuario.DoesNotExist:
+            raise CommandError(f'No existe el usuario {options["usuario"]}.')
+
+        self.azar = random.Random(options['semilla'])
+        self.crear_catalogos()
+        self.agentes = list(Agente.objects.values_list('pk', flat=True))
+        self.barrios = list(Barrio.objects.values_list('pk', 'zat_id'))
+        self.centros = list(CentroPobladoVereda.objects.values_list('pk', flat=True))
+        self.hipotesis = {
+            campo: list(Accidente._meta.get_field(campo).related_model.objects.values_list('pk', flat=True))
+            for campo in AccidenteHipotesis.CAMPOS_ACCIDENTE
+        }
+
+        prefijo = options['prefijo']
+        inicial = Accidente.objects.filter(numero_ipat__startswith=f'{prefijo}-').count()
+        hasta = datetime.date.today()
+        self.desde = hasta - datetime.timedelta(days=365 * options['anos'])
+        self.dias = (hasta - self.desde).days
+        self.usuario = usuario
+
+        total = options['accidentes']
+        tamano = options['tamano_bloque']
+        inicio = timezone.now()
+        for desde in range(0, total, tamano):
+            cantidad = min(tamano, total - desde)
+            self.generar_bloque(prefijo, inicial + desde, cantidad)
+            self.stdout.write(f'{desde + cantidad}/{total} accidentes generados.')
+
+        # Las inserciones masivas no emiten señales: se reconstruyen los datos derivados
+        self.stdout.write('Reconstruyendo resumen diario, hipótesis e índice de búsqueda...')
+        TrabajoReporte.invalidar_rango(self.desde, hasta)
+        ResumenDiarioAccidentes.reconstruir()
+        AccidenteHipotesis.poblar()
+        if busqueda.indice_disponible():
+            busqueda.reconstruir_indice()
+
+        segundos = (timezone.now() - inicio).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f'{total} accidentes generados en {segundos:.1f} s.'))
+
+    def crear_catalogos(self):
+        """Crea los catálogos vacíos con valores de prueba."""
+        if not Agente.objects.exists():
+            Agente.objects.bulk_create(Agente(nombre=nombre) for nombre, _ in Agente.AGENTE_CHOICES)
+        if not ZAT.objects.exists():
+            ZAT.objects.bulk_create(ZAT(nombre=f'ZAT {numero:03d}') for numero in range(1, 61))
+        if not Barrio.objects.exists():
+            Barrio.objects.bulk_create(
+                Barrio(nombre=f'Barrio {zat.nombre[4:]}-{numero}', zat=zat)
+                for zat in ZAT.objects.all() for numero in range(1, 6)
+            )
+        if not CentroPobladoVereda.objects.exists():
+            CentroPobladoVereda.objects.bulk_create(
+                CentroPobladoVereda(nombre=f'Vereda {numero:02d}') for numero in range(1, 41)
+            )
+        for modelo, cantidad in HIPOTESIS.items():
+            if not modelo.objects.exists():
+                modelo.objects.bulk_create(
+                    modelo(descripcion=f'{modelo._meta.verbose_name} {numero:03d}') for numero in range(1, cantidad + 1)
+                )
+
+    def nuevo_accidente(self, numero_ipat):
+        """Retorna un accidente sin guardar y la lista de vehículos que le corresponden."""
+        azar = self.azar
+        area = elegir(azar, PESOS_AREA)
+        clase = elegir(azar, PESOS_CLASE)
+        fecha = self.desde + datetime.timedelta(days=azar.randrange(self.dias + 1))
+        hora = datetime.time(azar.choices(range(24), weights=PESOS_HORA)[0], azar.randrange(60))
+        con_muertos = azar.random() < PROBABILIDAD_MUERTOS[area]
+        con_heridos = con_muertos or azar.random() < PROBABILIDAD_HERIDOS[area]
+        vehiculos = 1 if clase in ('CAIDA', 'VOLCAMIENTO') else elegir(azar, PESOS_VEHICULOS)
+
+        accidente = Accidente(
+            usuario=self.usuario,
+            numero_ipat=numero_ipat,
+            agente_responsable_id=azar.choice(self.agentes),
+            fecha_accidente=fecha,
+            hora_accidente=hora,
+            dias_establecidos_entrega=1,
+            fecha_real_entrega=fecha + datetime.timedelta(days=elegir(azar, PESOS_ENTREGA)),
+            total_vehiculos_involucrados=vehiculos,
+            con_heridos=con_heridos,
+            con_muertos=con_muertos,
+            con_danos_materiales=azar.random() < 0.8,
+            via=Accidente.Via.valores[elegir(azar, PESOS_VIA)],
+            numero_via=str(azar.randint(1, 120)),
+            complemento1=f'# {azar.randint(1, 120)}-{azar.randint(1, 99)}',
+            complemento2=Accidente.Complemento2.NINGUNO,
+            area=Accidente.Area.valores[area],
+            clase_accidente=Accidente.ClaseAccidente.valores[clase],
+            tipo_via=Accidente.TipoVia.valores[
+                'URBANA' if area == 'URBANA' else azar.choice(['RURAL', 'NACIONAL', 'DEPARTAMENTAL'])
+            ],
+            choque_con=Accidente.ChoqueCon.VEHICULO if clase == 'CHOQUE' and vehiculos > 1 else None,
+        )
+        if area == 'URBANA':
+            accidente.barrio_id, accidente.zat_id = azar.choice(self.barrios)
+        else:
+            accidente.centro_poblado_vereda_id = azar.choice(self.centros)
+
+        # Una hipótesis principal de conductor casi siempre; las demás con menor frecuencia
+        for campo, (categoria, rango) in AccidenteHipotesis.CAMPOS_ACCIDENTE.items():
+            probabilidad = 0.9 if (categoria, rango) == ('CONDUCTOR', 1) else 0.25 / rango
+            if categoria == 'PEATON' and clase != 'ATROPELLO':
+                probabilidad = 0
+            if self.hipotesis[campo] and azar.random() < probabilidad:
+                setattr(accidente, f'{campo}_id', azar.choice(self.hipotesis[campo]))
+        return accidente, vehiculos
+
+    def nuevo_vehiculo(self, accidente):
+        """Retorna un vehículo sin guardar del accidente."""
+        azar = self.azar
+        embriaguez = 'SI' if azar.random() < 0.06 else 'NO'
+        return VehiculoInvolucrado(
+            accidente=accidente,
+            tipo_servicio=VehiculoInvolucrado.TipoServicio.valores[elegir(azar, PESOS_SERVICIO)],
+            clase_vehiculo=VehiculoInvolucrado.ClaseVehiculo.valores[elegir(azar, PESOS_CLASE_VEHICULO)],
+            genero_involucrado=(VehiculoInvolucrado.Genero.MASCULINO if azar.random() < 0.78
+                                else VehiculoInvolucrado.Genero.FEMENINO),
+            rango_edad_involucrado=VehiculoInvolucrado.RangoEdad.valores[elegir(azar, PESOS_EDAD)],
+            heridos=(VehiculoInvolucrado.TipoPersona.CONDUCTOR if accidente.con_heridos
+                     else VehiculoInvolucrado.TipoPersona.NO_APLICA),
+            fallecidos=VehiculoInvolucrado.TipoPersona.NO_APLICA,
+            embriaguez_conductor=VehiculoInvolucrado.SiNo.valores[embriaguez],
+            grado_embriaguez=(azar.choice(VehiculoInvolucrado.GradoEmbriaguez.values) if embriaguez == 'SI'
+                              else None),
+            numero_heridos=azar.randint(1, 2) if accidente.con_heridos else 0,
+        )
+
+    def generar_bloque(self, prefijo, inicial, cantidad):
+        """Genera e inserta un bloque de accidentes con sus vehículos y fallecidos."""
+        azar = self.azar
+        accidentes = [self.nuevo_accidente(f'{prefijo}-{inicial + i + 1:09d}') for i in range(cantidad)]
+
+        with transaction.atomic():
+            # bulk_create asigna los ids en SQLite 3.35+ y PostgreSQL
+            Accidente.objects.bulk_create([accidente for accidente, _ in accidentes], batch_size=1000)
+
+            vehiculos = []
+            for accidente, numero in accidentes:
+                del_accidente = [self.nuevo_vehiculo(accidente) for _ in range(numero)]
+                if accidente.con_muertos:
+                    vehiculo = azar.choice(del_accidente)
+                    vehiculo.fallecidos = (
+                        VehiculoInvolucrado.TipoPersona.PEATON
+                        if accidente.clase_accidente == Accidente.ClaseAccidente.ATROPELLO
+                        else VehiculoInvolucrado.TipoPersona.CONDUCTOR
+                    )
+                    vehiculo.numero_fallecidos = 1 if azar.random() < 0.85 else 2
+                vehiculos.extend(del_accidente)
+            VehiculoInvolucrado.objects.bulk_create(vehiculos, batch_size=1000)
+
+            Fallecido.objects.bulk_create(
+                (
+                    Fallecido(
+                        vehiculo=vehiculo,
+                        nombre_apellidos=f'{azar.choice(NOMBRES)} {azar.choice(APELLIDOS)} {azar.choice(APELLIDOS)}',
+                        direccion=f'Calle {azar.randint(1, 120)} # {azar.randint(1, 120)}-{azar.randint(1, 99)}',
+                    )
+                    for vehiculo in vehiculos
+                    for _ in range(vehiculo.numero_fallecidos)
+                ),
+                batch_size=1000,
+            )
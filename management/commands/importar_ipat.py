@@ -0,0 +1,374 @@
+"""
+Comando para importar masivamente IPAT históricos desde archivos CSV o XLSX.
+"""
+import os
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+from usuarios.models import Usuario
+from formularios import busqueda
+from formularios.models import (
+    Accidente, VehiculoInvolucrado, Fallecido, Agente, ZAT, Barrio, CentroPobladoVereda,
+    HipotesisConductor, HipotesisVehiculo, HipotesisVia, HipotesisPeaton, HipotesisPasajero,
+    ResumenDiarioAccidentes, TrabajoReporte, AccidenteHipotesis, ControlImportacion, AccidenteArchivado,
+    CAMPOS_OPCIONES
+)
+
+VALORES_VERDADEROS = {'SI', 'SÍ', 'S', '1', 'TRUE', 'VERDADERO', 'X'}
+
+# Columnas de selección de cada archivo y sus opciones válidas
+OPCIONES_ACCIDENTE = CAMPOS_OPCIONES['Accidente']
+
+OPCIONES_VEHICULO = CAMPOS_OPCIONES['VehiculoInvolucrado']
+
+# Columnas del archivo que se resuelven contra un catálogo: columna -> (modelo, atributo)
+CATALOGOS_ACCIDENTE = {
+    'agente_responsable': (Agente, 'nombre'),
+    'zat': (ZAT, 'nombre'),
+    'barrio': (Barrio, 'nombre'),
+    'centro_poblado_vereda': (CentroPobladoVereda, 'nombre'),
+    'hipotesis_conductor1': (HipotesisConductor, 'descripcion'),
+    'hipotesis_conductor2': (HipotesisConductor, 'descripcion'),
+    'hipotesis_conductor3': (HipotesisConductor, 'descripcion'),
+    'hipotesis_conductor4': (HipotesisConductor, 'descripcion'),
+    'hipotesis_vehiculo1': (HipotesisVehiculo, 'descripcion'),
+    'hipotesis_vehiculo2': (HipotesisVehiculo, 'descripcion'),
+    'hipotesis_via1': (HipotesisVia, 'descripcion'),
+    'hipotesis_via2': (HipotesisVia, 'descripcion'),
+    'hipotesis_peaton1': (HipotesisPeaton, 'descripcion'),
+    'hipotesis_peaton2': (HipotesisPeaton, 'descripcion'),
+    'hipotesis_pasajero1': (HipotesisPasajero, 'descripcion'),
+    'hipotesis_pasajero2': (HipotesisPasajero, 'descripcion'),
+}
+
+OBLIGATORIAS_ACCIDENTE = [
+    'numero_ipat', 'agente_responsable', 'fecha_accidente', 'hora_accidente', 'fecha_real_entrega',
+    'via', 'numero_via', 'area', 'clase_accidente', 'tipo_via',
+]
+OBLIGATORIAS_VEHICULO = [
+    'numero_ipat', 'tipo_servicio', 'clase_vehiculo', 'genero_involucrado', 'rango_edad_involucrado',
+    'heridos', 'fallecidos', 'embriaguez_conductor',
+]
+OBLIGATORIAS_FALLECIDO = ['numero_ipat', 'vehiculo', 'nombre_apellidos', 'direccion']
+
+BOOLEANAS_ACCIDENTE = ['con_heridos', 'con_muertos', 'con_danos_materiales']
+TEXTO_ACCIDENTE = ['numero_via', 'complemento1', 'otra_informacion_direccion', 'otro_clase_accidente',
+                   'otro_objeto_fijo']
+ENTERAS_ACCIDENTE = {'dias_establecidos_entrega': 1, 'total_vehiculos_involucrados': 1}
+ENTERAS_VEHICULO = {'numero_heridos': 0, 'numero_fallecidos': 0}
+
+
+def leer_por_bloques(ruta, tamano, omitir):
+    """
+    Genera DataFrames de texto con hasta `tamano` filas del archivo CSV o XLSX,
+    omitiendo las primeras `omitir` filas de datos ya importadas.
+    """
+    if ruta.lower().endswith(('.xlsx', '.xlsm')):
+        libro = load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            filas = libro.active.iter_rows(values_only=True)
+            columnas = [str(c).strip() for c in next(filas)]
+            bloque = []
+            for numero, fila in enumerate(filas):
+                if numero < omitir:
+                    continue
+                bloque.append(['' if valor is None else str(valor) for valor in fila])
+                if len(bloque) >= tamano:
+                    yield pd.DataFrame(bloque, columns=columnas)
+                    bloque = []
+            if bloque:
+                yield pd.DataFrame(bloque, columns=columnas)
+        finally:
+            libro.close()
+    else:
+        yield from pd.read_csv(ruta, chunksize=tamano, dtype=str, keep_default_na=False,
+                               skiprows=range(1, omitir + 1), encoding='utf-8-sig')
+
+
+def normalizar(df):
+    """
+    Pasa los encabezados a minúsculas y quita los espacios de los extremos de
+    los valores. Los códigos y los nombres de catálogo se comparan en
+    mayúsculas al validarlos; los textos libres conservan su escritura.
+    """
+    df.columns = [columna.strip().lower() for columna in df.columns]
+    return df.apply(lambda serie: serie.astype(str).str.strip())
+
+
+def validar_opciones(df, opciones, errores):
+    """
+    Marca como inválidas las filas con códigos fuera de las opciones del modelo
+    y convierte los válidos al entero que se guarda (None si están vacíos).
+    Los valores vacíos se aceptan y se validan como obligatorios aparte.
+    """
+    invalidas = pd.Series(False, index=df.index)
+    for columna, opciones_campo in opciones.items():
+        if columna not in df:
+            continue
+        df[columna] = df[columna].str.upper()
+        malas = (df[columna] != '') & ~df[columna].isin(list(opciones_campo.valores))
+        errores.extend((fila, columna, df.at[fila, columna]) for fila in df.index[malas])
+        invalidas |= malas
+        df[columna] = pd.Series([opciones_campo.valores.get(codigo) for codigo in df[columna]],
+                                index=df.index, dtype=object)
+    return invalidas
+
+
+def validar_obligatorias(df, columnas, errores):
+    """Marca como inválidas las filas con columnas obligatorias vacías o ausentes."""
+    faltantes = [columna for columna in columnas if columna not in df]
+    if faltantes:
+        raise CommandError(f'Faltan columnas obligatorias: {", ".join(faltantes)}')
+    invalidas = pd.Series(False, index=df.index)
+    for columna in columnas:
+        vacias = df[columna] == ''
+        errores.extend((fila, columna, '') for fila in df.index[vacias])
+        invalidas |= vacias
+    return invalidas
+
+
+def convertir_fechas(df, columna, errores, formato=None):
+    """Convierte una columna a fecha (o a hora) y marca las filas no convertibles."""
+    convertidas = pd.to_datetime(df[columna], errors='coerce', format=formato)
+    malas = convertidas.isna() & (df[columna] != '')
+    errores.extend((fila, columna, df.at[fila, columna]) for fila in df.index[malas])
+    return convertidas, malas
+
+
+def convertir_enteros(df, columnas, errores):
+    """Convierte columnas enteras con su valor por defecto cuando están vacías."""
+    invalidas = pd.Series(False, index=df.index)
+    for columna, defecto in columnas.items():
+        if columna not in df:
+            df[columna] = defecto
+            continue
+        numeros = pd.to_numeric(df[columna].replace('', defecto), errors='coerce')
+        malas = numeros.isna() | (numeros < 0)
+        errores.extend((fila, columna, df.at[fila, columna]) for fila in df.index[malas])
+        invalidas |= malas
+        df[columna] = numeros.fillna(defecto).astype(int)
+    return invalidas
+
+
+class Command(BaseCommand):
+    """
+    Importa accidentes, vehículos y fallecidos históricos por bloques.
+    Los archivos usan como encabezados los nombres de los campos del modelo;
+    los catálogos se indican por nombre o descripción, los vehículos y
+    fallecidos se relacionan por numero_ipat y los fallecidos por el número
+    de orden del vehículo dentro del accidente (columna `vehiculo`, desde 1).
+    El avance se guarda en ControlImportacion, en la misma transacción de cada
+    bloque, para reanudar tras un fallo sin repetir filas. Los IPAT que ya
+    existen o se repiten en el archivo se reportan como errores.
+    Uso: python manage.py importar_ipat accidentes.csv --vehiculos vehiculos.csv
+         --fallecidos fallecidos.csv --usuario admin
+    """
+    help = 'Importa masivamente IPAT históricos desde CSV o XLSX.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('accidentes', help='Archivo CSV/XLSX de accidentes.')
+        parser.add_argument('--vehiculos', help='Archivo CSV/XLSX de vehículos involucrados.')
+        parser.add_argument('--fallecidos', help='Archivo CSV/XLSX de fallecidos.')
+        parser.add_argument('--usuario', required=True, help='Usuario al que se asignan los registros.')
+        parser.add_argument('--tamano-bloque', type=int, default=5000, help='Filas por bloque.')
+        parser.add_argument('--control',
+                            help='Clave del avance guardado (por defecto, la ruta del archivo de accidentes).')
+        parser.add_argument('--reiniciar', action='store_true', help='Ignora el avance guardado.')
+        parser.add_argument('--errores', help='Archivo CSV donde se escriben las filas rechazadas.')
+
+    def handle(self, *args, **options):
+        try:
+            self.usuario = Usuario.objects.get(username=options['usuario'])
+        except Usuario.DoesNotExist:
+            raise CommandError(f'No existe el usuario {options["usuario"]}.')
+
+        clave = options['control'] or os.path.abspath(options['accidentes'])
+        self.control, creado = ControlImportacion.objects.get_or_create(clave=clave)
+        if options['reiniciar']:
+            self.control.accidentes = self.control.vehiculos = self.control.fallecidos = 0
+            self.control.save()
+        elif not creado:
+            self.stdout.write(
+                f'Reanudando desde {self.control.accidentes} accidentes, {self.control.vehiculos} vehículos '
+                f'y {self.control.fallecidos} fallecidos.'
+            )
+
+        self.catalogos = {
+            columna: {
+                str(valor).strip().upper(): pk
+                for pk, valor in modelo.objects.values_list('pk', atributo)
+            }
+            for columna, (modelo, atributo) in CATALOGOS_ACCIDENTE.items()
+        }
+        self.errores = []
+        self.rango_importado = []
+        tamano = options['tamano_bloque']
+        inicio = timezone.now()
+
+        total = self.importar('accidentes', options['accidentes'], tamano, self.bloque_accidentes)
+        if options['vehiculos']:
+            total += self.importar('vehiculos', options['vehiculos'], tamano, self.bloque_vehiculos)
+        if options['fallecidos']:
+            total += self.importar('fallecidos', options['fallecidos'], tamano, self.bloque_fallecidos)
+
+        # Las inserciones masivas no emiten señales: se reconstruyen los datos derivados
+        self.stdout.write('Reconstruyendo resumen diario, hipótesis e índice de búsqueda...')
+        if self.rango_importado:
+            TrabajoReporte.invalidar_rango(min(self.rango_importado), max(self.rango_importado))
+        ResumenDiarioAccidentes.reconstruir()
+        AccidenteHipotesis.poblar()
+        if busqueda.indice_disponible():
+            busqueda.reconstruir_indice()
+
+        if options['errores'] and self.errores:
+            pd.DataFrame(self.errores, columns=['archivo', 'fila', 'columna', 'valor']).to_csv(
+                options['errores'], index=False
+            )
+
+        segundos = (timezone.now() - inicio).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f'Importación terminada: {total} filas insertadas en {segundos:.1f} s, {len(self.errores)} errores.'
+        ))
+
+    def importar(self, nombre, ruta, tamano, procesar_bloque):
+        """
+        Procesa un archivo por bloques, cada uno en su propia transacción junto
+        con el avance, de modo que un bloque queda importado y registrado o no
+        queda ninguna de las dos cosas.
+        """
+        insertadas = 0
+        for df in leer_por_bloques(ruta, tamano, getattr(self.control, nombre)):
+            procesadas = getattr(self.control, nombre)
+            primera_fila = procesadas + 2  # encabezado + base 1
+            df.index = range(primera_fila, primera_fila + len(df))
+            errores = []
+            with transaction.atomic():
+                insertadas += procesar_bloque(normalizar(df), errores)
+                ControlImportacion.objects.filter(pk=self.control.pk).update(**{nombre: procesadas + len(df)})
+            setattr(self.control, nombre, procesadas + len(df))
+            self.errores.extend((nombre, fila, columna, valor) for fila, columna, valor in errores)
+            self.stdout.write(f'{nombre}: {procesadas + len(df)} filas procesadas.')
+        return insertadas
+
+    def bloque_accidentes(self, df, errores):
+        """Valida y crea los accidentes de un bloque."""
+        invalidas = validar_obligatorias(df, OBLIGATORIAS_ACCIDENTE, errores)
+        invalidas |= validar_opciones(df, OPCIONES_ACCIDENTE, errores)
+        invalidas |= convertir_enteros(df, ENTERAS_ACCIDENTE, errores)
+
+        for columna in ('fecha_accidente', 'fecha_real_entrega'):
+            fechas, malas = convertir_fechas(df, columna, errores)
+            df[columna] = fechas.dt.date
+            invalidas |= malas
+        horas, malas = convertir_fechas(df, 'hora_accidente', errores, formato='mixed')
+        df['hora_accidente'] = horas.dt.time
+        invalidas |= malas
+
+        for columna in BOOLEANAS_ACCIDENTE:
+            df[columna] = df[columna].str.upper().isin(VALORES_VERDADEROS) if columna in df else False
+
+        # Resolver los catálogos con los diccionarios en memoria
+        for columna, valores in self.catalogos.items():
+            if columna not in df:
+                df[columna] = None
+                continue
+            ids = df[columna].str.upper().map(valores)
+            malas = ids.isna() & (df[columna] != '')
+            errores.extend((fila, columna, df.at[fila, columna]) for fila in df.index[malas])
+            invalidas |= malas
+            df[columna] = [None if pd.isna(pk) else int(pk) for pk in ids]
+
+        # Los IPAT repetidos en el archivo o ya registrados (activos o archivados) se rechazan
+        validas = df.loc[~invalidas, 'numero_ipat']
+        existentes = set()
+        for modelo in (Accidente, AccidenteArchivado):
+            existentes.update(modelo.objects.filter(
+                numero_ipat__in=validas.unique().tolist()
+            ).values_list('numero_ipat', flat=True))
+        repetidas = validas.index[validas.duplicated() | validas.isin(existentes)]
+        errores.extend((fila, 'numero_ipat', f'{df.at[fila, "numero_ipat"]} (IPAT repetido)') for fila in repetidas)
+        invalidas |= df.index.isin(repetidas)
+
+        df = df[~invalidas]
+        registro = timezone.now()
+        accidentes = [
+            Accidente(
+                usuario=self.usuario,
+                fecha_registro=registro,
+                **{f'{columna}_id': fila[columna] for columna in self.catalogos},
+                **{columna: fila.get(columna) or None for columna in OPCIONES_ACCIDENTE},
+                **{columna: fila.get(columna) or None for columna in TEXTO_ACCIDENTE},
+                **{columna: fila[columna] for columna in ENTERAS_ACCIDENTE},
+                **{columna: fila[columna] for columna in BOOLEANAS_ACCIDENTE},
+                numero_ipat=fila['numero_ipat'],
+                fecha_accidente=fila['fecha_accidente'],
+                hora_accidente=fila['hora_accidente'],
+                fecha_real_entrega=fila['fecha_real_entrega'],
+            )
+            for fila in df.to_dict('records')
+        ]
+        Accidente.objects.bulk_create(accidentes, batch_size=1000)
+        if accidentes:
+            fechas = df['fecha_accidente']
+            self.rango_importado.extend([fechas.min(), fechas.max()])
+        return len(accidentes)
+
+    def bloque_vehiculos(self, df, errores):
+        """Valida y crea los vehículos de un bloque."""
+        invalidas = validar_obligatorias(df, OBLIGATORIAS_VEHICULO, errores)
+        invalidas |= validar_opciones(df, OPCIONES_VEHICULO, errores)
+        invalidas |= convertir_enteros(df, ENTERAS_VEHICULO, errores)
+
+        accidentes = dict(Accidente.objects.filter(
+            numero_ipat__in=df['numero_ipat'].unique().tolist()
+        ).values_list('numero_ipat', 'id'))
+        df['accidente_id'] = df['numero_ipat'].map(accidentes)
+        sin_accidente = df['accidente_id'].isna()
+        errores.extend((fila, 'numero_ipat', df.at[fila, 'numero_ipat']) for fila in df.index[sin_accidente])
+        invalidas |= sin_accidente
+
+        df = df[~invalidas]
+        vehiculos = [
+            VehiculoInvolucrado(
+                accidente_id=int(fila['accidente_id']),
+                **{columna: fila.get(columna) or None for columna in OPCIONES_VEHICULO},
+                **{columna: fila[columna] for columna in ENTERAS_VEHICULO},
+            )
+            for fila in df.to_dict('records')
+        ]
+        VehiculoInvolucrado.objects.bulk_create(vehiculos, batch_size=1000)
+        return len(vehiculos)
+
+    def bloque_fallecidos(self, df, errores):
+        """Valida y crea los fallecidos de un bloque."""
+        invalidas = validar_obligatorias(df, OBLIGATORIAS_FALLECIDO, errores)
+        orden = pd.to_numeric(df['vehiculo'], errors='coerce')
+
+        # (IPAT, orden del vehículo dentro del accidente) -> id del vehículo
+        vehiculos = {}
+        for ipat, vehiculo_id in VehiculoInvolucrado.objects.filter(
+            accidente__numero_ipat__in=df['numero_ipat'].unique().tolist()
+        ).order_by('accidente_id', 'id').values_list('accidente__numero_ipat', 'id'):
+            vehiculos.setdefault(ipat, []).append(vehiculo_id)
+
+        df['vehiculo_id'] = [
+            vehiculos[ipat][int(n) - 1] if ipat in vehiculos and pd.notna(n) and 1 <= n <= len(vehiculos[ipat]) else None
+            for ipat, n in zip(df['numero_ipat'], orden)
+        ]
+        sin_vehiculo = df['vehiculo_id'].isna() & ~invalidas
+        errores.extend((fila, 'vehiculo', df.at[fila, 'vehiculo']) for fila in df.index[sin_vehiculo])
+        invalidas |= sin_vehiculo
+
+        df = df[~invalidas]
+        fallecidos = [
+            Fallecido(
+                vehiculo_id=int(fila['vehiculo_id']),
+                nombre_apellidos=fila['nombre_apellidos'],
+                direccion=fila['direccion'],
+            )
+            for fila in df.to_dict('records')
+        ]
+        Fallecido.objects.bulk_create(fallecidos, batch_size=1000)
+        return len(fallecidos)
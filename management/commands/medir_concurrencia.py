@@ -0,0 +1,131 @@
+"""
+Comando para comparar las vistas síncronas y asíncronas bajo carga concurrente.
+"""
+import asyncio
+import copy
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from usuarios.models import Usuario
+from formularios.models import Barrio
+from formularios.management.commands.medir_rendimiento import percentil
+
+# nombre del escenario -> (URL síncrona, URL asíncrona, usa la ZAT de prueba)
+ESCENARIOS = {
+    'dashboard': ('dashboard', 'dashboard_async', False),
+    'catalogo': ('catalogo_formulario', 'catalogo_formulario_async', False),
+    'barrios_por_zat': ('barrios_por_zat', 'barrios_por_zat_async', True),
+}
+
+
+def resumen(tiempos, errores, segundos):
+    """Retorna peticiones por segundo y latencias (ms) de una corrida."""
+    return {
+        'peticiones': len(tiempos),
+        'errores': errores,
+        'peticiones_por_segundo': len(tiempos) / segundos if segundos else 0,
+        'p50_ms': statistics.median(tiempos) if tiempos else 0,
+        'p99_ms': percentil(tiempos, 0.99) if tiempos else 0,
+    }
+
+
+class Command(BaseCommand):
+    """
+    Lanza el mismo número de peticiones concurrentes contra la versión
+    síncrona y la asíncrona del dashboard, del catálogo del formulario y de
+    los barrios por ZAT, y reporta peticiones por segundo y latencia p99.
+    La versión síncrona se atiende con el manejador WSGI en un grupo de hilos
+    del tamaño de la concurrencia, como un worker con hilos; la asíncrona con
+    el manejador ASGI en un solo bucle de eventos.
+    Uso: python manage.py medir_concurrencia --usuario admin --concurrencia 50
+    """
+    help = 'Compara las vistas síncronas y asíncronas bajo carga concurrente.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', required=True, help='Usuario con el que se hacen las peticiones.')
+        parser.add_argument('--concurrencia', type=int, default=20, help='Peticiones simultáneas.')
+        parser.add_argument('--peticiones', type=int, default=500, help='Peticiones por escenario y modo.')
+        parser.add_argument('--escenario', choices=list(ESCENARIOS), action='append',
+                            help='Escenario a medir; se puede repetir. Por defecto todos.')
+        parser.add_argument('--salida', help='Archivo JSON donde se guarda el resultado.')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = Usuario.objects.get(username=options['usuario'])
+        except Usuario.DoesNotExist:
+            raise CommandError(f'No existe el usuario {options["usuario"]}.')
+        barrio = Barrio.objects.order_by('pk').first()
+        if barrio is None:
+            raise CommandError('No hay barrios; cargue los catálogos antes de medir.')
+
+        # Permite usar los clientes de pruebas (host testserver) fuera de las pruebas
+        setup_test_environment()
+        self.cliente = Client()
+        self.cliente.force_login(usuario)
+        self.concurrencia = options['concurrencia']
+        self.peticiones = options['peticiones']
+
+        resultado = {'concurrencia': self.concurrencia, 'peticiones': self.peticiones, 'escenarios': {}}
+        for nombre in options['escenario'] or ESCENARIOS:
+            url_sync, url_async, por_zat = ESCENARIOS[nombre]
+            kwargs = {'zat_id': barrio.zat_id} if por_zat else {}
+            medida_sync = self.carga_sync(reverse(url_sync, kwargs=kwargs))
+            medida_async = asyncio.run(self.carga_async(reverse(url_async, kwargs=kwargs)))
+            resultado['escenarios'][nombre] = {'sync': medida_sync, 'async': medida_async}
+            for modo, medida in (('sync', medida_sync), ('async', medida_async)):
+                self.stdout.write(
+                    f'{nombre} [{modo}]: {medida["peticiones_por_segundo"]:.1f} pet/s, '
+                    f'p50 {medida["p50_ms"]:.1f} ms, p99 {medida["p99_ms"]:.1f} ms, {medida["errores"]} errores'
+                )
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f'Resultado guardado en {options["salida"]}.'))
+
+    def carga_sync(self, url):
+        """Atiende las peticiones en un grupo de hilos, cada uno con su cliente y su conexión."""
+        local = threading.local()
+        tiempos, errores = [], 0
+
+        def peticion(_):
+            if not hasattr(local, 'cliente'):
+                local.cliente = Client()
+                local.cliente.cookies = copy.deepcopy(self.cliente.cookies)
+            inicio = time.perf_counter()
+            respuesta = local.cliente.get(url)
+            return (time.perf_counter() - inicio) * 1000, respuesta.status_code
+
+        self.cliente.get(url)
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrencia) as grupo:
+            for milisegundos, estado in grupo.map(peticion, range(self.peticiones)):
+                tiempos.append(milisegundos)
+                errores += estado != 200
+        return resumen(tiempos, errores, time.perf_counter() - inicio)
+
+    async def carga_async(self, url):
+        """Atiende las peticiones en el bucle de eventos con a lo sumo `concurrencia` a la vez."""
+        cliente = AsyncClient()
+        cliente.cookies = copy.deepcopy(self.cliente.cookies)
+        limite = asyncio.Semaphore(self.concurrencia)
+        tiempos, errores = [], 0
+
+        async def peticion():
+            async with limite:
+                inicio = time.perf_counter()
+                respuesta = await cliente.get(url)
+                return (time.perf_counter() - inicio) * 1000, respuesta.status_code
+
+        await cliente.get(url)
+        inicio = time.perf_counter()
+        for milisegundos, estado in await asyncio.gather(*(peticion() for _ in range(self.peticiones))):
+            tiempos.append(milisegundos)
+            errores += estado != 200
+        return resumen(tiempos, errores, time.perf_counter() - inicio)
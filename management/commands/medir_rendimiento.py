@@ -0,0 +1,226 @@
+"""
+Comando para medir el rendimiento de las vistas principales de accidentes.
+"""
+import datetime
+import json
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.forms.models import model_to_dict
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+from usuarios.models import Usuario
+from formularios.forms import AccidenteForm, VehiculoFormSet
+from formularios.models import Accidente
+from formularios.reportes import construir_filtros, escribir_excel, obtener_accidentes
+from formularios.servicios import vehiculos_para_edicion
+
+# Prefijo IPAT de los accidentes creados por la medición, que se eliminan al final
+PREFIJO_MEDICION = 'MEDICION-'
+
+# Aumento relativo sobre la línea base a partir del cual se reporta una regresión
+TOLERANCIA = 0.2
+
+
+def valor_post(valor):
+    """Convierte un valor del modelo al texto que enviaría el navegador."""
+    if valor is None:
+        return ''
+    if isinstance(valor, (datetime.date, datetime.time)):
+        return valor.isoformat()
+    return valor
+
+
+def datos_formulario(accidente, edicion=False):
+    """
+    Retorna el POST del formulario de accidente con sus vehículos, armado con
+    los datos de un accidente existente. Con edicion=True incluye los ids de
+    los vehículos para enviarlo al formulario de edición.
+    """
+    datos = {}
+    valores = model_to_dict(accidente, fields=AccidenteForm.base_fields, exclude=['croquis_pdf'])
+    for nombre, valor in valores.items():
+        # Las casillas sin marcar no se envían
+        if valor is True:
+            datos[nombre] = 'on'
+        elif valor is not False:
+            datos[nombre] = valor_post(valor)
+
+    vehiculos = list(vehiculos_para_edicion(accidente))
+    prefijo = VehiculoFormSet(instance=accidente).prefix
+    datos.update({
+        f'{prefijo}-TOTAL_FORMS': len(vehiculos),
+        f'{prefijo}-INITIAL_FORMS': len(vehiculos) if edicion else 0,
+        f'{prefijo}-MIN_NUM_FORMS': 0,
+        f'{prefijo}-MAX_NUM_FORMS': 1000,
+    })
+    campos_vehiculo = [nombre for nombre in VehiculoFormSet.form.base_fields if nombre not in ('id', 'accidente')]
+    for indice, vehiculo in enumerate(vehiculos):
+        for nombre, valor in model_to_dict(vehiculo, fields=campos_vehiculo).items():
+            if valor is True:
+                datos[f'{prefijo}-{indice}-{nombre}'] = 'on'
+            elif valor is not False:
+                datos[f'{prefijo}-{indice}-{nombre}'] = valor_post(valor)
+        if edicion:
+            datos[f'{prefijo}-{indice}-id'] = vehiculo.pk
+            datos[f'{prefijo}-{indice}-accidente'] = accidente.pk
+            datos[f'fallecidos[{indice}][enviados]'] = 1
+        for posicion, fallecido in enumerate(vehiculo.ocupantes_fallecidos.all(), start=1):
+            datos[f'fallecidos[{indice}][{posicion}][nombre_apellidos]'] = fallecido.nombre_apellidos
+            datos[f'fallecidos[{indice}][{posicion}][direccion]'] = fallecido.direccion
+    return datos
+
+
+def percentil(valores, fraccion):
+    """Percentil por rango más cercano de una lista de valores."""
+    ordenados = sorted(valores)
+    return ordenados[max(0, min(len(ordenados) - 1, round(fraccion * len(ordenados)) - 1))]
+
+
+class Command(BaseCommand):
+    """
+    Mide la latencia, el número de consultas SQL y el pico de memoria de la
+    lista, la búsqueda, el detalle, la creación, la edición, el dashboard y la
+    exportación del reporte sobre la base de datos actual, y guarda el
+    resultado en JSON como línea base. Con --comparar reporta las regresiones
+    frente a una línea base anterior.
+    Para medir a 10k, 100k o 1M filas se llena una base de datos de prueba
+    con generar_datos_prueba antes de ejecutarlo.
+    Uso: python manage.py medir_rendimiento --usuario admin --salida base.json
+    """
+    help = 'Mide el rendimiento de las vistas de accidentes y guarda una línea base en JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', required=True, help='Usuario con el que se hacen las peticiones.')
+        parser.add_argument('--repeticiones', type=int, default=20, help='Repeticiones de cada escenario.')
+        parser.add_argument('--salida', help='Archivo JSON donde se guarda el resultado.')
+        parser.add_argument('--comparar', help='Línea base JSON con la que se compara el resultado.')
+        parser.add_argument('--busqueda', default='calle', help='Texto usado en el escenario de búsqueda.')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = Usuario.objects.get(username=options['usuario'])
+        except Usuario.DoesNotExist:
+            raise CommandError(f'No existe el usuario {options["usuario"]}.')
+
+        accidente = Accidente.objects.filter(vehiculos__isnull=False).exclude(
+            numero_ipat__startswith=PREFIJO_MEDICION).order_by('-id').first()
+        if accidente is None:
+            raise CommandError('No hay accidentes con vehículos; ejecute primero generar_datos_prueba.')
+
+        # Permite usar el cliente de pruebas (host testserver) fuera de las pruebas
+        setup_test_environment()
+        self.cliente = Client()
+        self.cliente.force_login(usuario)
+        total = Accidente.objects.count()
+        repeticiones = options['repeticiones']
+
+        # Los POST se arman antes de medir para no contar sus consultas
+        datos_crear = datos_formulario(accidente)
+        datos_editar = datos_formulario(accidente, edicion=True)
+
+        escenarios = [
+            ('lista', lambda i: self.get(reverse('lista_accidentes'))),
+            ('busqueda', lambda i: self.get(reverse('lista_accidentes'), {'search': options['busqueda']})),
+            ('detalle', lambda i: self.get(reverse('detalle_accidente', kwargs={'pk': accidente.pk}))),
+            ('crear', lambda i: self.post(
+                reverse('crear_accidente'), dict(datos_crear, numero_ipat=f'{PREFIJO_MEDICION}{i}'))),
+            ('editar', lambda i: self.post(reverse('editar_accidente', kwargs={'pk': accidente.pk}), datos_editar)),
+            ('dashboard', lambda i: self.get(reverse('dashboard'))),
+            ('exportar_reporte', lambda i: self.exportar(accidente.fecha_accidente.year)),
+        ]
+
+        resultado = {
+            'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+            'base_datos': connection.vendor,
+            'python': platform.python_version(),
+            'accidentes': total,
+            'repeticiones': repeticiones,
+            'escenarios': {},
+        }
+        try:
+            for nombre, escenario in escenarios:
+                resultado['escenarios'][nombre] = medida = self.medir(escenario, repeticiones)
+                self.stdout.write(
+                    f'{nombre}: p50 {medida["p50_ms"]:.1f} ms, p95 {medida["p95_ms"]:.1f} ms, '
+                    f'{medida["consultas"]} consultas, pico {medida["memoria_pico_kb"]:.0f} KB'
+                )
+        finally:
+            Accidente.objects.filter(numero_ipat__startswith=PREFIJO_MEDICION).delete()
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f'Resultado guardado en {options["salida"]}.'))
+
+        if options['comparar']:
+            self.comparar(resultado, options['comparar'])
+
+    def get(self, url, datos=None):
+        respuesta = self.cliente.get(url, datos)
+        if respuesta.status_code != 200:
+            raise CommandError(f'GET {url} respondió {respuesta.status_code}.')
+        # Consumir la respuesta completa, incluidas las respuestas por fragmentos
+        b''.join(respuesta.streaming_content) if respuesta.streaming else respuesta.content
+
+    def post(self, url, datos):
+        respuesta = self.cliente.post(url, datos)
+        if respuesta.status_code != 302:
+            raise CommandError(f'POST {url} respondió {respuesta.status_code}; revise los datos del formulario.')
+
+    def exportar(self, ano):
+        with tempfile.TemporaryFile() as archivo:
+            escribir_excel(obtener_accidentes(construir_filtros({'ano': ano})), archivo)
+
+    def medir(self, escenario, repeticiones):
+        """
+        Ejecuta el escenario una vez para calentar las cachés y luego las
+        repeticiones indicadas, midiendo cada una.
+        """
+        escenario(0)
+        tiempos, consultas = [], []
+        tracemalloc.start()
+        try:
+            for i in range(1, repeticiones + 1):
+                with CaptureQueriesContext(connection) as capturadas:
+                    inicio = time.perf_counter()
+                    escenario(i)
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+                consultas.append(len(capturadas))
+            pico = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'p50_ms': statistics.median(tiempos),
+            'p95_ms': percentil(tiempos, 0.95),
+            'max_ms': max(tiempos),
+            'consultas': max(consultas),
+            'memoria_pico_kb': pico / 1024,
+        }
+
+    def comparar(self, resultado, ruta):
+        """Reporta los escenarios que empeoraron más que TOLERANCIA frente a la línea base."""
+        with open(ruta, encoding='utf-8') as archivo:
+            base = json.load(archivo)
+
+        regresiones = []
+        for nombre, medida in resultado['escenarios'].items():
+            anterior = base.get('escenarios', {}).get(nombre)
+            if not anterior:
+                continue
+            for metrica in ('p95_ms', 'consultas', 'memoria_pico_kb'):
+                if anterior[metrica] and medida[metrica] > anterior[metrica] * (1 + TOLERANCIA):
+                    regresiones.append(f'{nombre}.{metrica}: {anterior[metrica]:.1f} -> {medida[metrica]:.1f}')
+
+        if base.get('accidentes') != resultado['accidentes']:
+            self.stdout.write(self.style.WARNING(
+                f'La línea base se midió con {base.get("accidentes")} accidentes y esta con {resultado["accidentes"]}.'
+            ))
+        if regresiones:
+            raise CommandError('Regresiones frente a la línea base:\n' + '\n'.join(regresiones))
+        self.stdout.write(self.style.SUCCESS('Sin regresiones frente a la línea base.'))
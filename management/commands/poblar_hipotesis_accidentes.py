@@ -0,0 +1,18 @@
+"""
+Comando para llenar la tabla de enlaces de hipótesis de los accidentes.
+"""
+from django.core.management.base import BaseCommand
+from formularios.models import AccidenteHipotesis
+
+
+class Command(BaseCommand):
+    """
+    Reconstruye AccidenteHipotesis desde las columnas hipotesis_* de la tabla
+    de accidentes. Útil tras cargas masivas que no disparan señales.
+    Uso: python manage.py poblar_hipotesis_accidentes
+    """
+    help = 'Reconstruye los enlaces de hipótesis de los accidentes.'
+
+    def handle(self, *args, **options):
+        creados = AccidenteHipotesis.poblar()
+        self.stdout.write(self.style.SUCCESS(f'Enlaces de hipótesis reconstruidos: {creados} filas.'))
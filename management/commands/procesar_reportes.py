@@ -0,0 +1,50 @@
+"""
+Comando para procesar la cola de reportes de accidentes en segundo plano.
+"""
+import time
+from django.core.management.base import BaseCommand
+from formularios.reportes import tomar_siguiente_trabajo, generar_trabajo, recuperar_trabajos_abandonados
+
+
+class Command(BaseCommand):
+    """
+    Worker que toma los trabajos de reporte pendientes y genera sus archivos.
+    Al iniciar, y cada vez que la cola queda vacía, devuelve a la cola los
+    trabajos en proceso de workers que dejaron de dar señales.
+    Uso: python manage.py procesar_reportes [--una-vez] [--intervalo 5]
+    """
+    help = 'Procesa los trabajos de reporte pendientes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Procesa los trabajos pendientes y termina.')
+        parser.add_argument('--intervalo', type=float, default=5,
+                            help='Segundos de espera cuando la cola está vacía.')
+
+    def handle(self, *args, **options):
+        self.recuperar()
+        while True:
+            trabajo = tomar_siguiente_trabajo()
+            if trabajo is None:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                self.recuperar()
+                continue
+
+            self.stdout.write(f'Generando reporte {trabajo.pk}...')
+            try:
+                terminado = generar_trabajo(trabajo)
+            except Exception as error:
+                self.stderr.write(self.style.ERROR(f'Reporte {trabajo.pk} falló: {error}'))
+                continue
+
+            if terminado:
+                self.stdout.write(self.style.SUCCESS(f'Reporte {trabajo.pk} terminado.'))
+            else:
+                self.stdout.write(f'Reporte {trabajo.pk} cambió durante la generación; se repetirá.')
+
+    def recuperar(self):
+        recuperados = recuperar_trabajos_abandonados()
+        if recuperados:
+            self.stdout.write(f'{recuperados} reportes abandonados devueltos a la cola.')
@@ -0,0 +1,20 @@
+"""
+Comando para reconstruir el índice de búsqueda de accidentes.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from formularios import busqueda
+
+
+class Command(BaseCommand):
+    """
+    Regenera el índice FTS5 con el documento de búsqueda de cada accidente.
+    Útil tras cargas masivas o cambios de nombre en los catálogos.
+    Uso: python manage.py reconstruir_indice_busqueda
+    """
+    help = 'Reconstruye el índice de búsqueda de texto completo de accidentes.'
+
+    def handle(self, *args, **options):
+        if not busqueda.indice_disponible():
+            raise CommandError('El índice de búsqueda solo está disponible con SQLite.')
+        total = busqueda.reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f'Índice reconstruido: {total} accidentes.'))
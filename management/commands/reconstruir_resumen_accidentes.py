@@ -0,0 +1,18 @@
+"""
+Comando para reconstruir el resumen diario de accidentes.
+"""
+from django.core.management.base import BaseCommand
+from formularios.models import ResumenDiarioAccidentes
+
+
+class Command(BaseCommand):
+    """
+    Recalcula la tabla ResumenDiarioAccidentes desde la tabla de accidentes.
+    Útil tras cargas masivas que no disparan señales (bulk_create, update).
+    Uso: python manage.py reconstruir_resumen_accidentes
+    """
+    help = 'Reconstruye el resumen diario de accidentes.'
+
+    def handle(self, *args, **options):
+        creados = ResumenDiarioAccidentes.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'Resumen reconstruido: {creados} filas.'))
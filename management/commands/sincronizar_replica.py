@@ -0,0 +1,51 @@
+"""
+Comando para copiar la base de datos principal SQLite a la réplica local.
+"""
+import os
+import sqlite3
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from formularios.replicas import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    """
+    Copia la base de datos principal sobre el archivo de la réplica con la API
+    de respaldo de SQLite, que obtiene una copia consistente aunque la
+    principal esté recibiendo escrituras. La copia se escribe en un archivo
+    temporal y luego reemplaza la réplica, de modo que las conexiones abiertas
+    siguen leyendo la copia anterior hasta que se cierran.
+    Pensado para desarrollo y pruebas; en producción la réplica la mantiene
+    el motor de base de datos.
+    Uso: python manage.py sincronizar_replica
+    """
+    help = 'Copia la base de datos SQLite principal sobre la réplica local.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', default=REPLICA_ALIAS, help='Alias de DATABASES de la réplica.')
+
+    def handle(self, *args, **options):
+        alias = options['alias']
+        if alias not in connections.databases:
+            raise CommandError(f'No existe la base de datos {alias} en DATABASES.')
+        principal = connections[DEFAULT_DB_ALIAS]
+        if principal.vendor != 'sqlite' or connections[alias].vendor != 'sqlite':
+            raise CommandError('La sincronización solo está implementada entre bases de datos SQLite.')
+
+        destino = str(connections[alias].settings_dict['NAME'])
+        if destino == str(principal.settings_dict['NAME']):
+            raise CommandError('La réplica y la base de datos principal son el mismo archivo.')
+
+        temporal = f'{destino}.tmp'
+        principal.ensure_connection()
+        copia = sqlite3.connect(temporal)
+        try:
+            principal.connection.backup(copia, pages=4096)
+        except sqlite3.Error as error:
+            copia.close()
+            os.remove(temporal)
+            raise CommandError(f'No se pudo copiar la base de datos: {error}')
+        copia.close()
+        os.replace(temporal, destino)
+        connections[alias].close()
+        self.stdout.write(self.style.SUCCESS(f'Réplica {alias} actualizada en {destino}.'))
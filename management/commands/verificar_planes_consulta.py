@@ -0,0 +1,92 @@
+"""
+Comando para verificar los planes de ejecución de las consultas frecuentes.
+"""
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from formularios.models import (
+    Accidente, AccidenteArchivado, AccidenteHipotesis, VehiculoInvolucrado, Fallecido, ResumenDiarioAccidentes
+)
+from formularios.paginacion import PaginadorCursor
+from formularios.reportes import construir_filtros
+
+
+def consultas_frecuentes():
+    """
+    Retorna (nombre, queryset) de las consultas de las vistas y del admin que
+    deben resolverse con índices.
+    """
+    hoy = datetime.date.today()
+    hora = datetime.time(12, 0)
+    reporte = Accidente.objects.order_by()
+    admin = Accidente.objects.order_by('-fecha_accidente', '-hora_accidente', '-id')
+
+    return [
+        ('lista: primera página', Accidente.objects.order_by(*PaginadorCursor.ORDEN)[:11]),
+        ('lista: página por cursor',
+         Accidente.objects.filter(PaginadorCursor._despues_de(hoy, hora, 1)).order_by(*PaginadorCursor.ORDEN)[:11]),
+        ('reporte: año', reporte.filter(construir_filtros({'ano': hoy.year}))),
+        ('reporte: año y mes', reporte.filter(construir_filtros({'ano': hoy.year, 'mes': hoy.month}))),
+        ('reporte: rango y agente',
+         reporte.filter(construir_filtros({'fecha_desde': hoy.replace(day=1), 'fecha_hasta': hoy, 'agente': 1}))),
+        ('reporte: año y área', reporte.filter(construir_filtros({'ano': hoy.year, 'area': Accidente.Area.RURAL}))),
+        ('admin: clase de accidente', admin.filter(clase_accidente=Accidente.ClaseAccidente.ATROPELLO)[:100]),
+        ('admin: con heridos', admin.filter(con_heridos=True)[:100]),
+        ('admin: con muertos', admin.filter(con_muertos=True)[:100]),
+        ('admin: área', admin.filter(area=Accidente.Area.URBANA)[:100]),
+        ('dashboard: mes actual', ResumenDiarioAccidentes.objects.filter(fecha__gte=hoy.replace(day=1))),
+        ('detalle: vehículos', VehiculoInvolucrado.objects.filter(accidente_id=1)),
+        ('detalle: fallecidos', Fallecido.objects.filter(vehiculo__accidente_id=1)),
+        ('hipótesis: accidentes que la citan',
+         AccidenteHipotesis.objects.filter(categoria='CONDUCTOR', hipotesis_id=1).values('accidente_id')),
+        ('archivo: reporte por año',
+         AccidenteArchivado.objects.order_by().filter(construir_filtros({'ano': hoy.year - 3}))),
+        ('archivo: fecha límite', AccidenteArchivado.objects.order_by('-fecha_accidente')[:1]),
+    ]
+
+
+def plan_de_consulta(queryset):
+    """Retorna las líneas de EXPLAIN QUERY PLAN del queryset en SQLite."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [fila[-1] for fila in cursor.fetchall()]
+
+
+def recorridos_completos(plan):
+    """Retorna las líneas del plan que recorren una tabla completa sin índice."""
+    return [linea for linea in plan if linea.startswith('SCAN ') and ' USING ' not in linea]
+
+
+class Command(BaseCommand):
+    """
+    Ejecuta EXPLAIN QUERY PLAN sobre las consultas frecuentes de accidentes y
+    falla si alguna recorre una tabla completa. Pensado para ejecutarse en la
+    integración continua después de aplicar las migraciones.
+    Uso: python manage.py verificar_planes_consulta [--detalle]
+    """
+    help = 'Verifica que las consultas frecuentes de accidentes usen índices.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--detalle', action='store_true', help='Muestra el plan de cada consulta.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('La verificación de planes solo está implementada para SQLite.')
+
+        fallidas = []
+        for nombre, queryset in consultas_frecuentes():
+            plan = plan_de_consulta(queryset)
+            problemas = recorridos_completos(plan)
+            if options['detalle']:
+                self.stdout.write(f'{nombre}:')
+                for linea in plan:
+                    self.stdout.write(f'    {linea}')
+            if problemas:
+                fallidas.append(nombre)
+                self.stderr.write(self.style.ERROR(f'{nombre}: {"; ".join(problemas)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{nombre}: OK'))
+
+        if fallidas:
+            raise CommandError(f'{len(fallidas)} consultas recorren tablas completas: {", ".join(fallidas)}')
@@ -0,0 +1,250 @@
+"""
+Métricas por vista de las peticiones: latencia, número de consultas SQL,
+tiempo total en SQL y consultas repetidas.
+Cada conexión a la base de datos, de cualquier alias y en cualquier hilo,
+lleva un execute_wrapper que suma la consulta al registro de la petición en
+curso, tomado de una variable de contexto. Así se cuentan también las
+consultas que el ORM asíncrono y sync_to_async ejecutan en otros hilos. La
+vista de métricas las publica en el formato de texto de Prometheus. Los
+valores se acumulan en memoria por proceso.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (segundos) de los buckets del histograma de latencia
+BUCKETS_LATENCIA = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Las peticiones con más consultas que este umbral se registran en el log
+UMBRAL_CONSULTAS = getattr(settings, 'METRICAS_UMBRAL_CONSULTAS', 50)
+
+# Huellas de SQL incluidas en el log de una petición que supera el umbral
+MAX_HUELLAS_LOG = 10
+
+_RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_RE_LISTA = re.compile(r'\((?:\s*(?:%s|\?|\$\d+)\s*,)+\s*(?:%s|\?|\$\d+)\s*\)')
+_RE_ESPACIOS = re.compile(r'\s+')
+
+
+def huella_sql(sql):
+    """
+    Retorna la forma normalizada de una consulta: sin literales, con las
+    listas de parámetros de IN reducidas a uno y los espacios compactados,
+    para agrupar las consultas que solo cambian en sus valores.
+    """
+    sql = _RE_TEXTO.sub('?', sql)
+    sql = _RE_NUMERO.sub('?', sql)
+    sql = _RE_LISTA.sub('(...)', sql)
+    return _RE_ESPACIOS.sub(' ', sql).strip()
+
+
+class MetricasVista:
+    """
+    Acumulado de las métricas de una vista.
+    """
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS_LATENCIA)
+        self.peticiones = 0
+        self.segundos = 0.0
+        self.consultas = 0
+        self.segundos_sql = 0.0
+        self.duplicadas = 0
+
+    def registrar(self, segundos, consultas, segundos_sql, duplicadas):
+        self.peticiones += 1
+        self.segundos += segundos
+        self.consultas += consultas
+        self.segundos_sql += segundos_sql
+        self.duplicadas += duplicadas
+        for i, limite in enumerate(BUCKETS_LATENCIA):
+            if segundos <= limite:
+                self.buckets[i] += 1
+
+
+# (nombre de la vista, método HTTP) -> MetricasVista
+_metricas = {}
+_bloqueo = threading.Lock()
+
+
+def registrar_peticion(vista, metodo, segundos, consultas, segundos_sql, duplicadas):
+    """Suma una petición terminada a las métricas de su vista."""
+    with _bloqueo:
+        metricas = _metricas.get((vista, metodo))
+        if metricas is None:
+            metricas = _metricas[(vista, metodo)] = MetricasVista()
+        metricas.registrar(segundos, consultas, segundos_sql, duplicadas)
+
+
+def _etiquetas(vista, metodo, **extra):
+    """Retorna el bloque de etiquetas de Prometheus de una serie."""
+    etiquetas = {'vista': vista, 'metodo': metodo, **extra}
+    partes = []
+    for nombre, valor in etiquetas.items():
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{nombre}="{valor}"')
+    return '{' + ','.join(partes) + '}'
+
+
+def texto_prometheus():
+    """Retorna todas las métricas acumuladas en el formato de texto de Prometheus."""
+    with _bloqueo:
+        copia = [
+            (clave, list(m.buckets), m.peticiones, m.segundos, m.consultas, m.segundos_sql, m.duplicadas)
+            for clave, m in sorted(_metricas.items())
+        ]
+
+    lineas = [
+        '# HELP formularios_peticion_segundos Latencia de las peticiones por vista.',
+        '# TYPE formularios_peticion_segundos histogram',
+    ]
+    for (vista, metodo), buckets, peticiones, segundos, *_ in copia:
+        for limite, cantidad in zip(BUCKETS_LATENCIA, buckets):
+            lineas.append(f'formularios_peticion_segundos_bucket{_etiquetas(vista, metodo, le=limite)} {cantidad}')
+        lineas.append(f'formularios_peticion_segundos_bucket{_etiquetas(vista, metodo, le="+Inf")} {peticiones}')
+        lineas.append(f'formularios_peticion_segundos_sum{_etiquetas(vista, metodo)} {segundos}')
+        lineas.append(f'formularios_peticion_segundos_count{_etiquetas(vista, metodo)} {peticiones}')
+
+    contadores = (
+        ('formularios_sql_consultas_total', 'Consultas SQL ejecutadas por vista.', 4),
+        ('formularios_sql_segundos_total', 'Tiempo total en SQL por vista.', 5),
+        ('formularios_sql_duplicadas_total', 'Consultas SQL repetidas en la misma petición por vista.', 6),
+    )
+    for nombre, ayuda, posicion in contadores:
+        lineas.append(f'# HELP {nombre} {ayuda}')
+        lineas.append(f'# TYPE {nombre} counter')
+        for fila in copia:
+            vista, metodo = fila[0]
+            lineas.append(f'{nombre}{_etiquetas(vista, metodo)} {fila[posicion]}')
+
+    return '\n'.join(lineas) + '\n'
+
+
+class RegistroConsultas:
+    """
+    Registro de las consultas de una petición: las mide y cuenta cuántas
+    veces se repite cada huella. Las consultas pueden llegar desde varios
+    hilos de la misma petición.
+    """
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+        self.huellas = Counter()
+        self._bloqueo = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            segundos = time.perf_counter() - inicio
+            with self._bloqueo:
+                self.segundos += segundos
+                self.consultas += 1
+                self.huellas[huella_sql(sql)] += 1
+
+    @property
+    def duplicadas(self):
+        """Consultas que repiten una huella ya ejecutada en la petición."""
+        return sum(cantidad - 1 for cantidad in self.huellas.values())
+
+
+# Registro de la petición en curso; sync_to_async lo lleva a sus hilos
+_registro_actual = contextvars.ContextVar('formularios_registro_consultas', default=None)
+
+
+def medir_consulta(execute, sql, params, many, context):
+    """execute_wrapper de todas las conexiones: suma la consulta al registro en curso, si lo hay."""
+    registro = _registro_actual.get()
+    if registro is None:
+        return execute(sql, params, many, context)
+    return registro(execute, sql, params, many, context)
+
+
+def instalar_medicion(conexion):
+    """Agrega medir_consulta a los execute_wrapper de la conexión si aún no lo tiene."""
+    if medir_consulta not in conexion.execute_wrappers:
+        conexion.execute_wrappers.append(medir_consulta)
+
+
+@receiver(connection_created)
+def _instalar_en_conexion_nueva(sender, connection, **kwargs):
+    instalar_medicion(connection)
+
+
+def nombre_vista(request):
+    """Retorna el nombre de la vista que atendió la petición."""
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is None:
+        return 'sin_vista'
+    return coincidencia.view_name or coincidencia._func_path
+
+
+class MetricasMiddleware:
+    """
+    Middleware que mide cada petición y registra sus métricas por vista.
+    Las peticiones que superan METRICAS_UMBRAL_CONSULTAS se escriben en el log
+    con las huellas de SQL más repetidas.
+    Admite peticiones síncronas y asíncronas, para no obligar a las vistas
+    asíncronas a pasar por un hilo bajo ASGI; en ambos casos se cuentan las
+    consultas de todos los hilos y alias de base de datos de la petición.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Las conexiones abiertas antes de importar este módulo no pasaron por connection_created
+        for conexion in connections.all(initialized_only=True):
+            instalar_medicion(conexion)
+        registro = RegistroConsultas()
+        token = _registro_actual.set(registro)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _registro_actual.reset(token)
+        self.registrar(request, registro, time.perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        registro = RegistroConsultas()
+        token = _registro_actual.set(registro)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _registro_actual.reset(token)
+        self.registrar(request, registro, time.perf_counter() - inicio)
+        return response
+
+    def registrar(self, request, registro, segundos):
+        vista = nombre_vista(request)
+        registrar_peticion(vista, request.method, segundos, registro.consultas, registro.segundos,
+                           registro.duplicadas)
+
+        if registro.consultas > UMBRAL_CONSULTAS:
+            huellas = '\n'.join(
+                f'  {cantidad} x {huella}' for huella, cantidad in registro.huellas.most_common(MAX_HUELLAS_LOG)
+            )
+            logger.warning(
+                '%s %s (%s) ejecutó %d consultas en %.3f s (%d repetidas):\n%s',
+                request.method, request.path, vista, registro.consultas, registro.segundos,
+                registro.duplicadas, huellas,
+            )
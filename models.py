@@ -2,11 +2,39 @@
 Modelos para la aplicación de formularios.
 Define los modelos para el registro de accidentes de tránsito y sus detalles.
 """
-from django.db import models
+import math
+import unicodedata
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models.functions import Greatest, TruncMonth
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from usuarios.models import Usuario
 
+
+def _nombre_miembro(codigo):
+    """Convierte un código de texto ('VEHICULO ESTACIONADO', 'VÍA') en nombre de miembro."""
+    if codigo == '-':
+        return 'NINGUNO'
+    sin_tildes = unicodedata.normalize('NFKD', codigo).encode('ascii', 'ignore').decode('ascii')
+    return sin_tildes.upper().replace(' ', '_')
+
+
+def opciones_enteras(nombre, opciones):
+    """
+    Crea un IntegerChoices a partir de la lista [(código, etiqueta)] de un
+    campo: cada opción se guarda como el entero de su posición (desde 1) y
+    conserva su código de texto en `codigos` ({valor: código}) y `valores`
+    ({código: valor}) para importar y exportar con los códigos históricos.
+    Las opciones nuevas se deben agregar al final para no cambiar los valores.
+    """
+    clase = models.IntegerChoices(nombre, [
+        (_nombre_miembro(codigo), (valor, etiqueta))
+        for valor, (codigo, etiqueta) in enumerate(opciones, start=1)
+    ])
+    clase.codigos = {valor: codigo for valor, (codigo, _) in enumerate(opciones, start=1)}
+    clase.valores = {codigo: valor for valor, codigo in clase.codigos.items()}
+    return clase
+
 class Agente(models.Model):
     """
     Modelo para almacenar información de los agentes responsables.
@@ -113,12 +141,109 @@ class HipotesisPasajero(models.Model):
     def __str__(self):
         return self.descripcion
 
+class DiasEntre(models.Func):
+    """
+    Expresión con los días enteros entre dos fechas (fin - inicio),
+    calculados en la base de datos.
+    """
+    output_field = models.IntegerField()
+    
+    def __init__(self, fin, inicio, **extra):
+        super().__init__(fin, inicio, **extra)
+    
+    def _compilar(self, compiler):
+        fin, inicio = self.get_source_expressions()
+        sql_fin, params_fin = compiler.compile(fin)
+        sql_inicio, params_inicio = compiler.compile(inicio)
+        return sql_fin, sql_inicio, (*params_fin, *params_inicio)
+    
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL y Oracle restan fechas directamente
+        fin, inicio, params = self._compilar(compiler)
+        return f'({fin} - {inicio})', params
+    
+    def as_sqlite(self, compiler, connection, **extra_context):
+        fin, inicio, params = self._compilar(compiler)
+        return f'CAST(julianday({fin}) - julianday({inicio}) AS INTEGER)', params
+    
+    def as_mysql(self, compiler, connection, **extra_context):
+        fin, inicio, params = self._compilar(compiler)
+        return f'DATEDIFF({fin}, {inicio})', params
+
+class AccidenteQuerySet(models.QuerySet):
+    """
+    QuerySet de accidentes con cálculos de entrega hechos en SQL.
+    """
+    def con_dias_retraso(self):
+        """
+        Anota `retraso_entrega`: días de retraso en la entrega del informe
+        (0 si se entregó a tiempo), equivalente a la propiedad dias_retraso.
+        """
+        retraso = models.ExpressionWrapper(
+            DiasEntre(models.F('fecha_real_entrega'), models.F('fecha_accidente'))
+            - models.F('dias_establecidos_entrega'),
+            output_field=models.IntegerField(),
+        )
+        return self.annotate(retraso_entrega=Greatest(retraso, models.Value(0)))
+    
+    def con_retraso(self):
+        """Filtra los accidentes cuyo informe se entregó tarde."""
+        return self.con_dias_retraso().filter(retraso_entrega__gt=0)
+    
+    def reporte_sla_agentes(self):
+        """
+        Retorna, por agente y mes, el total de informes, los entregados tarde,
+        el retraso promedio y el percentil 95 del retraso (en días).
+        Se calcula con una sola consulta agrupada por (agente, mes, retraso):
+        los retrasos son enteros pequeños, así que el histograma resultante es
+        compacto y permite obtener el percentil exacto.
+        """
+        histograma = self.order_by().con_dias_retraso().annotate(
+            mes=TruncMonth('fecha_accidente'),
+        ).values(
+            'agente_responsable_id', 'agente_responsable__nombre', 'mes', 'retraso_entrega',
+        ).annotate(
+            cantidad=models.Count('id'),
+        ).order_by('mes', 'agente_responsable__nombre', 'retraso_entrega')
+        
+        grupos = {}
+        for fila in histograma:
+            clave = (fila['mes'], fila['agente_responsable_id'])
+            grupo = grupos.setdefault(clave, {
+                'mes': fila['mes'],
+                'agente_id': fila['agente_responsable_id'],
+                'agente': fila['agente_responsable__nombre'],
+                'histograma': [],
+            })
+            grupo['histograma'].append((fila['retraso_entrega'], fila['cantidad']))
+        
+        reporte = []
+        for grupo in grupos.values():
+            histograma_grupo = grupo.pop('histograma')
+            total = sum(cantidad for _, cantidad in histograma_grupo)
+            # Percentil 95 por rango más cercano sobre el histograma ordenado
+            limite = math.ceil(0.95 * total)
+            acumulado, p95 = 0, 0
+            for retraso, cantidad in histograma_grupo:
+                acumulado += cantidad
+                if acumulado >= limite:
+                    p95 = retraso
+                    break
+            grupo.update({
+                'total_informes': total,
+                'entregados_tarde': sum(cantidad for retraso, cantidad in histograma_grupo if retraso > 0),
+                'retraso_promedio': sum(retraso * cantidad for retraso, cantidad in histograma_grupo) / total,
+                'retraso_p95': p95,
+            })
+            reporte.append(grupo)
+        return reporte
+
 class Accidente(models.Model):
     """
     Modelo principal para almacenar la información de accidentes de tránsito.
     """
     # Opciones para campos de selección
-    VIA_CHOICES = [
+    Via = opciones_enteras('Via', [
         ('CALLE', 'Calle'),
         ('CARRERA', 'Carrera'),
         ('DIAGONAL', 'Diagonal'),
@@ -130,46 +255,52 @@ class Accidente(models.Model):
         ('KILOMETRO', 'Kilometro'),
         ('TRANSVERSAL', 'Transversal'),
         ('VÍA', 'Vía'),
-    ]
+    ])
+    VIA_CHOICES = Via.choices
     
-    AREA_CHOICES = [
+    Area = opciones_enteras('Area', [
         ('URBANA', 'Urbana'),
         ('RURAL', 'Rural'),
-    ]
+    ])
+    AREA_CHOICES = Area.choices
     
-    COMPLEMENTO_2_CHOICES = [
+    Complemento2 = opciones_enteras('Complemento2', [
         ('-', '-'),
         ('CARRERA', 'Carrera'),
         ('DIAGONAL', 'Diagonal'),
         ('CALLE', 'Calle'),
         ('TRANSVERSAL', 'Transversal'),
         ('ENTRE', 'Entre'),
-    ]
+    ])
+    COMPLEMENTO_2_CHOICES = Complemento2.choices
     
-    ACCIDENT_CLASS_CHOICES = [
+    ClaseAccidente = opciones_enteras('ClaseAccidente', [
         ('ATROPELLO', 'Atropello'),
         ('CAIDA', 'Caída'),
         ('COLISIÓN', 'Colisión'),
         ('CHOQUE', 'Choque'),
         ('VOLCAMIENTO', 'Volcamiento'),
-        ('OTRO', 'Otro')
-    ]
+        ('OTRO', 'Otro'),
+    ])
+    ACCIDENT_CLASS_CHOICES = ClaseAccidente.choices
     
-    ROAD_TYPE_CHOICES = [
+    TipoVia = opciones_enteras('TipoVia', [
         ('RURAL', 'Rural'),
         ('URBANA', 'Urbana'),
         ('NACIONAL', 'Nacional'),
         ('DEPARTAMENTAL', 'Departamental'),
-        ('MUNICIPAL', 'Municipal')
-    ]
+        ('MUNICIPAL', 'Municipal'),
+    ])
+    ROAD_TYPE_CHOICES = TipoVia.choices
     
-    COLLISION_TYPE_CHOICES = [
+    ChoqueCon = opciones_enteras('ChoqueCon', [
         ('VEHICULO', 'Vehículo'),
         ('SEMOVIENTE', 'Semoviente'),
-        ('OBJETO FIJO', 'Objeto Fijo')
-    ]
+        ('OBJETO FIJO', 'Objeto Fijo'),
+    ])
+    COLLISION_TYPE_CHOICES = ChoqueCon.choices
     
-    FIXED_OBJECT_CHOICES = [
+    ObjetoFijo = opciones_enteras('ObjetoFijo', [
         ('MURO', 'Muro'),
         ('POSTE', 'Poste'),
         ('ARBOL', 'Árbol'),
@@ -182,15 +313,17 @@ class Accidente(models.Model):
         ('TARIMA', 'Tarima'),
         ('CASETA', 'Caseta'),
         ('VEHICULO ESTACIONADO', 'Vehículo Estacionado'),
-        ('OTRO', 'Otro')
-    ]
+        ('OTRO', 'Otro'),
+    ])
+    FIXED_OBJECT_CHOICES = ObjetoFijo.choices
     
-    REMITIDO_A_CHOICES = [
+    RemitidoA = opciones_enteras('RemitidoA', [
         ('FISCALIA', 'Fiscalía'),
         ('TRANSITO', 'Tránsito'),
         ('TRANSITO Y FISCALIA', 'Tránsito y Fiscalía'),
         ('OTRO', 'Otro'),
-    ]
+    ])
+    REMITIDO_A_CHOICES = RemitidoA.choices
     
     # Usuario que registra el accidente
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='accidentes_registrados')
@@ -204,6 +337,7 @@ class Accidente(models.Model):
                                                            verbose_name='Días Establecidos para Entrega')
     fecha_real_entrega = models.DateField(blank=False, null=False, verbose_name='Fecha Real de Entrega')
     fecha_registro = models.DateTimeField(default=timezone.now, verbose_name='Fecha de Registro')
+    fecha_modificacion = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Fecha de Modificación')
     
     # Tipo de accidente
     total_vehiculos_involucrados = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1), MaxValueValidator(10)], 
@@ -213,25 +347,25 @@ class Accidente(models.Model):
     con_danos_materiales = models.BooleanField(default=False, verbose_name='Con Daños Materiales')
     
     # Ubicación
-    via = models.CharField(max_length=20, choices=VIA_CHOICES, verbose_name='Tipo de Vía')
+    via = models.PositiveSmallIntegerField(choices=VIA_CHOICES, verbose_name='Tipo de Vía')
     numero_via = models.CharField(max_length=20, verbose_name='Número Vía')
     complemento1 = models.CharField(max_length=50, blank=True, null=True, verbose_name='Complemento 1')
-    complemento2 = models.CharField(max_length=20, choices=COMPLEMENTO_2_CHOICES, blank=True, null=True, verbose_name='Complemento 2')
+    complemento2 = models.PositiveSmallIntegerField(choices=COMPLEMENTO_2_CHOICES, blank=True, null=True, verbose_name='Complemento 2')
     otra_informacion_direccion = models.CharField(max_length=255, blank=True, null=True, verbose_name='Otra información de dirección')
     
-    area = models.CharField(max_length=10, choices=AREA_CHOICES, verbose_name='Área')
+    area = models.PositiveSmallIntegerField(choices=AREA_CHOICES, verbose_name='Área')
     zat = models.ForeignKey(ZAT, on_delete=models.SET_NULL, blank=True, null=True, verbose_name='ZAT')
     barrio = models.ForeignKey(Barrio, on_delete=models.SET_NULL, blank=True, null=True, verbose_name='Barrio')
     centro_poblado_vereda = models.ForeignKey(CentroPobladoVereda, on_delete=models.SET_NULL, blank=True, null=True, 
                                              verbose_name='Centro Poblado/Vereda')
     
     # Detalles del accidente
-    clase_accidente = models.CharField(max_length=20, choices=ACCIDENT_CLASS_CHOICES, verbose_name='Clase de Accidente')
+    clase_accidente = models.PositiveSmallIntegerField(choices=ACCIDENT_CLASS_CHOICES, verbose_name='Clase de Accidente')
     otro_clase_accidente = models.CharField(max_length=50, blank=True, null=True, verbose_name='Otra Clase de Accidente')
-    tipo_via = models.CharField(max_length=20, choices=ROAD_TYPE_CHOICES, verbose_name='Tipo de Vía')
+    tipo_via = models.PositiveSmallIntegerField(choices=ROAD_TYPE_CHOICES, verbose_name='Tipo de Vía')
     
-    choque_con = models.CharField(max_length=20, choices=COLLISION_TYPE_CHOICES, blank=True, null=True, verbose_name='Choque Con')
-    objeto_fijo = models.CharField(max_length=30, choices=FIXED_OBJECT_CHOICES, blank=True, null=True, verbose_name='Objeto Fijo')
+    choque_con = models.PositiveSmallIntegerField(choices=COLLISION_TYPE_CHOICES, blank=True, null=True, verbose_name='Choque Con')
+    objeto_fijo = models.PositiveSmallIntegerField(choices=FIXED_OBJECT_CHOICES, blank=True, null=True, verbose_name='Objeto Fijo')
     otro_objeto_fijo = models.CharField(max_length=50, blank=True, null=True, verbose_name='Otro Objeto Fijo')
     
     # Hipótesis
@@ -267,33 +401,46 @@ class Accidente(models.Model):
     hipotesis_pasajero2 = models.ForeignKey(HipotesisPasajero, on_delete=models.SET_NULL, blank=True, null=True, 
                                      related_name='accidentes_hipotesis_secundaria', verbose_name='Hipótesis Secundaria Pasajero')
     # Información adicional
-    remitido_a = models.CharField(max_length=30, choices=REMITIDO_A_CHOICES, blank=True, null=True, verbose_name='Remitido a')
+    remitido_a = models.PositiveSmallIntegerField(choices=REMITIDO_A_CHOICES, blank=True, null=True, verbose_name='Remitido a')
     croquis_pdf = models.FileField(upload_to='croquis/', blank=True, null=True, verbose_name='Croquis (PDF)')
     
+    objects = AccidenteQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Accidente'
         verbose_name_plural = 'Accidentes'
-        ordering = ['-fecha_accidente', '-hora_accidente']
+        ordering = ['-fecha_accidente', '-hora_accidente', '-id']
+        indexes = [
+            # Orden de la lista, paginación por cursor, dashboard y date_hierarchy del admin
+            models.Index(fields=['-fecha_accidente', '-hora_accidente', '-id'], name='accidente_orden_idx'),
+            # Filtros de reportes por agente o área dentro de un rango de fechas
+            models.Index(fields=['agente_responsable', 'fecha_accidente'], name='accidente_agente_fecha_idx'),
+            models.Index(fields=['area', 'fecha_accidente'], name='accidente_area_fecha_idx'),
+            # list_filter del admin, ordenado por fecha
+            models.Index(fields=['clase_accidente', 'fecha_accidente'], name='accidente_clase_fecha_idx'),
+            models.Index(fields=['con_heridos', 'fecha_accidente'], name='accidente_heridos_fecha_idx'),
+            models.Index(fields=['con_muertos', 'fecha_accidente'], name='accidente_muertos_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"Accidente #{self.numero_ipat} - {self.fecha_accidente}"
     
     def get_direccion_completa(self):
         """Retorna la dirección completa del accidente."""
-        direccion = f"{self.via} {self.numero_via}"
+        direccion = f"{self.Via.codigos.get(self.via, '')} {self.numero_via}"
         if self.complemento1:
             direccion += f" {self.complemento1}"
-        if self.complemento2 and self.complemento2 != '-':
-            direccion += f" {self.complemento2}"
+        if self.complemento2 and self.complemento2 != self.Complemento2.NINGUNO:
+            direccion += f" {self.Complemento2.codigos.get(self.complemento2, '')}"
         if self.otra_informacion_direccion:
             direccion += f" {self.otra_informacion_direccion}"
         return direccion
     
     def get_ubicacion(self):
         """Retorna la ubicación (barrio o centro poblado) del accidente."""
-        if self.area == 'URBANA' and self.barrio:
+        if self.area == self.Area.URBANA and self.barrio:
             return self.barrio.nombre
-        elif self.area == 'RURAL' and self.centro_poblado_vereda:
+        elif self.area == self.Area.RURAL and self.centro_poblado_vereda:
             return self.centro_poblado_vereda.nombre
         return "No especificado"
     
@@ -308,8 +455,8 @@ class Accidente(models.Model):
         
         fecha_establecida = self.fecha_accidente + timezone.timedelta(days=self.dias_establecidos_entrega)
         
-        if self.fecha_real_entrega > fecha_establecida.date():
-            return (self.fecha_real_entrega - fecha_establecida.date()).days
+        if self.fecha_real_entrega > fecha_establecida:
+            return (self.fecha_real_entrega - fecha_establecida).days
         return 0
 
 class VehiculoInvolucrado(models.Model):
@@ -317,14 +464,15 @@ class VehiculoInvolucrado(models.Model):
     Modelo para almacenar información de los vehículos involucrados en un accidente.
     """
     # Opciones para campos de selección
-    SERVICE_TYPE_CHOICES = [
+    TipoServicio = opciones_enteras('TipoServicio', [
         ('PARTICULAR', 'Particular'),
         ('PUBLICO', 'Público'),
         ('OFICIAL', 'Oficial'),
-        ('DIPLOMATICO', 'Diplomático')
-    ]
+        ('DIPLOMATICO', 'Diplomático'),
+    ])
+    SERVICE_TYPE_CHOICES = TipoServicio.choices
     
-    VEHICLE_CLASS_CHOICES = [
+    ClaseVehiculo = opciones_enteras('ClaseVehiculo', [
         ('AUTOMOVIL', 'Automóvil'),
         ('BUS', 'Bus'),
         ('BUSETA', 'Buseta'),
@@ -341,61 +489,67 @@ class VehiculoInvolucrado(models.Model):
         ('VOLQUETA', 'Volqueta'),
         ('VEHICULO TRACCION ANIMAL', 'Vehículo de Tracción Animal'),
         ('FUGA DE VEHICULO', 'Fuga de Vehículo'),
-        ('VEHICULO FANTASMA', 'Vehículo Fantasma')
-    ]
+        ('VEHICULO FANTASMA', 'Vehículo Fantasma'),
+    ])
+    VEHICLE_CLASS_CHOICES = ClaseVehiculo.choices
     
-    GENDER_CHOICES = [
+    Genero = opciones_enteras('Genero', [
         ('MASCULINO', 'Masculino'),
-        ('FEMENINO', 'Femenino')
-    ]
+        ('FEMENINO', 'Femenino'),
+    ])
+    GENDER_CHOICES = Genero.choices
     
-    AGE_RANGE_CHOICES = [
+    RangoEdad = opciones_enteras('RangoEdad', [
         ('PRIMERA INFANCIA', 'Primera Infancia (0-5 años)'),
         ('INFANCIA', 'Infancia (6-11 años)'),
         ('ADOLESCENCIA', 'Adolescencia (12-18 años)'),
         ('JUVENTUD', 'Juventud (14-26 años)'),
         ('ADULTEZ', 'Adultez (27-59 años)'),
-        ('PERSONA MAYOR', 'Persona Mayor (60 años o más)')
-    ]
+        ('PERSONA MAYOR', 'Persona Mayor (60 años o más)'),
+    ])
+    AGE_RANGE_CHOICES = RangoEdad.choices
     
-    INJURED_TYPE_CHOICES = [
+    TipoPersona = opciones_enteras('TipoPersona', [
         ('PEATON', 'Peatón'),
         ('CONDUCTOR', 'Conductor'),
         ('ACOMPAÑANTE', 'Acompañante'),
         ('PASAJERO', 'Pasajero'),
-        ('NO APLICA', 'No Aplica')
-    ]
+        ('NO APLICA', 'No Aplica'),
+    ])
+    INJURED_TYPE_CHOICES = TipoPersona.choices
     
-    BOOLEAN_CHOICES = [
+    SiNo = opciones_enteras('SiNo', [
         ('SI', 'Sí'),
         ('NO', 'No'),
-        ('NO APLICA', 'No Aplica')
-    ]
+        ('NO APLICA', 'No Aplica'),
+    ])
+    BOOLEAN_CHOICES = SiNo.choices
     
-    INTOXICATION_LEVEL_CHOICES = [
+    GradoEmbriaguez = opciones_enteras('GradoEmbriaguez', [
         ('GRADO 1', 'Grado 1'),
         ('GRADO 2', 'Grado 2'),
-        ('GRADO 3', 'Grado 3')
-    ]
+        ('GRADO 3', 'Grado 3'),
+    ])
+    INTOXICATION_LEVEL_CHOICES = GradoEmbriaguez.choices
     
     # Relación con el accidente
     accidente = models.ForeignKey(Accidente, on_delete=models.CASCADE, related_name='vehiculos')
     
     # Información del vehículo
-    tipo_servicio = models.CharField(max_length=20, choices=SERVICE_TYPE_CHOICES, verbose_name='Tipo de Servicio')
-    clase_vehiculo = models.CharField(max_length=30, choices=VEHICLE_CLASS_CHOICES, verbose_name='Clase de Vehículo')
+    tipo_servicio = models.PositiveSmallIntegerField(choices=SERVICE_TYPE_CHOICES, verbose_name='Tipo de Servicio')
+    clase_vehiculo = models.PositiveSmallIntegerField(choices=VEHICLE_CLASS_CHOICES, verbose_name='Clase de Vehículo')
     
     # Información del conductor
-    genero_involucrado = models.CharField(max_length=10, choices=GENDER_CHOICES, verbose_name='Género Involucrado')
-    rango_edad_involucrado = models.CharField(max_length=20, choices=AGE_RANGE_CHOICES, verbose_name='Rango de Edad Involucrado')
+    genero_involucrado = models.PositiveSmallIntegerField(choices=GENDER_CHOICES, verbose_name='Género Involucrado')
+    rango_edad_involucrado = models.PositiveSmallIntegerField(choices=AGE_RANGE_CHOICES, verbose_name='Rango de Edad Involucrado')
     
     # Información de heridos y fallecidos
-    heridos = models.CharField(max_length=20, choices=INJURED_TYPE_CHOICES, verbose_name='Heridos')
-    fallecidos = models.CharField(max_length=20, choices=INJURED_TYPE_CHOICES, verbose_name='Fallecidos')
+    heridos = models.PositiveSmallIntegerField(choices=INJURED_TYPE_CHOICES, verbose_name='Heridos')
+    fallecidos = models.PositiveSmallIntegerField(choices=INJURED_TYPE_CHOICES, verbose_name='Fallecidos')
     
     # Información de embriaguez
-    embriaguez_conductor = models.CharField(max_length=10, choices=BOOLEAN_CHOICES, verbose_name='Embriaguez del Conductor')
-    grado_embriaguez = models.CharField(max_length=10, choices=INTOXICATION_LEVEL_CHOICES, blank=True, null=True, 
+    embriaguez_conductor = models.PositiveSmallIntegerField(choices=BOOLEAN_CHOICES, verbose_name='Embriaguez del Conductor')
+    grado_embriaguez = models.PositiveSmallIntegerField(choices=INTOXICATION_LEVEL_CHOICES, blank=True, null=True, 
                                        verbose_name='Grado de Embriaguez')
     
     # Conteo de víctimas
@@ -403,15 +557,17 @@ class VehiculoInvolucrado(models.Model):
     numero_fallecidos = models.PositiveIntegerField(default=0, verbose_name='Número de Fallecidos')
     
     # Información de heridos que fallecen después
-    herido1_fallece_despues = models.CharField(max_length=10, choices=BOOLEAN_CHOICES, blank=True, null=True, 
+    herido1_fallece_despues = models.PositiveSmallIntegerField(choices=BOOLEAN_CHOICES, blank=True, null=True, 
                                               verbose_name='Herido 1 Fallece Después')
-    herido2_fallece_despues = models.CharField(max_length=10, choices=BOOLEAN_CHOICES, blank=True, null=True, 
+    herido2_fallece_despues = models.PositiveSmallIntegerField(choices=BOOLEAN_CHOICES, blank=True, null=True, 
                                               verbose_name='Herido 2 Fallece Después')
-    herido3_fallece_despues = models.CharField(max_length=10, choices=BOOLEAN_CHOICES, blank=True, null=True, 
+    herido3_fallece_despues = models.PositiveSmallIntegerField(choices=BOOLEAN_CHOICES, blank=True, null=True, 
                                               verbose_name='Herido 3 Fallece Después')
-    herido4_fallece_despues = models.CharField(max_length=10, choices=BOOLEAN_CHOICES, blank=True, null=True, 
+    herido4_fallece_despues = models.PositiveSmallIntegerField(choices=BOOLEAN_CHOICES, blank=True, null=True, 
                                               verbose_name='Herido 4 Fallece Después')
     
+    fecha_modificacion = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Fecha de Modificación')
+    
     class Meta:
         verbose_name = 'Vehículo Involucrado'
         verbose_name_plural = 'Vehículos Involucrados'
@@ -427,10 +583,575 @@ class Fallecido(models.Model):
     vehiculo = models.ForeignKey(VehiculoInvolucrado, on_delete=models.CASCADE, related_name='ocupantes_fallecidos')
     nombre_apellidos = models.CharField(max_length=100, verbose_name='Nombre y Apellidos')
     direccion = models.CharField(max_length=255, verbose_name='Dirección')
+    fecha_modificacion = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Fecha de Modificación')
     
     class Meta:
         verbose_name = 'Fallecido'
         verbose_name_plural = 'Fallecidos'
     
     def __str__(self):
-        return f"{self.nombre_apellidos} - {self.vehiculo.accidente.numero_ipat}"
\ No newline at end of file
+        return f"{self.nombre_apellidos} - {self.vehiculo.accidente.numero_ipat}"
+
+class RegistroEliminacion(models.Model):
+    """
+    Modelo con una marca por cada accidente, vehículo o fallecido eliminado,
+    para que la exportación incremental informe también las eliminaciones.
+    """
+    TABLA_CHOICES = [
+        ('accidentes', 'Accidentes'),
+        ('vehiculos', 'Vehículos'),
+        ('fallecidos', 'Fallecidos'),
+    ]
+    
+    tabla = models.CharField(max_length=20, choices=TABLA_CHOICES, verbose_name='Tabla')
+    registro_id = models.PositiveIntegerField(verbose_name='Id del Registro')
+    fecha_eliminacion = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Fecha de Eliminación')
+    
+    class Meta:
+        verbose_name = 'Registro de Eliminación'
+        verbose_name_plural = 'Registros de Eliminación'
+        ordering = ['fecha_eliminacion', 'id']
+    
+    def __str__(self):
+        return f"{self.tabla} {self.registro_id} - {self.fecha_eliminacion}"
+    
+    @classmethod
+    def purgar(cls, antes_de):
+        """Elimina las marcas anteriores a la fecha, ya sincronizadas por todos los consumidores."""
+        return cls.objects.filter(fecha_eliminacion__lt=antes_de).delete()[0]
+
+class InconsistenciaAccidente(models.Model):
+    """
+    Modelo con las inconsistencias entre los registros de un accidente
+    encontradas por la auditoría (auditoria.py), una fila por accidente y
+    regla incumplida. Se reemplazan en cada ejecución de auditar_accidentes.
+    """
+    accidente = models.ForeignKey(Accidente, on_delete=models.CASCADE, related_name='inconsistencias')
+    regla = models.CharField(max_length=40, verbose_name='Regla')
+    detalle = models.CharField(max_length=255, blank=True, default='', verbose_name='Detalle')
+    fecha_deteccion = models.DateTimeField(default=timezone.now, verbose_name='Fecha de Detección')
+    
+    class Meta:
+        verbose_name = 'Inconsistencia de Accidente'
+        verbose_name_plural = 'Inconsistencias de Accidentes'
+        ordering = ['regla', 'accidente']
+        constraints = [
+            models.UniqueConstraint(fields=['accidente', 'regla'], name='inconsistencia_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['regla', 'fecha_deteccion'], name='inconsistencia_regla_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.regla} - {self.accidente_id}"
+
+
+class TrabajoReporte(models.Model):
+    """
+    Modelo para la cola de generación de reportes en segundo plano.
+    Cada trabajo se identifica por el hash de sus filtros normalizados, de modo
+    que las solicitudes repetidas reutilizan el archivo ya generado.
+    """
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_PROCESO', 'En proceso'),
+        ('TERMINADO', 'Terminado'),
+        ('VENCIDO', 'Vencido'),
+        ('ERROR', 'Error'),
+    ]
+    
+    clave = models.CharField(max_length=64, unique=True, verbose_name='Clave de Filtros')
+    filtros = models.JSONField(default=dict, verbose_name='Filtros')
+    
+    # Rango de fechas cubierto por los filtros; nulo cuando no está acotado
+    fecha_desde = models.DateField(blank=True, null=True, verbose_name='Fecha Desde')
+    fecha_hasta = models.DateField(blank=True, null=True, verbose_name='Fecha Hasta')
+    
+    estado = models.CharField(max_length=15, choices=ESTADO_CHOICES, default='PENDIENTE', db_index=True,
+                              verbose_name='Estado')
+    # Se incrementa cada vez que cambia un accidente dentro del rango
+    version = models.PositiveIntegerField(default=0, verbose_name='Versión')
+    progreso = models.PositiveIntegerField(default=0, validators=[MaxValueValidator(100)], verbose_name='Progreso (%)')
+    total_filas = models.PositiveIntegerField(default=0, verbose_name='Total Filas')
+    archivo = models.FileField(upload_to='reportes/', blank=True, null=True, verbose_name='Archivo')
+    error = models.TextField(blank=True, default='', verbose_name='Error')
+    
+    usuario = models.ForeignKey(Usuario, on_delete=models.SET_NULL, blank=True, null=True,
+                                related_name='trabajos_reporte', verbose_name='Solicitado por')
+    fecha_creacion = models.DateTimeField(default=timezone.now, verbose_name='Fecha de Creación')
+    fecha_finalizacion = models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Finalización')
+    # Lo actualiza el worker mientras genera el archivo; si se detiene, el trabajo vuelve a la cola
+    fecha_latido = models.DateTimeField(blank=True, null=True, verbose_name='Último Latido del Worker')
+    
+    class Meta:
+        verbose_name = 'Trabajo de Reporte'
+        verbose_name_plural = 'Trabajos de Reporte'
+        ordering = ['fecha_creacion']
+    
+    def __str__(self):
+        return f"Reporte {self.pk} - {self.get_estado_display()}"
+    
+    @classmethod
+    def invalidar_fechas(cls, *fechas):
+        """
+        Marca como vencidos los reportes cuyo rango incluye alguna de las fechas.
+        Los trabajos en proceso aumentan su versión para que el worker los repita.
+        """
+        for fecha in {f for f in fechas if f}:
+            cls.invalidar_rango(fecha, fecha)
+    
+    @classmethod
+    def invalidar_rango(cls, desde, hasta):
+        """Invalida los reportes cuyo rango se cruza con el rango [desde, hasta]."""
+        cls.objects.filter(
+            models.Q(fecha_desde__isnull=True) | models.Q(fecha_desde__lte=hasta),
+            models.Q(fecha_hasta__isnull=True) | models.Q(fecha_hasta__gte=desde),
+        ).update(
+            version=models.F('version') + 1,
+            estado=models.Case(
+                models.When(estado='TERMINADO', then=models.Value('VENCIDO')),
+                default=models.F('estado'),
+            ),
+        )
+
+
+class ControlImportacion(models.Model):
+    """
+    Modelo con el avance de una importación masiva de IPAT: filas procesadas
+    de cada archivo. Se actualiza en la misma transacción que inserta cada
+    bloque, de modo que al reanudar nunca se repite ni se salta un bloque.
+    """
+    clave = models.CharField(max_length=255, unique=True, verbose_name='Clave')
+    accidentes = models.PositiveIntegerField(default=0, verbose_name='Filas de Accidentes')
+    vehiculos = models.PositiveIntegerField(default=0, verbose_name='Filas de Vehículos')
+    fallecidos = models.PositiveIntegerField(default=0, verbose_name='Filas de Fallecidos')
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')
+    
+    class Meta:
+        verbose_name = 'Control de Importación'
+        verbose_name_plural = 'Controles de Importación'
+    
+    def __str__(self):
+        return self.clave
+
+
+class ResumenDiarioAccidentes(models.Model):
+    """
+    Modelo con el conteo diario de accidentes por área, clase y agente.
+    Se mantiene de forma incremental desde las señales de Accidente y se puede
+    reconstruir con el comando reconstruir_resumen_accidentes.
+    """
+    fecha = models.DateField(verbose_name='Fecha')
+    area = models.PositiveSmallIntegerField(choices=Accidente.AREA_CHOICES, verbose_name='Área')
+    clase_accidente = models.PositiveSmallIntegerField(choices=Accidente.ACCIDENT_CLASS_CHOICES,
+                                       verbose_name='Clase de Accidente')
+    agente_responsable = models.ForeignKey(Agente, on_delete=models.CASCADE, related_name='resumenes_diarios',
+                                           verbose_name='Agente Responsable')
+    
+    total_accidentes = models.PositiveIntegerField(default=0, verbose_name='Total Accidentes')
+    con_heridos = models.PositiveIntegerField(default=0, verbose_name='Accidentes con Heridos')
+    con_muertos = models.PositiveIntegerField(default=0, verbose_name='Accidentes con Muertos')
+    
+    class Meta:
+        verbose_name = 'Resumen Diario de Accidentes'
+        verbose_name_plural = 'Resúmenes Diarios de Accidentes'
+        ordering = ['-fecha']
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'area', 'clase_accidente', 'agente_responsable'],
+                                    name='resumen_diario_unico'),
+        ]
+    
+    def __str__(self):
+        return f"{self.fecha} - {self.area} - {self.clase_accidente}: {self.total_accidentes}"
+    
+    @staticmethod
+    def clave_de(valores):
+        """Retorna la clave del resumen a partir de los valores de un accidente."""
+        return {
+            'fecha': valores['fecha_accidente'],
+            'area': valores['area'],
+            'clase_accidente': valores['clase_accidente'],
+            'agente_responsable_id': valores['agente_responsable_id'],
+        }
+    
+    @classmethod
+    def ajustar(cls, valores, signo):
+        """
+        Suma (signo > 0) o resta (signo < 0) abs(signo) accidentes con los
+        mismos valores al resumen de su día.
+        """
+        clave = cls.clave_de(valores)
+        cambios = {
+            'total_accidentes': signo,
+            'con_heridos': signo if valores['con_heridos'] else 0,
+            'con_muertos': signo if valores['con_muertos'] else 0,
+        }
+        with transaction.atomic():
+            actualizados = cls.objects.filter(**clave).update(
+                **{campo: models.F(campo) + cambio for campo, cambio in cambios.items()}
+            )
+            if not actualizados and signo > 0:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(**clave, **cambios)
+                except IntegrityError:
+                    # Otra petición creó el resumen al mismo tiempo
+                    cls.objects.filter(**clave).update(
+                        **{campo: models.F(campo) + cambio for campo, cambio in cambios.items()}
+                    )
+            elif signo < 0:
+                cls.objects.filter(**clave, total_accidentes=0).delete()
+    
+    @classmethod
+    def reconstruir(cls):
+        """
+        Reconstruye todos los resúmenes a partir de las tablas de accidentes
+        activos y archivados. Retorna el número de resúmenes creados.
+        """
+        campos = ('fecha_accidente', 'area', 'clase_accidente', 'agente_responsable_id')
+        totales = {}
+        for modelo in (Accidente, AccidenteArchivado):
+            filas = modelo.objects.order_by().values(*campos).annotate(
+                total=models.Count('id'),
+                heridos=models.Count('id', filter=models.Q(con_heridos=True)),
+                muertos=models.Count('id', filter=models.Q(con_muertos=True)),
+            )
+            # Un mismo día puede tener accidentes en ambas tablas
+            for fila in filas.iterator():
+                clave = tuple(fila[campo] for campo in campos)
+                total, heridos, muertos = totales.get(clave, (0, 0, 0))
+                totales[clave] = (total + fila['total'], heridos + fila['heridos'], muertos + fila['muertos'])
+        with transaction.atomic():
+            cls.objects.all().delete()
+            resumenes = cls.objects.bulk_create(
+                (
+                    cls(
+                        **cls.clave_de(dict(zip(campos, clave))),
+                        total_accidentes=total,
+                        con_heridos=heridos,
+                        con_muertos=muertos,
+                    )
+                    for clave, (total, heridos, muertos) in totales.items()
+                ),
+                batch_size=1000,
+            )
+        return len(resumenes)
+
+
+class AccidenteHipotesisQuerySet(models.QuerySet):
+    """
+    QuerySet de hipótesis citadas en accidentes, con consultas analíticas.
+    """
+    def frecuencias(self, categoria=None):
+        """
+        Retorna cuántos accidentes citan cada hipótesis, de la más a la menos
+        frecuente, con su descripción. Es un solo GROUP BY sobre el índice
+        (categoria, hipotesis_id, accidente).
+        """
+        enlaces = self.order_by()
+        if categoria:
+            enlaces = enlaces.filter(categoria=categoria)
+        filas = list(
+            enlaces.values('categoria', 'hipotesis_id')
+            .annotate(total_accidentes=models.Count('accidente_id', distinct=True))
+            .order_by('-total_accidentes', 'categoria', 'hipotesis_id')
+        )
+
+        # Resolver las descripciones con una consulta por categoría presente
+        descripciones = {}
+        for cat in {fila['categoria'] for fila in filas}:
+            modelo = AccidenteHipotesis.MODELOS[cat]
+            ids = [fila['hipotesis_id'] for fila in filas if fila['categoria'] == cat]
+            for pk, descripcion in modelo.objects.filter(pk__in=ids).values_list('pk', 'descripcion'):
+                descripciones[(cat, pk)] = descripcion
+        for fila in filas:
+            fila['descripcion'] = descripciones.get((fila['categoria'], fila['hipotesis_id']), '')
+        return filas
+
+    def entre_fechas(self, desde=None, hasta=None):
+        """Filtra las hipótesis de los accidentes ocurridos en el rango indicado."""
+        enlaces = self
+        if desde:
+            enlaces = enlaces.filter(accidente__fecha_accidente__gte=desde)
+        if hasta:
+            enlaces = enlaces.filter(accidente__fecha_accidente__lte=hasta)
+        return enlaces
+
+
+class AccidenteHipotesis(models.Model):
+    """
+    Modelo que enlaza cada accidente con las hipótesis que cita, una fila por
+    (accidente, categoría, rango). Normaliza las doce columnas hipotesis_* de
+    Accidente para poder consultar por hipótesis con un índice.
+    """
+    CATEGORIA_CHOICES = [
+        ('CONDUCTOR', 'Conductor'),
+        ('VEHICULO', 'Vehículo'),
+        ('VIA', 'Vía'),
+        ('PEATON', 'Peatón'),
+        ('PASAJERO', 'Pasajero'),
+    ]
+    
+    MODELOS = {
+        'CONDUCTOR': HipotesisConductor,
+        'VEHICULO': HipotesisVehiculo,
+        'VIA': HipotesisVia,
+        'PEATON': HipotesisPeaton,
+        'PASAJERO': HipotesisPasajero,
+    }
+    
+    # Columna de Accidente -> (categoría, rango)
+    CAMPOS_ACCIDENTE = {
+        'hipotesis_conductor1': ('CONDUCTOR', 1),
+        'hipotesis_conductor2': ('CONDUCTOR', 2),
+        'hipotesis_conductor3': ('CONDUCTOR', 3),
+        'hipotesis_conductor4': ('CONDUCTOR', 4),
+        'hipotesis_vehiculo1': ('VEHICULO', 1),
+        'hipotesis_vehiculo2': ('VEHICULO', 2),
+        'hipotesis_via1': ('VIA', 1),
+        'hipotesis_via2': ('VIA', 2),
+        'hipotesis_peaton1': ('PEATON', 1),
+        'hipotesis_peaton2': ('PEATON', 2),
+        'hipotesis_pasajero1': ('PASAJERO', 1),
+        'hipotesis_pasajero2': ('PASAJERO', 2),
+    }
+    
+    accidente = models.ForeignKey(Accidente, on_delete=models.CASCADE, related_name='hipotesis',
+                                  verbose_name='Accidente')
+    categoria = models.CharField(max_length=10, choices=CATEGORIA_CHOICES, verbose_name='Categoría')
+    rango = models.PositiveSmallIntegerField(verbose_name='Rango')
+    # Id en la tabla de hipótesis de la categoría (HipotesisConductor, HipotesisVia, ...)
+    hipotesis_id = models.PositiveIntegerField(verbose_name='Hipótesis')
+    
+    objects = AccidenteHipotesisQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = 'Hipótesis del Accidente'
+        verbose_name_plural = 'Hipótesis de los Accidentes'
+        ordering = ['accidente', 'categoria', 'rango']
+        constraints = [
+            models.UniqueConstraint(fields=['accidente', 'categoria', 'rango'], name='accidente_hipotesis_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['categoria', 'hipotesis_id', 'accidente'], name='hipotesis_accidente_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_categoria_display()} {self.rango} - {self.hipotesis_id}"
+    
+    @classmethod
+    def enlaces_de(cls, accidente):
+        """Retorna {(categoría, rango): hipotesis_id} según las columnas del accidente."""
+        enlaces = {}
+        for campo, clave in cls.CAMPOS_ACCIDENTE.items():
+            hipotesis_id = getattr(accidente, f'{campo}_id')
+            if hipotesis_id is not None:
+                enlaces[clave] = hipotesis_id
+        return enlaces
+    
+    @classmethod
+    def sincronizar(cls, accidente):
+        """
+        Actualiza los enlaces de un accidente con sus columnas de hipótesis,
+        borrando y creando solo los que cambiaron.
+        """
+        deseados = cls.enlaces_de(accidente)
+        actuales = {
+            (categoria, rango): (pk, hipotesis_id)
+            for pk, categoria, rango, hipotesis_id in cls.objects.filter(accidente=accidente).values_list(
+                'pk', 'categoria', 'rango', 'hipotesis_id'
+            )
+        }
+        sobrantes = [pk for clave, (pk, hipotesis_id) in actuales.items() if deseados.get(clave) != hipotesis_id]
+        if sobrantes:
+            cls.objects.filter(pk__in=sobrantes).delete()
+        cls.objects.bulk_create([
+            cls(accidente=accidente, categoria=categoria, rango=rango, hipotesis_id=hipotesis_id)
+            for (categoria, rango), hipotesis_id in deseados.items()
+            if actuales.get((categoria, rango), (None, None))[1] != hipotesis_id
+        ])
+    
+    @staticmethod
+    def poblar_desde_columnas(modelo_enlace, modelo_accidente, schema_editor=None):
+        """
+        Llena la tabla de enlaces desde las columnas hipotesis_* de todos los
+        accidentes con un INSERT ... SELECT por columna. Recibe los modelos
+        para poder usarse también con los modelos históricos de una migración
+        de datos (RunPython). Retorna el número de enlaces creados.
+        """
+        conexion = schema_editor.connection if schema_editor else connection
+        tabla = conexion.ops.quote_name(modelo_enlace._meta.db_table)
+        tabla_accidente = conexion.ops.quote_name(modelo_accidente._meta.db_table)
+        total = 0
+        with transaction.atomic(using=conexion.alias), conexion.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {tabla}')
+            for campo, (categoria, rango) in AccidenteHipotesis.CAMPOS_ACCIDENTE.items():
+                columna = conexion.ops.quote_name(modelo_accidente._meta.get_field(campo).column)
+                cursor.execute(
+                    f'INSERT INTO {tabla} (accidente_id, categoria, rango, hipotesis_id) '
+                    f'SELECT id, %s, %s, {columna} FROM {tabla_accidente} WHERE {columna} IS NOT NULL',
+                    [categoria, rango],
+                )
+                total += cursor.rowcount
+        return total
+    
+    @classmethod
+    def poblar(cls):
+        """Reconstruye todos los enlaces desde las columnas de los accidentes, activos y archivados."""
+        return (cls.poblar_desde_columnas(cls, Accidente)
+                + cls.poblar_desde_columnas(AccidenteHipotesisArchivada, AccidenteArchivado))
+
+
+def modelo_archivo(modelo, nombre, relaciones=None, meta=None, **atributos):
+    """
+    Crea el modelo de archivo de `modelo`: una tabla con las mismas columnas,
+    en la que los registros históricos conservan su id.
+    Las llaves foráneas no crean relación inversa en los catálogos
+    (related_name='+'), salvo las indicadas en `relaciones`
+    ({campo: (modelo de archivo, related_name)}), y auto_now se desactiva
+    para conservar la fecha de modificación original. `atributos` agrega
+    métodos u opciones del modelo activo que el archivo comparte.
+    """
+    relaciones = relaciones or {}
+    for campo in modelo._meta.local_fields:
+        if campo.primary_key:
+            continue
+        nombre_campo, _, args, kwargs = campo.deconstruct()
+        if campo.is_relation:
+            destino, related_name = relaciones.get(nombre_campo, (kwargs['to'], '+'))
+            kwargs.update(to=destino, related_name=related_name)
+        kwargs.pop('auto_now', None)
+        atributos[nombre_campo] = type(campo)(*args, **kwargs)
+
+    opciones = {
+        'verbose_name': f'{modelo._meta.verbose_name} (archivo)',
+        'verbose_name_plural': f'{modelo._meta.verbose_name_plural} (archivo)',
+        'ordering': modelo._meta.ordering,
+        **(meta or {}),
+    }
+    atributos['Meta'] = type('Meta', (), opciones)
+    atributos['__module__'] = __name__
+    return type(nombre, (models.Model,), atributos)
+
+
+AccidenteArchivado = modelo_archivo(
+    Accidente, 'AccidenteArchivado',
+    meta={
+        'indexes': [
+            # Rango de fechas de los reportes y orden de la lista
+            models.Index(fields=['-fecha_accidente', '-hora_accidente', '-id'], name='archivo_orden_idx'),
+            models.Index(fields=['agente_responsable', 'fecha_accidente'], name='archivo_agente_fecha_idx'),
+        ],
+    },
+    objects=AccidenteQuerySet.as_manager(),
+    **{nombre: Accidente.__dict__[nombre] for nombre in (
+        'Via', 'Area', 'Complemento2', '__str__', 'get_direccion_completa', 'get_ubicacion', 'dias_retraso',
+    )},
+)
+
+VehiculoArchivado = modelo_archivo(
+    VehiculoInvolucrado, 'VehiculoArchivado',
+    relaciones={'accidente': (AccidenteArchivado, 'vehiculos')},
+    __str__=VehiculoInvolucrado.__str__,
+)
+
+FallecidoArchivado = modelo_archivo(
+    Fallecido, 'FallecidoArchivado',
+    relaciones={'vehiculo': (VehiculoArchivado, 'ocupantes_fallecidos')},
+    __str__=Fallecido.__str__,
+)
+
+AccidenteHipotesisArchivada = modelo_archivo(
+    AccidenteHipotesis, 'AccidenteHipotesisArchivada',
+    relaciones={'accidente': (AccidenteArchivado, 'hipotesis')},
+    meta={
+        'indexes': [
+            models.Index(fields=['categoria', 'hipotesis_id', 'accidente'], name='archivo_hipotesis_idx'),
+        ],
+    },
+    objects=AccidenteHipotesisQuerySet.as_manager(),
+)
+
+
+def poblar_hipotesis_migracion(apps, schema_editor):
+    """
+    Función para el RunPython de la migración de datos que llena
+    AccidenteHipotesis desde las columnas hipotesis_* existentes.
+    """
+    AccidenteHipotesis.poblar_desde_columnas(
+        apps.get_model('formularios', 'AccidenteHipotesis'),
+        apps.get_model('formularios', 'Accidente'),
+        schema_editor,
+    )
+
+
+
+# Campos de opciones guardados como enteros: modelo -> {campo: opciones}
+CAMPOS_OPCIONES = {
+    'Accidente': {
+        'via': Accidente.Via,
+        'complemento2': Accidente.Complemento2,
+        'area': Accidente.Area,
+        'clase_accidente': Accidente.ClaseAccidente,
+        'tipo_via': Accidente.TipoVia,
+        'choque_con': Accidente.ChoqueCon,
+        'objeto_fijo': Accidente.ObjetoFijo,
+        'remitido_a': Accidente.RemitidoA,
+    },
+    'VehiculoInvolucrado': {
+        'tipo_servicio': VehiculoInvolucrado.TipoServicio,
+        'clase_vehiculo': VehiculoInvolucrado.ClaseVehiculo,
+        'genero_involucrado': VehiculoInvolucrado.Genero,
+        'rango_edad_involucrado': VehiculoInvolucrado.RangoEdad,
+        'heridos': VehiculoInvolucrado.TipoPersona,
+        'fallecidos': VehiculoInvolucrado.TipoPersona,
+        'embriaguez_conductor': VehiculoInvolucrado.SiNo,
+        'grado_embriaguez': VehiculoInvolucrado.GradoEmbriaguez,
+        'herido1_fallece_despues': VehiculoInvolucrado.SiNo,
+        'herido2_fallece_despues': VehiculoInvolucrado.SiNo,
+        'herido3_fallece_despues': VehiculoInvolucrado.SiNo,
+        'herido4_fallece_despues': VehiculoInvolucrado.SiNo,
+    },
+    'ResumenDiarioAccidentes': {
+        'area': Accidente.Area,
+        'clase_accidente': Accidente.ClaseAccidente,
+    },
+}
+
+
+def opciones_a_enteros(apps, schema_editor):
+    """
+    Función para el RunPython que precede al AlterField de los campos de
+    CAMPOS_OPCIONES: reemplaza cada código de texto por su número, todavía
+    como texto, con un UPDATE por código. Los valores vacíos o desconocidos
+    pasan a NULL en los campos opcionales y detienen la migración en los
+    obligatorios.
+    """
+    for nombre_modelo, campos in CAMPOS_OPCIONES.items():
+        modelo = apps.get_model('formularios', nombre_modelo)
+        for campo, opciones in campos.items():
+            for codigo, valor in opciones.valores.items():
+                modelo.objects.filter(**{campo: codigo}).update(**{campo: str(valor)})
+            validos = [str(valor) for valor in opciones.codigos]
+            restantes = modelo.objects.exclude(**{f'{campo}__in': validos}).exclude(**{f'{campo}__isnull': True})
+            if modelo._meta.get_field(campo).null:
+                restantes.update(**{campo: None})
+            elif restantes.exists():
+                desconocidos = sorted(set(restantes.values_list(campo, flat=True)[:20]))
+                raise ValueError(f'{nombre_modelo}.{campo} tiene valores sin opción: {desconocidos}')
+
+
+def opciones_a_texto(apps, schema_editor):
+    """
+    Función inversa de opciones_a_enteros, para el RunPython que sigue al
+    AlterField de vuelta a texto: reemplaza cada número por su código.
+    """
+    for nombre_modelo, campos in CAMPOS_OPCIONES.items():
+        modelo = apps.get_model('formularios', nombre_modelo)
+        for campo, opciones in campos.items():
+            for valor, codigo in opciones.codigos.items():
+                modelo.objects.filter(**{campo: str(valor)}).update(**{campo: codigo})
+
+
+# Registrar los receptores de señales de la aplicación
+from . import signals  # noqa: E402,F401
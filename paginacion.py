@@ -0,0 +1,139 @@
+"""
+Paginación por cursor (keyset) para la lista de accidentes.
+Cada página se obtiene con un rango sobre (fecha_accidente, hora_accidente, id),
+por lo que la página N cuesta lo mismo que la primera.
+"""
+import base64
+import datetime
+from django.db.models import Q, Sum
+from .models import ResumenDiarioAccidentes
+from .archivo import total_archivados
+
+SIGUIENTE = 's'
+ANTERIOR = 'a'
+
+
+def codificar_cursor(accidente, direccion):
+    """Retorna el cursor que apunta a la posición de un accidente."""
+    valor = '|'.join([
+        accidente.fecha_accidente.isoformat(),
+        accidente.hora_accidente.isoformat(),
+        str(accidente.pk),
+        direccion,
+    ])
+    return base64.urlsafe_b64encode(valor.encode('ascii')).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    """
+    Retorna (fecha, hora, id, dirección) a partir de un cursor, o None si el
+    cursor no es válido.
+    """
+    try:
+        fecha, hora, pk, direccion = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split('|')
+        if direccion not in (SIGUIENTE, ANTERIOR):
+            return None
+        return datetime.date.fromisoformat(fecha), datetime.time.fromisoformat(hora), int(pk), direccion
+    except (ValueError, UnicodeError):
+        return None
+
+
+class PaginaCursor:
+    """
+    Página de resultados con los cursores para avanzar y retroceder.
+    """
+    def __init__(self, object_list, cursor_siguiente, cursor_anterior, paginator):
+        self.object_list = object_list
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class PaginadorCursor:
+    """
+    Paginador por cursor sobre un queryset de accidentes.
+    El orden es siempre -fecha_accidente, -hora_accidente, -id, que coincide
+    con el índice accidente_orden_idx.
+    """
+    ORDEN = ('-fecha_accidente', '-hora_accidente', '-id')
+    ORDEN_INVERSO = ('fecha_accidente', 'hora_accidente', 'id')
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    @property
+    def count(self):
+        """
+        Total de accidentes activos sin un COUNT(*) sobre la tabla de
+        accidentes: el resumen diario incluye también a los archivados, así
+        que se le resta el número de archivados (ver archivo.total_archivados).
+        Corresponde al queryset sin filtros, el único que se pagina por cursor,
+        y puede diferir del COUNT(*) si el resumen no está al día.
+        """
+        total = ResumenDiarioAccidentes.objects.aggregate(total=Sum('total_accidentes'))['total'] or 0
+        return max(total - total_archivados(), 0)
+
+    @staticmethod
+    def _despues_de(fecha, hora, pk):
+        """Filtro para los accidentes posteriores a la posición en el orden descendente."""
+        return Q(fecha_accidente__lte=fecha) & (
+            Q(fecha_accidente__lt=fecha) |
+            Q(fecha_accidente=fecha, hora_accidente__lt=hora) |
+            Q(fecha_accidente=fecha, hora_accidente=hora, pk__lt=pk)
+        )
+
+    @staticmethod
+    def _antes_de(fecha, hora, pk):
+        """Filtro para los accidentes anteriores a la posición en el orden descendente."""
+        return Q(fecha_accidente__gte=fecha) & (
+            Q(fecha_accidente__gt=fecha) |
+            Q(fecha_accidente=fecha, hora_accidente__gt=hora) |
+            Q(fecha_accidente=fecha, hora_accidente=hora, pk__gt=pk)
+        )
+
+    def page(self, cursor=None):
+        """
+        Retorna la página que sigue (o precede) al cursor indicado.
+        Sin cursor, o con un cursor inválido, retorna la primera página.
+        """
+        posicion = decodificar_cursor(cursor) if cursor else None
+
+        if posicion is None:
+            objetos = list(self.queryset.order_by(*self.ORDEN)[:self.per_page + 1])
+            hay_mas, hay_anteriores = len(objetos) > self.per_page, False
+            objetos = objetos[:self.per_page]
+        elif posicion[3] == SIGUIENTE:
+            objetos = list(
+                self.queryset.filter(self._despues_de(*posicion[:3])).order_by(*self.ORDEN)[:self.per_page + 1]
+            )
+            hay_mas, hay_anteriores = len(objetos) > self.per_page, True
+            objetos = objetos[:self.per_page]
+        else:
+            objetos = list(
+                self.queryset.filter(self._antes_de(*posicion[:3])).order_by(*self.ORDEN_INVERSO)[:self.per_page + 1]
+            )
+            hay_mas, hay_anteriores = True, len(objetos) > self.per_page
+            objetos = list(reversed(objetos[:self.per_page]))
+
+        return PaginaCursor(
+            objetos,
+            codificar_cursor(objetos[-1], SIGUIENTE) if objetos and hay_mas else None,
+            codificar_cursor(objetos[0], ANTERIOR) if objetos and hay_anteriores else None,
+            self,
+        )
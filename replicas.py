@@ -0,0 +1,174 @@
+"""
+Enrutamiento de las lecturas analíticas a una réplica de la base de datos.
+Las vistas de solo lectura (reportes, dashboard, lista) marcan sus consultas
+con el decorador `lectura_replica` o con `LecturaReplicaMixin`; el router
+las envía al alias REPLICA_ALIAS si está configurado en DATABASES. Todo lo
+demás, incluidas las escrituras, usa la base de datos principal.
+Después de una escritura las lecturas vuelven a la principal: durante el
+resto de la petición y, mediante una cookie, durante REPLICA_SEGUNDOS_PRIMARIA
+segundos, para que el usuario vea sus propios cambios aunque la réplica
+vaya retrasada.
+
+Configuración:
+    DATABASES['replica'] = {..., 'TEST': {'MIRROR': 'default'}}
+    DATABASE_ROUTERS = ['formularios.replicas.RouterReplica']
+    MIDDLEWARE = [..., 'formularios.replicas.ReplicaMiddleware']  # después de SessionMiddleware
+En desarrollo la réplica puede ser una copia SQLite que se actualiza con
+`python manage.py sincronizar_replica`.
+"""
+import contextvars
+import functools
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Alias de DATABASES con la réplica de solo lectura
+REPLICA_ALIAS = getattr(settings, 'REPLICA_ALIAS', 'replica')
+
+# Segundos que las lecturas de un usuario siguen en la principal tras escribir
+SEGUNDOS_PRIMARIA = getattr(settings, 'REPLICA_SEGUNDOS_PRIMARIA', 10)
+
+COOKIE_PRIMARIA = 'formularios_primaria'
+
+
+class EstadoPeticion:
+    """
+    Estado del enrutamiento de una petición o de un bloque lecturas_en_replica.
+    Es mutable para que las escrituras hechas en otro hilo del mismo contexto
+    (sync_to_async) también se vean aquí.
+    """
+    def __init__(self, primaria=False):
+        self.primaria = primaria
+        self.escritura = False
+
+
+_lectura_replica = contextvars.ContextVar('formularios_lectura_replica', default=False)
+_estado = contextvars.ContextVar('formularios_estado_replica', default=None)
+
+
+def replica_configurada():
+    """Indica si DATABASES tiene el alias de la réplica."""
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class RouterReplica:
+    """
+    Router que envía a la réplica las lecturas marcadas y todo lo demás a la
+    principal. Las lecturas dentro de una transacción de la principal, o
+    después de una escritura, se quedan en la principal.
+    """
+    def db_for_read(self, model, **hints):
+        if not _lectura_replica.get() or not replica_configurada():
+            return None
+        estado = _estado.get()
+        if estado is not None and (estado.primaria or estado.escritura):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        estado = _estado.get()
+        if estado is not None:
+            estado.escritura = True
+        # Sin router, Django escribiría en la base de la que se leyó la instancia
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bases = {DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La réplica es una copia de la principal; nunca se migra por separado
+        if db == REPLICA_ALIAS:
+            return False
+        return None
+
+
+@contextmanager
+def lecturas_en_replica():
+    """
+    Envía a la réplica las lecturas hechas dentro del bloque. Fuera de una
+    petición (comandos, tareas) también crea el estado que registra las
+    escrituras para volver a la principal después de la primera.
+    """
+    token_estado = _estado.set(EstadoPeticion()) if _estado.get() is None else None
+    token = _lectura_replica.set(True)
+    try:
+        yield
+    finally:
+        _lectura_replica.reset(token)
+        if token_estado is not None:
+            _estado.reset(token_estado)
+
+
+def lectura_replica(vista):
+    """
+    Decorador de vistas de función cuyas lecturas pueden ir a la réplica.
+    Debe aplicarse debajo de login_required, de modo que la sesión y el
+    usuario se lean antes en la principal.
+    """
+    if iscoroutinefunction(vista):
+        async def envoltura(request, *args, **kwargs):
+            with lecturas_en_replica():
+                return await vista(request, *args, **kwargs)
+    else:
+        def envoltura(request, *args, **kwargs):
+            with lecturas_en_replica():
+                return vista(request, *args, **kwargs)
+    return functools.wraps(vista)(envoltura)
+
+
+class LecturaReplicaMixin:
+    """
+    Mixin de vistas basadas en clases cuyas lecturas pueden ir a la réplica.
+    La respuesta se renderiza dentro del bloque porque los querysets de la
+    plantilla se evalúan al renderizar. Va después de LoginRequiredMixin.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        with lecturas_en_replica():
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    Crea el estado de enrutamiento de cada petición y, si la petición
+    escribió en la base de datos, fija la cookie que mantiene las lecturas
+    del usuario en la principal durante SEGUNDOS_PRIMARIA.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _estado.set(EstadoPeticion(primaria=COOKIE_PRIMARIA in request.COOKIES))
+        try:
+            response = self.get_response(request)
+            return self.marcar_escritura(response)
+        finally:
+            _estado.reset(token)
+
+    async def __acall__(self, request):
+        token = _estado.set(EstadoPeticion(primaria=COOKIE_PRIMARIA in request.COOKIES))
+        try:
+            response = await self.get_response(request)
+            return self.marcar_escritura(response)
+        finally:
+            _estado.reset(token)
+
+    def marcar_escritura(self, response):
+        if _estado.get().escritura:
+            response.set_cookie(COOKIE_PRIMARIA, '1', max_age=SEGUNDOS_PRIMARIA, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,367 @@
+"""
+Generación de reportes de accidentes.
+Construye los filtros del ReporteForm y escribe el archivo Excel por bloques,
+sin cargar todos los accidentes en memoria.
+"""
+import calendar
+import datetime
+import hashlib
+import itertools
+import json
+import tempfile
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Count, Max, Q, QuerySet
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from .models import Accidente, AccidenteArchivado, VehiculoInvolucrado, TrabajoReporte
+from .archivo import alcanza_archivo
+
+CONTENT_TYPE_EXCEL = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Accidentes leídos por cada consulta del iterador
+TAMANO_BLOQUE = 2000
+
+# Bytes enviados al cliente en cada fragmento de la respuesta
+TAMANO_FRAGMENTO = 64 * 1024
+
+# Reportes con más filas que este límite se generan en segundo plano
+MAX_FILAS_SINCRONO = getattr(settings, 'REPORTES_MAX_FILAS_SINCRONO', 5000)
+
+# Segundos sin latido tras los cuales un trabajo en proceso se considera abandonado
+SEGUNDOS_ABANDONO = getattr(settings, 'REPORTES_SEGUNDOS_ABANDONO', 600)
+
+COLUMNAS_ACCIDENTE = [
+    'Número IPAT', 'Fecha Accidente', 'Hora Accidente', 'Agente Responsable', 'Área',
+    'Ubicación', 'Dirección', 'Clase Accidente', 'Tipo Vía', 'Con Heridos', 'Con Muertos',
+    'Con Daños Materiales', 'Total Vehículos', 'Fecha Registro', 'Registrado Por',
+]
+
+COLUMNAS_VEHICULO = ['Tipo', 'Servicio', 'Heridos', 'Fallecidos', 'Embriaguez']
+
+
+def construir_filtros(datos):
+    """
+    Construye el filtro Q a partir de los datos limpios del ReporteForm (o de
+    los filtros ya normalizados de un trabajo de reporte).
+    El año, el mes y el rango de fechas se combinan en un solo rango sobre
+    fecha_accidente, que puede resolverse con los índices de la tabla.
+    """
+    datos = normalizar_filtros(datos)
+    filtros = Q()
+
+    desde, hasta = rango_fechas(datos)
+    if desde:
+        filtros &= Q(fecha_accidente__gte=desde)
+    if hasta:
+        filtros &= Q(fecha_accidente__lte=hasta)
+
+    # Un mes sin año abarca todos los años y no se puede expresar como rango
+    if datos.get('mes') and not datos.get('ano'):
+        filtros &= Q(fecha_accidente__month=datos['mes'])
+
+    if datos.get('agente'):
+        filtros &= Q(agente_responsable=datos['agente'])
+
+    if datos.get('area'):
+        filtros &= Q(area=datos['area'])
+
+    return filtros
+
+
+def obtener_accidentes(filtros, modelo=Accidente):
+    """
+    Retorna el queryset de accidentes del reporte con sus relaciones precargadas.
+    Con modelo=AccidenteArchivado lee la tabla de archivo.
+    """
+    return modelo.objects.filter(filtros).select_related(
+        'agente_responsable', 'zat', 'barrio', 'centro_poblado_vereda', 'usuario'
+    ).prefetch_related('vehiculos')
+
+
+def consultas_reporte(datos):
+    """
+    Retorna la lista de querysets del reporte: el de los accidentes activos
+    y, si el rango de fechas llega hasta el archivo, el de los archivados.
+    """
+    filtros = construir_filtros(datos)
+    consultas = [obtener_accidentes(filtros)]
+    desde, _ = rango_fechas(normalizar_filtros(datos))
+    if alcanza_archivo(desde):
+        consultas.append(obtener_accidentes(filtros, AccidenteArchivado))
+    return consultas
+
+
+def contar_accidentes(consultas):
+    """Retorna el total de accidentes de un queryset o de una lista de querysets."""
+    if isinstance(consultas, QuerySet):
+        return consultas.count()
+    return sum(consulta.count() for consulta in consultas)
+
+
+def _sin_zona_horaria(valor):
+    """Excel no admite fechas con zona horaria; se escriben en hora local."""
+    if timezone.is_aware(valor):
+        return timezone.localtime(valor).replace(tzinfo=None)
+    return valor
+
+
+def fila_accidente(accidente, max_vehiculos):
+    """
+    Retorna la fila del reporte para un accidente, con columnas fijas por vehículo.
+    Las opciones se escriben con su código de texto, como antes de guardarlas
+    como enteros.
+    """
+    fila = [
+        accidente.numero_ipat,
+        accidente.fecha_accidente,
+        accidente.hora_accidente,
+        accidente.agente_responsable.nombre,
+        Accidente.Area.codigos.get(accidente.area),
+        accidente.get_ubicacion(),
+        accidente.get_direccion_completa(),
+        Accidente.ClaseAccidente.codigos.get(accidente.clase_accidente),
+        Accidente.TipoVia.codigos.get(accidente.tipo_via),
+        'Sí' if accidente.con_heridos else 'No',
+        'Sí' if accidente.con_muertos else 'No',
+        'Sí' if accidente.con_danos_materiales else 'No',
+        accidente.total_vehiculos_involucrados,
+        _sin_zona_horaria(accidente.fecha_registro),
+        accidente.usuario.get_full_name() or accidente.usuario.username,
+    ]
+
+    vehiculos = list(accidente.vehiculos.all())[:max_vehiculos]
+    for vehiculo in vehiculos:
+        fila.extend([
+            VehiculoInvolucrado.ClaseVehiculo.codigos.get(vehiculo.clase_vehiculo),
+            VehiculoInvolucrado.TipoServicio.codigos.get(vehiculo.tipo_servicio),
+            vehiculo.numero_heridos,
+            vehiculo.numero_fallecidos,
+            VehiculoInvolucrado.SiNo.codigos.get(vehiculo.embriaguez_conductor),
+        ])
+    # Completar las columnas de los vehículos que este accidente no tiene
+    fila.extend([None] * (len(COLUMNAS_VEHICULO) * (max_vehiculos - len(vehiculos))))
+    return fila
+
+
+def escribir_excel(accidentes, destino, progreso=None):
+    """
+    Escribe el reporte en `destino` con un libro de solo escritura.
+    `accidentes` es un queryset o la lista de consultas_reporte; las tablas
+    se escriben una tras otra, las activas primero.
+    Los accidentes se leen por bloques con iterator(), de modo que la memoria
+    usada no crece con el número de filas. Si se indica `progreso`, se llama
+    con el número de filas escritas al terminar cada bloque.
+    Retorna el número de filas escritas.
+    """
+    consultas = [accidentes] if isinstance(accidentes, QuerySet) else list(accidentes)
+    max_vehiculos = max((
+        consulta.order_by().annotate(
+            num_vehiculos=Count('vehiculos')
+        ).aggregate(maximo=Max('num_vehiculos'))['maximo'] or 0
+        for consulta in consultas
+    ), default=0)
+
+    columnas = list(COLUMNAS_ACCIDENTE)
+    for i in range(1, max_vehiculos + 1):
+        columnas.extend(f'Vehículo {i} - {nombre}' for nombre in COLUMNAS_VEHICULO)
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet('Accidentes')
+
+    # En modo solo escritura los anchos deben fijarse antes de la primera fila
+    for i, columna in enumerate(columnas, 1):
+        hoja.column_dimensions[get_column_letter(i)].width = max(len(columna), 12) + 2
+    hoja.append(columnas)
+
+    filas = 0
+    for accidente in itertools.chain.from_iterable(
+        consulta.iterator(chunk_size=TAMANO_BLOQUE) for consulta in consultas
+    ):
+        hoja.append(fila_accidente(accidente, max_vehiculos))
+        filas += 1
+        if progreso and filas % TAMANO_BLOQUE == 0:
+            progreso(filas)
+
+    libro.save(destino)
+    return filas
+
+
+def _leer_por_fragmentos(archivo):
+    """Genera el contenido del archivo por fragmentos y lo cierra al terminar."""
+    try:
+        archivo.seek(0)
+        while True:
+            fragmento = archivo.read(TAMANO_FRAGMENTO)
+            if not fragmento:
+                break
+            yield fragmento
+    finally:
+        archivo.close()
+
+
+def nombre_archivo_reporte():
+    """Retorna el nombre con el que se descarga el reporte."""
+    return f"reporte_accidentes_{timezone.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+
+
+def respuesta_excel_streaming(accidentes):
+    """
+    Genera el reporte en un archivo temporal en disco y lo envía con una
+    StreamingHttpResponse por fragmentos, sin copiarlo completo a memoria.
+    """
+    archivo = tempfile.TemporaryFile()
+    try:
+        escribir_excel(accidentes, archivo)
+    except Exception:
+        archivo.close()
+        raise
+
+    response = StreamingHttpResponse(_leer_por_fragmentos(archivo), content_type=CONTENT_TYPE_EXCEL)
+    response['Content-Length'] = archivo.tell()
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo_reporte()}"'
+    return response
+
+
+def _iso(fecha):
+    """Retorna la fecha en formato ISO; acepta fechas ya convertidas a texto."""
+    return fecha if isinstance(fecha, str) else fecha.isoformat()
+
+
+def normalizar_filtros(datos):
+    """
+    Convierte los datos limpios del ReporteForm a un diccionario serializable
+    en JSON, con las claves vacías omitidas. Aplicarla a filtros ya
+    normalizados no los modifica.
+    """
+    filtros = {}
+    if datos.get('fecha_desde') and datos.get('fecha_hasta'):
+        filtros['fecha_desde'] = _iso(datos['fecha_desde'])
+        filtros['fecha_hasta'] = _iso(datos['fecha_hasta'])
+    if datos.get('ano'):
+        filtros['ano'] = int(datos['ano'])
+    if datos.get('mes'):
+        filtros['mes'] = int(datos['mes'])
+    if datos.get('agente'):
+        agente = datos['agente']
+        filtros['agente'] = getattr(agente, 'pk', agente)
+    if datos.get('area'):
+        filtros['area'] = datos['area']
+    return filtros
+
+
+def clave_filtros(filtros):
+    """Retorna el hash SHA-256 de los filtros normalizados."""
+    contenido = json.dumps(filtros, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def rango_fechas(filtros):
+    """
+    Retorna el rango (desde, hasta) de fechas de accidente que cubren los
+    filtros normalizados. Un extremo es None cuando no está acotado.
+    """
+    desde = hasta = None
+    if 'fecha_desde' in filtros:
+        desde = datetime.date.fromisoformat(filtros['fecha_desde'])
+        hasta = datetime.date.fromisoformat(filtros['fecha_hasta'])
+
+    ano = filtros.get('ano')
+    if ano:
+        mes = filtros.get('mes')
+        inicio = datetime.date(ano, mes or 1, 1)
+        fin = datetime.date(ano, mes or 12, calendar.monthrange(ano, mes or 12)[1])
+        desde = max(desde, inicio) if desde else inicio
+        hasta = min(hasta, fin) if hasta else fin
+
+    return desde, hasta
+
+
+def encolar_reporte(datos, usuario):
+    """
+    Retorna el trabajo de reporte para los filtros indicados.
+    Si ya existe uno vigente (pendiente, en proceso o terminado) se reutiliza;
+    si estaba vencido o falló, se vuelve a poner en cola.
+    """
+    filtros = normalizar_filtros(datos)
+    desde, hasta = rango_fechas(filtros)
+    trabajo, creado = TrabajoReporte.objects.get_or_create(
+        clave=clave_filtros(filtros),
+        defaults={'filtros': filtros, 'fecha_desde': desde, 'fecha_hasta': hasta, 'usuario': usuario},
+    )
+    if not creado and trabajo.estado in ('VENCIDO', 'ERROR'):
+        trabajo.estado = 'PENDIENTE'
+        trabajo.progreso = 0
+        trabajo.error = ''
+        trabajo.usuario = usuario
+        trabajo.fecha_creacion = timezone.now()
+        trabajo.save(update_fields=['estado', 'progreso', 'error', 'usuario', 'fecha_creacion'])
+    return trabajo
+
+
+def tomar_siguiente_trabajo():
+    """
+    Reserva el trabajo pendiente más antiguo y lo retorna, o None si no hay.
+    La reserva es un UPDATE condicional, por lo que varios workers pueden
+    consultar la cola a la vez sin tomar el mismo trabajo.
+    """
+    for trabajo in TrabajoReporte.objects.filter(estado='PENDIENTE').order_by('fecha_creacion')[:10]:
+        reservado = TrabajoReporte.objects.filter(pk=trabajo.pk, estado='PENDIENTE').update(
+            estado='EN_PROCESO', progreso=0, fecha_latido=timezone.now()
+        )
+        if reservado:
+            trabajo.refresh_from_db()
+            return trabajo
+    return None
+
+
+def recuperar_trabajos_abandonados():
+    """
+    Devuelve a la cola los trabajos en proceso cuyo worker no da señales
+    desde hace SEGUNDOS_ABANDONO, por ejemplo porque se detuvo a la mitad.
+    Retorna el número de trabajos recuperados.
+    """
+    limite = timezone.now() - datetime.timedelta(seconds=SEGUNDOS_ABANDONO)
+    return TrabajoReporte.objects.filter(
+        Q(fecha_latido__lt=limite) | Q(fecha_latido__isnull=True), estado='EN_PROCESO'
+    ).update(estado='PENDIENTE', progreso=0)
+
+
+def generar_trabajo(trabajo):
+    """
+    Genera el archivo Excel de un trabajo reservado y lo guarda en el storage.
+    Si algún accidente del rango cambió durante la generación, el trabajo
+    vuelve a la cola en lugar de quedar terminado con datos desactualizados.
+    """
+    version = trabajo.version
+    accidentes = consultas_reporte(trabajo.filtros)
+    total = contar_accidentes(accidentes)
+    TrabajoReporte.objects.filter(pk=trabajo.pk).update(total_filas=total, fecha_latido=timezone.now())
+
+    def progreso(filas):
+        TrabajoReporte.objects.filter(pk=trabajo.pk).update(
+            progreso=min(99, filas * 100 // max(total, 1)), fecha_latido=timezone.now()
+        )
+
+    try:
+        with tempfile.TemporaryFile() as archivo:
+            escribir_excel(accidentes, archivo, progreso)
+            archivo.seek(0)
+            if trabajo.archivo:
+                trabajo.archivo.delete(save=False)
+            trabajo.archivo.save(f'{trabajo.clave}.xlsx', File(archivo), save=False)
+    except Exception as error:
+        TrabajoReporte.objects.filter(pk=trabajo.pk).update(estado='ERROR', error=str(error))
+        raise
+
+    # Solo se marca como terminado si la versión no cambió mientras se generaba
+    terminado = TrabajoReporte.objects.filter(pk=trabajo.pk, version=version).update(
+        estado='TERMINADO', progreso=100, archivo=trabajo.archivo.name, fecha_finalizacion=timezone.now()
+    )
+    if not terminado:
+        TrabajoReporte.objects.filter(pk=trabajo.pk).update(
+            estado='PENDIENTE', progreso=0, archivo=trabajo.archivo.name
+        )
+    return bool(terminado)
@@ -0,0 +1,217 @@
+"""
+Servicios de escritura para los accidentes.
+Agrupan en una sola transacción el guardado del accidente, sus vehículos y
+las personas fallecidas, con inserciones y actualizaciones masivas.
+"""
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Count, Max, Min, Prefetch
+from .models import VehiculoInvolucrado, Fallecido, TrabajoReporte, ResumenDiarioAccidentes
+from .signals import CAMPOS_DERIVADOS
+from . import busqueda, detalle
+
+
+def fallecidos_del_post(datos, indice, cantidad):
+    """
+    Retorna la lista de (nombre_apellidos, direccion) enviada para el vehículo
+    con el índice de formulario indicado. Se omiten las filas incompletas.
+    """
+    fallecidos = []
+    for i in range(1, cantidad + 1):
+        nombre = datos.get(f"fallecidos[{indice}][{i}][nombre_apellidos]")
+        direccion = datos.get(f"fallecidos[{indice}][{i}][direccion]")
+        if nombre and direccion:
+            fallecidos.append((nombre, direccion))
+    return fallecidos
+
+
+def fallecidos_enviados(datos, indice):
+    """
+    Indica si `datos` trae algún campo de fallecidos para el vehículo con el
+    índice de formulario indicado. Sin ellos no se sabe qué quedó del
+    vehículo, y no debe interpretarse como que se eliminaron todos.
+    """
+    prefijo = f"fallecidos[{indice}]["
+    return any(clave.startswith(prefijo) for clave in datos)
+
+
+def _formularios_guardables(vehiculo_formset):
+    """Retorna (índice, formulario) de los vehículos diligenciados y no eliminados."""
+    for indice, vehiculo_form in enumerate(vehiculo_formset.forms):
+        if not vehiculo_form.has_changed():
+            continue
+        if vehiculo_formset.can_delete and vehiculo_form.cleaned_data.get('DELETE'):
+            continue
+        yield indice, vehiculo_form
+
+
+def registrar_accidente(form, vehiculo_formset, datos, usuario):
+    """
+    Guarda un accidente nuevo con sus vehículos y fallecidos.
+    El formulario y el formset deben estar validados. Todo se escribe en una
+    transacción: un INSERT para el accidente, uno masivo para los vehículos y
+    otro para los fallecidos, sin importar cuántos haya.
+    Los fallecidos se leen de `datos` (el POST) con el índice del formulario
+    de cada vehículo. Retorna el accidente guardado.
+    """
+    with transaction.atomic():
+        accidente = form.save(commit=False)
+        accidente.usuario = usuario
+        accidente.save()
+        form.save_m2m()
+
+        vehiculos = []
+        fallecidos_por_vehiculo = []
+        for indice, vehiculo_form in _formularios_guardables(vehiculo_formset):
+            vehiculo = vehiculo_form.save(commit=False)
+            vehiculo.accidente = accidente
+            vehiculos.append(vehiculo)
+            fallecidos_por_vehiculo.append(fallecidos_del_post(datos, indice, vehiculo.numero_fallecidos))
+
+        # bulk_create asigna los ids en SQLite 3.35+ y PostgreSQL
+        VehiculoInvolucrado.objects.bulk_create(vehiculos)
+
+        Fallecido.objects.bulk_create([
+            Fallecido(vehiculo=vehiculo, nombre_apellidos=nombre, direccion=direccion)
+            for vehiculo, fallecidos in zip(vehiculos, fallecidos_por_vehiculo)
+            for nombre, direccion in fallecidos
+        ])
+
+    return accidente
+
+
+def vehiculos_para_edicion(accidente):
+    """
+    Retorna el queryset de vehículos del accidente con sus fallecidos
+    precargados en orden, para usarlo como queryset del VehiculoFormSet.
+    """
+    return VehiculoInvolucrado.objects.filter(accidente=accidente).prefetch_related(
+        Prefetch('ocupantes_fallecidos', queryset=Fallecido.objects.order_by('id'))
+    )
+
+
+def _comparar_fallecidos(vehiculo, actuales, enviados, crear, actualizar, eliminar):
+    """
+    Compara por posición los fallecidos guardados con los enviados y agrega a
+    las listas solo los que se deben crear, actualizar o eliminar.
+    """
+    for posicion, (nombre, direccion) in enumerate(enviados):
+        if posicion < len(actuales):
+            fallecido = actuales[posicion]
+            if (fallecido.nombre_apellidos, fallecido.direccion) != (nombre, direccion):
+                fallecido.nombre_apellidos = nombre
+                fallecido.direccion = direccion
+                actualizar.append(fallecido)
+        else:
+            crear.append(Fallecido(vehiculo=vehiculo, nombre_apellidos=nombre, direccion=direccion))
+    eliminar.extend(fallecido.pk for fallecido in actuales[len(enviados):])
+
+
+def actualizar_accidente(form, vehiculo_formset, datos):
+    """
+    Guarda la edición de un accidente aplicando solo las diferencias.
+    El formset debe construirse con vehiculos_para_edicion() y estar validado
+    junto con el formulario. Los vehículos y fallecidos existentes conservan
+    sus ids; solo se emiten los bulk_update, bulk_create y DELETE necesarios,
+    todo dentro de una transacción. Los fallecidos de un vehículo existente
+    solo se comparan si `datos` trae sus campos (fallecidos[<índice>][...],
+    como los envía la plantilla de edición); si no, se conservan.
+    Retorna el accidente.
+    """
+    campos_vehiculo = {campo.name for campo in VehiculoInvolucrado._meta.concrete_fields}
+    # bulk_update no asigna los campos auto_now
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        accidente = form.save() if form.has_changed() else form.instance
+
+        vehiculos_nuevos, vehiculos_modificados, vehiculos_eliminados = [], [], []
+        campos_modificados = set()
+        fallecidos_nuevos, fallecidos_modificados, fallecidos_eliminados = [], [], []
+        fallecidos_de_nuevos = []
+
+        for indice, vehiculo_form in enumerate(vehiculo_formset.forms):
+            existente = vehiculo_form.instance.pk is not None
+            if existente and vehiculo_formset.can_delete and vehiculo_form.cleaned_data.get('DELETE'):
+                vehiculos_eliminados.append(vehiculo_form.instance.pk)
+                continue
+            if not existente and not vehiculo_form.has_changed():
+                continue
+
+            vehiculo = vehiculo_form.save(commit=False)
+            enviados = fallecidos_del_post(datos, indice, vehiculo.numero_fallecidos)
+
+            if existente:
+                cambios = campos_vehiculo.intersection(vehiculo_form.changed_data)
+                if cambios:
+                    vehiculo.fecha_modificacion = ahora
+                    vehiculos_modificados.append(vehiculo)
+                    campos_modificados |= cambios
+                if fallecidos_enviados(datos, indice):
+                    _comparar_fallecidos(vehiculo, list(vehiculo.ocupantes_fallecidos.all()), enviados,
+                                         fallecidos_nuevos, fallecidos_modificados, fallecidos_eliminados)
+            else:
+                vehiculo.accidente = accidente
+                vehiculos_nuevos.append(vehiculo)
+                fallecidos_de_nuevos.append(enviados)
+
+        if fallecidos_eliminados:
+            Fallecido.objects.filter(pk__in=fallecidos_eliminados).delete()
+        if vehiculos_eliminados:
+            VehiculoInvolucrado.objects.filter(pk__in=vehiculos_eliminados, accidente=accidente).delete()
+        if vehiculos_modificados:
+            VehiculoInvolucrado.objects.bulk_update(
+                vehiculos_modificados, sorted(campos_modificados | {'fecha_modificacion'})
+            )
+        if fallecidos_modificados:
+            for fallecido in fallecidos_modificados:
+                fallecido.fecha_modificacion = ahora
+            Fallecido.objects.bulk_update(fallecidos_modificados, ['nombre_apellidos', 'direccion', 'fecha_modificacion'])
+        if vehiculos_nuevos:
+            VehiculoInvolucrado.objects.bulk_create(vehiculos_nuevos)
+            fallecidos_nuevos.extend(
+                Fallecido(vehiculo=vehiculo, nombre_apellidos=nombre, direccion=direccion)
+                for vehiculo, enviados in zip(vehiculos_nuevos, fallecidos_de_nuevos)
+                for nombre, direccion in enviados
+            )
+        if fallecidos_nuevos:
+            Fallecido.objects.bulk_create(fallecidos_nuevos)
+
+        # Las operaciones masivas no emiten señales de los vehículos
+        if vehiculos_nuevos or vehiculos_modificados or vehiculos_eliminados:
+            TrabajoReporte.invalidar_fechas(accidente.fecha_accidente)
+        if vehiculos_nuevos or vehiculos_modificados or vehiculos_eliminados or fallecidos_nuevos \
+                or fallecidos_modificados or fallecidos_eliminados:
+            detalle.invalidar_detalle(accidente.pk)
+
+    return accidente
+
+
+def reasignar_agente(accidentes, agente):
+    """
+    Asigna el agente responsable a todos los accidentes del queryset con un
+    solo UPDATE. Como update() no emite señales, ajusta el resumen diario una
+    vez por grupo de accidentes iguales, invalida los reportes del rango de
+    fechas afectado y reindexa la búsqueda por bloques.
+    Retorna el número de accidentes actualizados.
+    """
+    accidentes = accidentes.exclude(agente_responsable=agente).order_by()
+
+    with transaction.atomic():
+        ids = list(accidentes.values_list('pk', flat=True))
+        if not ids:
+            return 0
+        grupos = list(accidentes.values(*CAMPOS_DERIVADOS).annotate(cantidad=Count('id')))
+        rango = accidentes.aggregate(desde=Min('fecha_accidente'), hasta=Max('fecha_accidente'))
+
+        actualizados = accidentes.update(agente_responsable=agente, fecha_modificacion=timezone.now())
+
+        for grupo in grupos:
+            cantidad = grupo.pop('cantidad')
+            ResumenDiarioAccidentes.ajustar(grupo, -cantidad)
+            ResumenDiarioAccidentes.ajustar(dict(grupo, agente_responsable_id=agente.pk), cantidad)
+        TrabajoReporte.invalidar_rango(rango['desde'], rango['hasta'])
+
+    busqueda.indexar_accidentes(ids)
+    detalle.invalidar_detalle(*ids)
+    return actualizados
@@ -0,0 +1,116 @@
+"""
+Receptores de señales para la aplicación de formularios.
+Mantienen sincronizados los datos derivados cuando cambian los accidentes.
+"""
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import (
+    Accidente, AccidenteHipotesis, VehiculoInvolucrado, Fallecido, TrabajoReporte, ResumenDiarioAccidentes,
+    RegistroEliminacion
+)
+from . import busqueda, catalogos, detalle
+
+# Campos del accidente de los que dependen los datos derivados
+CAMPOS_DERIVADOS = ('fecha_accidente', 'area', 'clase_accidente', 'agente_responsable_id',
+                    'con_heridos', 'con_muertos')
+
+# Columnas de hipótesis que se reflejan en la tabla de enlaces
+CAMPOS_HIPOTESIS = tuple(f'{campo}_id' for campo in AccidenteHipotesis.CAMPOS_ACCIDENTE)
+
+
+def _valores(accidente):
+    """Retorna los valores actuales de los campos derivados del accidente."""
+    return {campo: getattr(accidente, campo) for campo in CAMPOS_DERIVADOS}
+
+
+@receiver(pre_save, sender=Accidente)
+def guardar_valores_anteriores(sender, instance, **kwargs):
+    """
+    Conserva los valores del accidente antes de guardarlo, para poder restar
+    el accidente de los datos derivados que dependían de ellos.
+    """
+    instance._valores_anteriores = None
+    instance._hipotesis_anteriores = None
+    if instance.pk:
+        anteriores = sender.objects.filter(pk=instance.pk).values(*CAMPOS_DERIVADOS, *CAMPOS_HIPOTESIS).first()
+        if anteriores:
+            instance._valores_anteriores = {campo: anteriores[campo] for campo in CAMPOS_DERIVADOS}
+            instance._hipotesis_anteriores = {campo: anteriores[campo] for campo in CAMPOS_HIPOTESIS}
+
+
+@receiver(post_save, sender=Accidente)
+def actualizar_derivados_accidente(sender, instance, **kwargs):
+    """
+    Actualiza el resumen diario y los enlaces de hipótesis, invalida los
+    reportes y reindexa la búsqueda del accidente guardado.
+    """
+    anteriores = getattr(instance, '_valores_anteriores', None)
+    actuales = _valores(instance)
+
+    if anteriores != actuales:
+        if anteriores:
+            ResumenDiarioAccidentes.ajustar(anteriores, -1)
+        ResumenDiarioAccidentes.ajustar(actuales, 1)
+
+    hipotesis = {campo: getattr(instance, campo) for campo in CAMPOS_HIPOTESIS}
+    if getattr(instance, '_hipotesis_anteriores', None) != hipotesis:
+        AccidenteHipotesis.sincronizar(instance)
+
+    TrabajoReporte.invalidar_fechas(instance.fecha_accidente, anteriores and anteriores['fecha_accidente'])
+    busqueda.indexar_accidente(instance.pk)
+    detalle.invalidar_detalle(instance.pk)
+
+
+@receiver(post_delete, sender=Accidente)
+def actualizar_derivados_accidente_eliminado(sender, instance, **kwargs):
+    """
+    Resta el accidente eliminado del resumen diario, invalida sus reportes y
+    lo quita del índice de búsqueda.
+    """
+    ResumenDiarioAccidentes.ajustar(_valores(instance), -1)
+    TrabajoReporte.invalidar_fechas(instance.fecha_accidente)
+    busqueda.eliminar_accidente(instance.pk)
+    detalle.invalidar_detalle(instance.pk)
+
+
+@receiver(post_save, sender=VehiculoInvolucrado)
+@receiver(post_delete, sender=VehiculoInvolucrado)
+def invalidar_reportes_vehiculo(sender, instance, **kwargs):
+    """
+    Invalida los reportes en caché que incluyen el accidente del vehículo y el
+    fragmento de su detalle.
+    """
+    fecha = Accidente.objects.filter(pk=instance.accidente_id).values_list('fecha_accidente', flat=True).first()
+    TrabajoReporte.invalidar_fechas(fecha)
+    detalle.invalidar_detalle(instance.accidente_id)
+
+
+@receiver(post_save, sender=Fallecido)
+@receiver(post_delete, sender=Fallecido)
+def invalidar_detalle_fallecido(sender, instance, **kwargs):
+    """Invalida el fragmento del detalle del accidente del fallecido."""
+    accidente_id = VehiculoInvolucrado.objects.filter(pk=instance.vehiculo_id).values_list(
+        'accidente_id', flat=True).first()
+    detalle.invalidar_detalle(accidente_id)
+
+
+# Modelo -> tabla de la exportación incremental
+TABLAS_ELIMINACION = {Accidente: 'accidentes', VehiculoInvolucrado: 'vehiculos', Fallecido: 'fallecidos'}
+
+
+@receiver(post_delete, sender=Accidente)
+@receiver(post_delete, sender=VehiculoInvolucrado)
+@receiver(post_delete, sender=Fallecido)
+def registrar_eliminacion(sender, instance, **kwargs):
+    """Deja la marca de eliminación que lee la exportación incremental."""
+    RegistroEliminacion.objects.create(tabla=TABLAS_ELIMINACION[sender], registro_id=instance.pk)
+
+
+def invalidar_catalogos(sender, **kwargs):
+    """Incrementa la versión de los catálogos cuando se edita alguno."""
+    catalogos.incrementar_version()
+
+
+for _modelo in catalogos.CATALOGOS.values():
+    post_save.connect(invalidar_catalogos, sender=_modelo, dispatch_uid=f'catalogos_guardar_{_modelo.__name__}')
+    post_delete.connect(invalidar_catalogos, sender=_modelo, dispatch_uid=f'catalogos_eliminar_{_modelo.__name__}')
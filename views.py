@@ -2,23 +2,47 @@
 Vistas para la aplicación de formularios.
 Define las vistas para la gestión de formularios de accidentes.
 """
+from datetime import date
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib import messages
-from django.http import HttpResponse
-from django.db.models import Count, Q
+from django.http import Http404, HttpResponse, FileResponse
+from django.views.decorators.http import etag, require_GET
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.db.models import Count, Prefetch, Q, Sum, prefetch_related_objects
 from django.utils import timezone
-import pandas as pd
-import io
-import os
-from .models import Accidente, VehiculoInvolucrado, Fallecido, Agente, ZAT, Barrio, CentroPobladoVereda
+from django.conf import settings
+from .models import (
+    Accidente, VehiculoInvolucrado, Fallecido, Agente, ZAT, Barrio, CentroPobladoVereda, TrabajoReporte,
+    ResumenDiarioAccidentes, AccidenteHipotesis, AccidenteArchivado
+)
+from .busqueda import buscar_con_archivo
+from .paginacion import PaginadorCursor
+from . import catalogos, detalle, metricas
+from .replicas import LecturaReplicaMixin, lectura_replica
+from .servicios import registrar_accidente, actualizar_accidente, vehiculos_para_edicion
 from .forms import AccidenteForm, VehiculoFormSet, FallecidoFormSet, ReporteForm
+from .reportes import (
+    CONTENT_TYPE_EXCEL, MAX_FILAS_SINCRONO, consultas_reporte, contar_accidentes, encolar_reporte,
+    nombre_archivo_reporte, respuesta_excel_streaming
+)
 from django.http import JsonResponse
 from .models import Barrio
 
+# Valores de las opciones que el JavaScript del formulario compara
+VALORES_OPCIONES_FORMULARIO = {
+    'area_rural': Accidente.Area.RURAL,
+    'clase_otro': Accidente.ClaseAccidente.OTRO,
+    'choque_objeto_fijo': Accidente.ChoqueCon.OBJETO_FIJO,
+    'objeto_fijo_otro': Accidente.ObjetoFijo.OTRO,
+    'embriaguez_si': VehiculoInvolucrado.SiNo.SI,
+}
+
 # Mixin para verificar permisos según el rol
 class SupervisorRequiredMixin(UserPassesTestMixin):
     """
@@ -31,9 +55,16 @@ class SupervisorRequiredMixin(UserPassesTestMixin):
         )
 
 # Vistas para listar y ver detalles de accidentes
-class ListaAccidentesView(LoginRequiredMixin, ListView):
+class ListaAccidentesView(LoginRequiredMixin, LecturaReplicaMixin, ListView):
     """
     Vista para listar todos los accidentes registrados.
+    Las consultas se leen de la réplica si está configurada.
+    La búsqueda (parámetro `search`) usa el índice de texto completo, que
+    encuentra palabras que empiezan por el texto y no subcadenas en medio de
+    una palabra; los textos cortos, como el final de un IPAT, se siguen
+    buscando por subcadena (ver busqueda.py). Se muestran a lo sumo
+    BUSQUEDA_MAX_RESULTADOS resultados; si había más, el contexto trae
+    `resultados_truncados` y se avisa al usuario para que precise la búsqueda.
     """
     model = Accidente
     template_name = 'formularios/lista_accidentes.html'
@@ -42,24 +73,81 @@ class ListaAccidentesView(LoginRequiredMixin, ListView):
     
     def get_queryset(self):
         queryset = super().get_queryset()
-        # Filtrar si hay parámetros de búsqueda
+        # Filtrar si hay parámetros de búsqueda, ordenando por relevancia e
+        # incluyendo los accidentes archivados
         search_query = self.request.GET.get('search', '')
         if search_query:
-            queryset = queryset.filter(
-                Q(numero_ipat__icontains=search_query) |
-                Q(agente_responsable__nombre__icontains=search_query) |
-                Q(barrio__nombre__icontains=search_query) |
-                Q(centro_poblado_vereda__nombre__icontains=search_query)
-            )
-        return queryset.order_by('-fecha_accidente', '-hora_accidente')
+            return buscar_con_archivo(queryset, search_query)
+        return queryset.order_by('-fecha_accidente', '-hora_accidente', '-id')
+    
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Pagina la lista completa por cursor (parámetro `cursor`).
+        Los resultados de búsqueda están acotados y usan la paginación normal.
+        """
+        if self.request.GET.get('search'):
+            return super().paginate_queryset(queryset, page_size)
+        paginador = PaginadorCursor(queryset, page_size)
+        pagina = paginador.page(self.request.GET.get('cursor'))
+        return (paginador, pagina, pagina.object_list, pagina.has_other_pages())
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['resultados_truncados'] = getattr(self.object_list, 'truncados', False)
+        if context['resultados_truncados']:
+            messages.info(self.request, f'Se muestran solo los primeros {len(self.object_list)} resultados; '
+                                        'precise la búsqueda para ver los demás.')
+        return context
 
 class DetalleAccidenteView(LoginRequiredMixin, DetailView):
     """
     Vista para ver los detalles de un accidente específico.
+    El accidente se lee con todas sus relaciones directas en una consulta; los
+    vehículos y fallecidos se cargan con dos consultas más solo si la plantilla
+    los usa, es decir, cuando el fragmento del detalle no está en caché.
+    La plantilla debe envolver el detalle en
+    {% cache cache_segundos detalle_accidente accidente.pk cache_version %}
+    e iterar `vehiculos` en lugar de `accidente.vehiculos.all`.
+    Los accidentes archivados se muestran desde el archivo, con `archivado`
+    en el contexto para ocultar las acciones de edición.
     """
     model = Accidente
     template_name = 'formularios/detalle_accidente.html'
     context_object_name = 'accidente'
+    
+    def get_queryset(self, modelo=Accidente):
+        return modelo.objects.select_related(
+            'agente_responsable', 'zat', 'barrio', 'centro_poblado_vereda', 'usuario',
+            *AccidenteHipotesis.CAMPOS_ACCIDENTE,
+        )
+    
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            return super().get_object(self.get_queryset(AccidenteArchivado))
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        accidente = self.object
+        
+        def vehiculos():
+            # La plantilla solo llama a esta función al renderizar el fragmento
+            modelo_vehiculo = accidente.vehiculos.model
+            modelo_fallecido = modelo_vehiculo._meta.get_field('ocupantes_fallecidos').related_model
+            prefetch_related_objects([accidente], Prefetch(
+                'vehiculos',
+                queryset=modelo_vehiculo.objects.prefetch_related(
+                    Prefetch('ocupantes_fallecidos', queryset=modelo_fallecido.objects.order_by('id'))
+                ),
+            ))
+            return accidente.vehiculos.all()
+        
+        context['vehiculos'] = vehiculos
+        context['archivado'] = isinstance(accidente, AccidenteArchivado)
+        context['cache_version'] = f'{detalle.version_detalle(accidente.pk)}-{catalogos.version_actual()}'
+        context['cache_segundos'] = detalle.SEGUNDOS_CACHE
+        return context
 
 # Vistas para crear, editar y eliminar accidentes
 @login_required
@@ -69,51 +157,29 @@ def crear_accidente(request):
     """
     if request.method == 'POST':
         form = AccidenteForm(request.POST, request.FILES)
-        if form.is_valid():
-            accidente = form.save(commit=False)
-            accidente.usuario = request.user
-            accidente.save()
-            
-            # Procesar formsets de vehículos
-            vehiculo_formset = VehiculoFormSet(request.POST, instance=accidente)
-            if vehiculo_formset.is_valid():
-                vehiculos = vehiculo_formset.save()
-                
-                # Procesar datos de fallecidos para cada vehículo
-                for vehiculo in vehiculos:
-                    num_fallecidos = vehiculo.numero_fallecidos
-                    if num_fallecidos > 0:
-                        # Extraer datos de fallecidos del POST
-                        for i in range(1, num_fallecidos + 1):
-                            nombre_key = f"fallecidos[{vehiculo.id}][{i}][nombre_apellidos]"
-                            direccion_key = f"fallecidos[{vehiculo.id}][{i}][direccion]"
-                            
-                            if nombre_key in request.POST and direccion_key in request.POST:
-                                nombre = request.POST.get(nombre_key)
-                                direccion = request.POST.get(direccion_key)
-                                
-                                if nombre and direccion:
-                                    Fallecido.objects.create(
-                                        vehiculo=vehiculo,
-                                        nombre_apellidos=nombre,
-                                        direccion=direccion
-                                    )
-                
-                messages.success(request, '¡Accidente registrado exitosamente!')
-                return redirect('lista_accidentes')
-            else:
-                messages.error(request, 'Error en los datos de vehículos involucrados.')
+        vehiculo_formset = VehiculoFormSet(request.POST, instance=form.instance)
+        
+        # Validar todo antes de escribir para no dejar accidentes sin vehículos
+        form_valido = form.is_valid()
+        vehiculos_validos = vehiculo_formset.is_valid()
+        if form_valido and vehiculos_validos:
+            registrar_accidente(form, vehiculo_formset, request.POST, request.user)
+            messages.success(request, '¡Accidente registrado exitosamente!')
+            return redirect('lista_accidentes')
+        elif form_valido:
+            messages.error(request, 'Error en los datos de vehículos involucrados.')
         else:
             messages.error(request, 'Error en el formulario. Por favor revise los datos ingresados.')
     else:
         form = AccidenteForm()
         vehiculo_formset = VehiculoFormSet()
     
-    # Obtener datos para los selectores
-    agentes = Agente.objects.all()
-    zats = ZAT.objects.all()
-    barrios = Barrio.objects.all()
-    centro_poblados_veredas = CentroPobladoVereda.objects.all()
+    # Obtener datos para los selectores desde la caché de catálogos
+    catalogos.aplicar_a_formulario(form)
+    agentes = catalogos.obtener('agentes')
+    zats = catalogos.obtener('zats')
+    barrios = catalogos.obtener('barrios')
+    centro_poblados_veredas = catalogos.obtener('centros_poblados')
     
     context = {
         'form': form,
@@ -122,6 +188,7 @@ def crear_accidente(request):
         'zats': zats,
         'barrios': barrios,
         'centro_poblados_veredas': centro_poblados_veredas,
+        'catalogo_version': catalogos.version_actual(),
         'via_choices': Accidente.VIA_CHOICES,
         'complemento2_choices': Accidente.COMPLEMENTO_2_CHOICES,
         'area_choices': Accidente.AREA_CHOICES,
@@ -139,6 +206,7 @@ def crear_accidente(request):
         'embriaguez_choices': VehiculoInvolucrado.BOOLEAN_CHOICES,
         'grado_embriaguez_choices': VehiculoInvolucrado.INTOXICATION_LEVEL_CHOICES,
         'fallece_despues_choices': VehiculoInvolucrado.BOOLEAN_CHOICES,
+        'valores_opciones': VALORES_OPCIONES_FORMULARIO,
     }
     
     return render(request, 'formularios/crear_accidente.html', context)
@@ -151,58 +219,37 @@ def editar_accidente(request, pk):
     accidente = get_object_or_404(Accidente, pk=pk)
     
     # Verificar permisos según el rol
-    if request.user.rol == 'USUARIO' and request.user != accidente.usuario:
+    if request.user.rol == 'USUARIO' and request.user.pk != accidente.usuario_id:
         messages.error(request, 'No tiene permisos para editar este accidente.')
         return redirect('lista_accidentes')
     
+    # Vehículos y fallecidos existentes, cargados en dos consultas
+    vehiculos = vehiculos_para_edicion(accidente)
+    
     if request.method == 'POST':
         form = AccidenteForm(request.POST, request.FILES, instance=accidente)
-        if form.is_valid():
-            accidente = form.save()
-            
-            # Procesar formsets de vehículos
-            vehiculo_formset = VehiculoFormSet(request.POST, instance=accidente)
-            if vehiculo_formset.is_valid():
-                vehiculos = vehiculo_formset.save()
-                
-                # Procesar datos de fallecidos para cada vehículo
-                for vehiculo in vehiculos:
-                    # Limpiar fallecidos existentes
-                    vehiculo.fallecidos.all().delete()
-                    
-                    num_fallecidos = vehiculo.numero_fallecidos
-                    if num_fallecidos > 0:
-                        # Extraer datos de fallecidos del POST
-                        for i in range(1, num_fallecidos + 1):
-                            nombre_key = f"fallecidos[{vehiculo.id}][{i}][nombre_apellidos]"
-                            direccion_key = f"fallecidos[{vehiculo.id}][{i}][direccion]"
-                            
-                            if nombre_key in request.POST and direccion_key in request.POST:
-                                nombre = request.POST.get(nombre_key)
-                                direccion = request.POST.get(direccion_key)
-                                
-                                if nombre and direccion:
-                                    Fallecido.objects.create(
-                                        vehiculo=vehiculo,
-                                        nombre_apellidos=nombre,
-                                        direccion=direccion
-                                    )
-                
-                messages.success(request, '¡Accidente actualizado exitosamente!')
-                return redirect('detalle_accidente', pk=accidente.pk)
-            else:
-                messages.error(request, 'Error en los datos de vehículos involucrados.')
+        vehiculo_formset = VehiculoFormSet(request.POST, instance=accidente, queryset=vehiculos)
+        
+        form_valido = form.is_valid()
+        vehiculos_validos = vehiculo_formset.is_valid()
+        if form_valido and vehiculos_validos:
+            accidente = actualizar_accidente(form, vehiculo_formset, request.POST)
+            messages.success(request, '¡Accidente actualizado exitosamente!')
+            return redirect('detalle_accidente', pk=accidente.pk)
+        elif form_valido:
+            messages.error(request, 'Error en los datos de vehículos involucrados.')
         else:
             messages.error(request, 'Error en el formulario. Por favor revise los datos ingresados.')
     else:
         form = AccidenteForm(instance=accidente)
-        vehiculo_formset = VehiculoFormSet(instance=accidente)
+        vehiculo_formset = VehiculoFormSet(instance=accidente, queryset=vehiculos)
     
-    # Obtener datos para los selectores
-    agentes = Agente.objects.all()
-    zats = ZAT.objects.all()
-    barrios = Barrio.objects.all()
-    centro_poblados_veredas = CentroPobladoVereda.objects.all()
+    # Obtener datos para los selectores desde la caché de catálogos
+    catalogos.aplicar_a_formulario(form)
+    agentes = catalogos.obtener('agentes')
+    zats = catalogos.obtener('zats')
+    barrios = catalogos.obtener('barrios')
+    centro_poblados_veredas = catalogos.obtener('centros_poblados')
     
     context = {
         'form': form,
@@ -212,6 +259,7 @@ def editar_accidente(request, pk):
         'zats': zats,
         'barrios': barrios,
         'centro_poblados_veredas': centro_poblados_veredas,
+        'catalogo_version': catalogos.version_actual(),
         'via_choices': Accidente.VIA_CHOICES,
         'complemento2_choices': Accidente.COMPLEMENTO_2_CHOICES,
         'area_choices': Accidente.AREA_CHOICES,
@@ -229,10 +277,71 @@ def editar_accidente(request, pk):
         'embriaguez_choices': VehiculoInvolucrado.BOOLEAN_CHOICES,
         'grado_embriaguez_choices': VehiculoInvolucrado.INTOXICATION_LEVEL_CHOICES,
         'fallece_despues_choices': VehiculoInvolucrado.BOOLEAN_CHOICES,
+        'valores_opciones': VALORES_OPCIONES_FORMULARIO,
     }
     
     return render(request, 'formularios/editar_accidente.html', context)
 
+def _etag_catalogo(request):
+    return catalogos.catalogo_formulario()[2]
+
+@login_required
+@require_GET
+@etag(_etag_catalogo)
+def catalogo_formulario_api(request):
+    """
+    API que retorna en una sola respuesta el catálogo del formulario de
+    accidentes: ZAT con sus barrios, centros poblados e hipótesis.
+    La URL incluye la versión del catálogo (?v=), por lo que la respuesta se
+    puede guardar en caché indefinidamente; sin versión se revalida con ETag.
+    """
+    version, contenido, _ = catalogos.catalogo_formulario()
+    return _respuesta_catalogo(request, version, contenido)
+
+@login_required
+@require_GET
+async def catalogo_formulario_async_api(request):
+    """
+    Versión asíncrona de catalogo_formulario_api para ASGI. Con el catálogo
+    ya serializado en memoria responde sin ocupar un hilo; la validación con
+    ETag se hace aquí porque el decorador etag llamaría al ORM síncrono.
+    """
+    version, contenido, etag_catalogo = await catalogos.acatalogo_formulario()
+    etag_catalogo = quote_etag(etag_catalogo)
+    response = get_conditional_response(request, etag=etag_catalogo)
+    if response is None:
+        response = _respuesta_catalogo(request, version, contenido)
+    response['ETag'] = etag_catalogo
+    return response
+
+def _respuesta_catalogo(request, version, contenido):
+    """Respuesta JSON del catálogo con la política de caché según la versión pedida."""
+    response = HttpResponse(contenido, content_type='application/json; charset=utf-8')
+    if request.GET.get('v') == str(version):
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _barrios_de_zat(zat_id):
+    return Barrio.objects.filter(zat_id=zat_id).order_by('nombre').values('id', 'nombre', 'zat_id')
+
+@login_required
+@require_GET
+def barrios_por_zat_api(request, zat_id):
+    """
+    API que retorna los barrios de una ZAT como lista de {id, nombre, zat_id}.
+    """
+    return JsonResponse(list(_barrios_de_zat(zat_id)), safe=False)
+
+@login_required
+@require_GET
+async def barrios_por_zat_async_api(request, zat_id):
+    """
+    Versión asíncrona de barrios_por_zat_api para ASGI, con el ORM asíncrono.
+    """
+    return JsonResponse([barrio async for barrio in _barrios_de_zat(zat_id)], safe=False)
+
 class EliminarAccidenteView(LoginRequiredMixin, SupervisorRequiredMixin, DeleteView):
     """
     Vista para eliminar un accidente.
@@ -249,10 +358,12 @@ class EliminarAccidenteView(LoginRequiredMixin, SupervisorRequiredMixin, DeleteV
 
 # Vistas para reportes
 @login_required
+@lectura_replica
 def reportes_view(request):
     """
     Vista para generar reportes de accidentes.
     Solo accesible para supervisores y administradores.
+    Los accidentes del reporte se leen de la réplica si está configurada.
     """
     if request.user.rol not in ['ADMINISTRADOR', 'SUPERVISOR']:
         messages.error(request, 'No tiene permisos para acceder a esta sección.')
@@ -261,100 +372,20 @@ def reportes_view(request):
     if request.method == 'POST':
         form = ReporteForm(request.POST)
         if form.is_valid():
-            # Obtener filtros del formulario
-            fecha_desde = form.cleaned_data.get('fecha_desde')
-            fecha_hasta = form.cleaned_data.get('fecha_hasta')
-            ano = form.cleaned_data.get('ano')
-            mes = form.cleaned_data.get('mes')
-            agente = form.cleaned_data.get('agente')
-            area = form.cleaned_data.get('area')
-            
-            # Construir filtros para la consulta
-            filtros = Q()
-            
-            if fecha_desde and fecha_hasta:
-                filtros &= Q(fecha_accidente__gte=fecha_desde, fecha_accidente__lte=fecha_hasta)
-            
-            if ano:
-                filtros &= Q(fecha_accidente__year=ano)
-            
-            if mes:
-                filtros &= Q(fecha_accidente__month=mes)
-            
-            if agente:
-                filtros &= Q(agente_responsable=agente)
+            # Obtener accidentes filtrados, con los archivados si el rango llega hasta ellos
+            accidentes = consultas_reporte(form.cleaned_data)
+            total = contar_accidentes(accidentes)
             
-            if area:
-                filtros &= Q(area=area)
-            
-            # Obtener accidentes filtrados
-            accidentes = Accidente.objects.filter(filtros).select_related(
-                'agente_responsable', 'zat', 'barrio', 'centro_poblado_vereda'
-            ).prefetch_related('vehiculos', 'vehiculos__fallecidos')
-            
-            # Preparar datos para el archivo Excel
-            data = []
-            for accidente in accidentes:
-                vehiculos = accidente.vehiculos.all()
-                
-                # Datos básicos del accidente
-                accidente_data = {
-                    'Número IPAT': accidente.numero_ipat,
-                    'Fecha Accidente': accidente.fecha_accidente,
-                    'Hora Accidente': accidente.hora_accidente,
-                    'Agente Responsable': accidente.agente_responsable.nombre,
-                    'Área': accidente.area,
-                    'Ubicación': accidente.get_ubicacion(),
-                    'Dirección': accidente.get_direccion_completa(),
-                    'Clase Accidente': accidente.clase_accidente,
-                    'Tipo Vía': accidente.tipo_via,
-                    'Con Heridos': 'Sí' if accidente.con_heridos else 'No',
-                    'Con Muertos': 'Sí' if accidente.con_muertos else 'No',
-                    'Con Daños Materiales': 'Sí' if accidente.con_danos_materiales else 'No',
-                    'Total Vehículos': accidente.total_vehiculos_involucrados,
-                    'Fecha Registro': accidente.fecha_registro,
-                    'Registrado Por': accidente.usuario.get_full_name() or accidente.usuario.username,
-                }
-                
-                # Datos de vehículos
-                for i, vehiculo in enumerate(vehiculos, 1):
-                    accidente_data[f'Vehículo {i} - Tipo'] = vehiculo.clase_vehiculo
-                    accidente_data[f'Vehículo {i} - Servicio'] = vehiculo.tipo_servicio
-                    accidente_data[f'Vehículo {i} - Heridos'] = vehiculo.numero_heridos
-                    accidente_data[f'Vehículo {i} - Fallecidos'] = vehiculo.numero_fallecidos
-                    accidente_data[f'Vehículo {i} - Embriaguez'] = vehiculo.embriaguez_conductor
-                
-                data.append(accidente_data)
-            
-            # Crear DataFrame con los datos
-            if data:
-                df = pd.DataFrame(data)
-                
-                # Crear archivo Excel en memoria
-                output = io.BytesIO()
-                writer = pd.ExcelWriter(output, engine='openpyxl')
-                df.to_excel(writer, index=False, sheet_name='Accidentes')
-                
-                # Ajustar anchos de columna
-                worksheet = writer.sheets['Accidentes']
-                for i, col in enumerate(df.columns):
-                    max_length = max(df[col].astype(str).apply(len).max(), len(col)) + 2
-                    worksheet.column_dimensions[chr(65 + i)].width = max_length
-                
-                writer.close()
-                output.seek(0)
-                
-                # Preparar respuesta HTTP con el archivo Excel
-                response = HttpResponse(
-                    output.read(),
-                    content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                )
-                
-                # Nombre del archivo
-                filename = f"reporte_accidentes_{timezone.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                
-                return response
+            if total > MAX_FILAS_SINCRONO:
+                # Los reportes grandes se generan en segundo plano
+                trabajo = encolar_reporte(form.cleaned_data, request.user)
+                if trabajo.estado == 'TERMINADO':
+                    return redirect('descargar_reporte', pk=trabajo.pk)
+                messages.info(request, f'El reporte tiene {total} accidentes y se está generando en segundo plano.')
+                return render(request, 'formularios/reportes.html', {'form': form, 'trabajo': trabajo})
+            elif total:
+                # Enviar el archivo Excel por fragmentos, leyendo los accidentes por bloques
+                return respuesta_excel_streaming(accidentes)
             else:
                 messages.warning(request, 'No se encontraron accidentes con los filtros seleccionados.')
     else:
@@ -363,19 +394,114 @@ def reportes_view(request):
     return render(request, 'formularios/reportes.html', {'form': form})
 
 @login_required
+def estado_reporte_view(request, pk):
+    """
+    Vista que retorna en JSON el estado y el progreso de un trabajo de reporte.
+    """
+    if request.user.rol not in ['ADMINISTRADOR', 'SUPERVISOR']:
+        return JsonResponse({'error': 'No tiene permisos para acceder a esta sección.'}, status=403)
+    
+    trabajo = get_object_or_404(TrabajoReporte, pk=pk)
+    data = {
+        'id': trabajo.pk,
+        'estado': trabajo.estado,
+        'progreso': trabajo.progreso,
+        'total_filas': trabajo.total_filas,
+        'url_descarga': None,
+    }
+    if trabajo.estado == 'TERMINADO':
+        data['url_descarga'] = reverse('descargar_reporte', kwargs={'pk': trabajo.pk})
+    elif trabajo.estado == 'ERROR':
+        data['error'] = trabajo.error
+    return JsonResponse(data)
+
+@login_required
+def descargar_reporte_view(request, pk):
+    """
+    Vista para descargar el archivo de un trabajo de reporte terminado.
+    """
+    if request.user.rol not in ['ADMINISTRADOR', 'SUPERVISOR']:
+        messages.error(request, 'No tiene permisos para acceder a esta sección.')
+        return redirect('dashboard')
+    
+    trabajo = get_object_or_404(TrabajoReporte, pk=pk)
+    if trabajo.estado != 'TERMINADO' or not trabajo.archivo:
+        messages.warning(request, 'El reporte aún no está disponible. Intente de nuevo en unos momentos.')
+        return redirect('reportes')
+    
+    return FileResponse(
+        trabajo.archivo.open('rb'),
+        as_attachment=True,
+        filename=nombre_archivo_reporte(),
+        content_type=CONTENT_TYPE_EXCEL,
+    )
+
+@login_required
+def reporte_sla_api(request):
+    """
+    API con el cumplimiento de entrega de informes por agente y mes:
+    total de informes, entregados tarde, retraso promedio y percentil 95.
+    Acepta los parámetros opcionales fecha_desde y fecha_hasta (AAAA-MM-DD).
+    """
+    if request.user.rol not in ['ADMINISTRADOR', 'SUPERVISOR']:
+        return JsonResponse({'error': 'No tiene permisos para acceder a esta sección.'}, status=403)
+    
+    accidentes = Accidente.objects.all()
+    try:
+        if request.GET.get('fecha_desde'):
+            accidentes = accidentes.filter(fecha_accidente__gte=date.fromisoformat(request.GET['fecha_desde']))
+        if request.GET.get('fecha_hasta'):
+            accidentes = accidentes.filter(fecha_accidente__lte=date.fromisoformat(request.GET['fecha_hasta']))
+    except ValueError:
+        return JsonResponse({'error': 'Las fechas deben tener el formato AAAA-MM-DD.'}, status=400)
+    
+    reporte = accidentes.reporte_sla_agentes()
+    for fila in reporte:
+        fila['mes'] = fila['mes'].strftime('%Y-%m')
+        fila['retraso_promedio'] = round(fila['retraso_promedio'], 2)
+    return JsonResponse({'agentes': reporte})
+
+@require_GET
+def metricas_view(request):
+    """
+    Publica las métricas de las peticiones en el formato de texto de
+    Prometheus. Solo responde al personal autenticado o a las direcciones de
+    METRICAS_IPS_PERMITIDAS (por defecto, el propio servidor).
+    """
+    permitidas = getattr(settings, 'METRICAS_IPS_PERMITIDAS', ('127.0.0.1', '::1'))
+    if not request.user.is_staff and request.META.get('REMOTE_ADDR') not in permitidas:
+        return HttpResponse(status=403)
+    return HttpResponse(metricas.texto_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _agregados_dashboard():
+    """Totales del resumen diario que muestra el dashboard: histórico y mes actual."""
+    inicio_mes = timezone.localdate().replace(day=1)
+    fin_mes = (inicio_mes + timezone.timedelta(days=32)).replace(day=1)
+    return {
+        'total': Sum('total_accidentes'),
+        'mes': Sum('total_accidentes', filter=Q(fecha__gte=inicio_mes, fecha__lt=fin_mes)),
+    }
+
+def _accidentes_recientes():
+    return Accidente.objects.order_by('-fecha_accidente', '-hora_accidente')[:5]
+
+def _contexto_dashboard(totales, total_usuarios, accidentes_recientes):
+    return {
+        'total_accidentes': totales['total'] or 0,
+        'accidentes_mes': totales['mes'] or 0,
+        'total_usuarios': total_usuarios,
+        'accidentes_recientes': accidentes_recientes,
+    }
+
+@login_required
+@lectura_replica
 def dashboard_view(request):
     """
     Vista para el dashboard que une las aplicaciones.
+    Las estadísticas se leen de la réplica si está configurada.
     """
-    # Estadísticas para el dashboard
-    total_accidentes = Accidente.objects.count()
-    
-    # Accidentes del mes actual
-    now = timezone.now()
-    accidentes_mes = Accidente.objects.filter(
-        fecha_accidente__year=now.year,
-        fecha_accidente__month=now.month
-    ).count()
+    # Estadísticas para el dashboard, leídas del resumen diario
+    totales = ResumenDiarioAccidentes.objects.aggregate(**_agregados_dashboard())
     
     # Total de usuarios (solo para administradores)
     total_usuarios = 0
@@ -383,14 +509,30 @@ def dashboard_view(request):
         from usuarios.models import Usuario
         total_usuarios = Usuario.objects.count()
     
-    # Accidentes recientes
-    accidentes_recientes = Accidente.objects.order_by('-fecha_accidente', '-hora_accidente')[:5]
+    context = _contexto_dashboard(totales, total_usuarios, _accidentes_recientes())
+    return render(request, 'dashboard.html', context)
+
+@login_required
+@lectura_replica
+async def dashboard_async_view(request):
+    """
+    Versión asíncrona del dashboard para ASGI.
+    Las consultas usan el ORM asíncrono y, mientras esperan a la base de
+    datos, el proceso atiende otras peticiones. Se ejecutan una tras otra:
+    el ORM asíncrono las pasa por el mismo hilo con la conexión de la
+    petición, así que lanzarlas con gather no las haría simultáneas.
+    La plantilla se renderiza en el hilo síncrono porque el contexto de la
+    plantilla carga la sesión y el usuario con el ORM síncrono.
+    """
+    usuario = await request.auser()
+    totales = await ResumenDiarioAccidentes.objects.aaggregate(**_agregados_dashboard())
     
-    context = {
-        'total_accidentes': total_accidentes,
-        'accidentes_mes': accidentes_mes,
-        'total_usuarios': total_usuarios,
-        'accidentes_recientes': accidentes_recientes,
-    }
+    # Total de usuarios (solo para administradores)
+    total_usuarios = 0
+    if usuario.rol == 'ADMINISTRADOR':
+        from usuarios.models import Usuario
+        total_usuarios = await Usuario.objects.acount()
     
-    return render(request, 'dashboard.html', context)
\ No newline at end of file
+    accidentes_recientes = [accidente async for accidente in _accidentes_recientes()]
+    context = _contexto_dashboard(totales, total_usuarios, accidentes_recientes)
+    return await sync_to_async(render)(request, 'dashboard.html', context)